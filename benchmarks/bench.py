@@ -0,0 +1,307 @@
+# benchmarks/bench.py
+"""Benchmarks des chemins critiques : insertion, extraction, ordre des pixels,
+préparation du payload, features et prédiction du détecteur.
+
+Les covers (1 à 50 MP) et secrets (1 Ko à 100 Mo) sont synthétiques et
+déterministes, générés une fois dans un dossier de cache. Chaque cas tourne
+dans un processus neuf : le pic de mémoire (RSS) mesuré est celui du cas seul.
+
+    python benchmarks/bench.py --preset standard --output bench.json
+    python benchmarks/bench.py --preset standard --compare bench.json --tolerance 0.25
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+KB, MB = 1024, 1024 * 1024
+PASSWORD = "bench-password"
+
+# Tailles des covers (mégapixels) et des secrets (octets) par preset
+PRESETS = {
+    "smoke": {"covers": [0.05], "secrets": [1 * KB]},
+    "quick": {"covers": [1], "secrets": [1 * KB, 100 * KB, 1 * MB]},
+    "standard": {"covers": [1, 12], "secrets": [1 * KB, 1 * MB, 10 * MB]},
+    "full": {"covers": [1, 12, 50], "secrets": [1 * KB, 1 * MB, 10 * MB, 100 * MB]},
+}
+
+# ---------- Données synthétiques ----------
+def _dimensions(megapixels):
+    """Format 4:3 : (largeur, hauteur)"""
+    h = max(8, int(round((megapixels * 1e6 * 3 / 4) ** 0.5)))
+    return int(round(h * 4 / 3)), h
+
+def _size_label(n):
+    if n >= MB:
+        return f"{n // MB}MB"
+    return f"{n // KB}KB" if n >= KB else f"{n}B"
+
+def make_cover(megapixels, cache_dir=CACHE_DIR):
+    """Cover PNG texturée (bruit basse fréquence + grain), identique d'une exécution à l'autre"""
+    from PIL import Image
+    w, h = _dimensions(megapixels)
+    path = os.path.join(cache_dir, f"cover_{w}x{h}.png")
+    if not os.path.exists(path):
+        rng = np.random.default_rng(w * h)
+        coarse = Image.fromarray(rng.integers(0, 256, (max(2, h // 16), max(2, w // 16), 3), dtype=np.uint8))
+        base = np.asarray(coarse.resize((w, h), Image.BILINEAR), dtype=np.int16)
+        for y in range(0, h, 1024):  # grain ajouté par bandes : mémoire bornée
+            base[y:y + 1024] += rng.integers(-6, 7, base[y:y + 1024].shape, dtype=np.int16)
+        Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).save(path)
+    return path
+
+def make_secret(size, cache_dir=CACHE_DIR):
+    """Secret aléatoire (incompressible : cas le plus coûteux pour la capacité)"""
+    path = os.path.join(cache_dir, f"secret_{_size_label(size)}.bin")
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        rng = np.random.default_rng(size)
+        with open(path, "wb") as f:
+            for offset in range(0, size, 16 * MB):
+                f.write(rng.integers(0, 256, min(16 * MB, size - offset), dtype=np.uint8).tobytes())
+    return path
+
+def _bits_for(cover_mp, secret_size):
+    """bits par canal nécessaires (1 ou 2), None si le secret ne tient pas"""
+    from utils import HEADER_SIZE
+    w, h = _dimensions(cover_mp)
+    for bpc in (1, 2):
+        # compression 'auto' d'un secret aléatoire : stocké brut, extensions comprises
+        if HEADER_SIZE + secret_size + 64 <= w * h * 3 * bpc // 8:
+            return bpc
+    return None
+
+def make_stego(cover_mp, secret_size, cache_dir=CACHE_DIR):
+    from steg import embed_file_into_image
+    w, h = _dimensions(cover_mp)
+    path = os.path.join(cache_dir, f"stego_{w}x{h}_{_size_label(secret_size)}.png")
+    if not os.path.exists(path):
+        embed_file_into_image(make_cover(cover_mp, cache_dir), path, make_secret(secret_size, cache_dir),
+                              password=PASSWORD, bits_per_channel=_bits_for(cover_mp, secret_size))
+    return path
+
+# ---------- Cas ----------
+def build_cases(preset, cache_dir=CACHE_DIR):
+    """Liste des cas d'un preset ; les entrées sont générées (et mises en cache) au passage"""
+    os.makedirs(cache_dir, exist_ok=True)
+    spec = PRESETS[preset]
+    cases = []
+    for mp in spec["covers"]:
+        w, h = _dimensions(mp)
+        cover = make_cover(mp, cache_dir)
+        label = f"{mp}MP"
+        pixels = w * h
+        cases.append({"name": f"order_plain_{label}", "kind": "order", "width": w, "height": h,
+                      "adaptive": False, "units": pixels, "unit": "MP/s"})
+        cases.append({"name": f"order_adaptive_{label}", "kind": "order", "width": w, "height": h,
+                      "adaptive": True, "cover": cover, "units": pixels, "unit": "MP/s"})
+        cases.append({"name": f"features_{label}", "kind": "features", "cover": cover,
+                      "units": pixels, "unit": "MP/s"})
+        cases.append({"name": f"predict_{label}", "kind": "predict", "cover": cover,
+                      "units": pixels, "unit": "MP/s"})
+        for size in spec["secrets"]:
+            bpc = _bits_for(mp, size)
+            if bpc is None:
+                continue
+            secret = make_secret(size, cache_dir)
+            name = f"{label}_{_size_label(size)}_{bpc}bpc"
+            cases.append({"name": f"embed_{name}", "kind": "embed", "cover": cover, "secret": secret,
+                          "bits": bpc, "units": size, "unit": "MB/s"})
+            cases.append({"name": f"extract_{name}", "kind": "extract",
+                          "stego": make_stego(mp, size, cache_dir), "bits": bpc,
+                          "units": size, "unit": "MB/s"})
+    for size in spec["secrets"]:
+        secret = make_secret(size, cache_dir)
+        for password in (None, PASSWORD):
+            suffix = "password" if password else "plain"
+            cases.append({"name": f"payload_{_size_label(size)}_{suffix}", "kind": "payload",
+                          "secret": secret, "password": password, "units": size, "unit": "MB/s"})
+    return cases
+
+def _operation(case, workdir):
+    """Prépare un cas (non chronométré) et retourne l'opération à chronométrer"""
+    if case["kind"] == "order":
+        from steg import get_pixel_order, ORDER_KEYED
+        from PIL import Image
+        img = Image.open(case["cover"]).convert("RGB") if case["adaptive"] else None
+        return lambda: get_pixel_order(case["width"], case["height"], PASSWORD, case["adaptive"], img,
+                                       order_version=ORDER_KEYED)
+    if case["kind"] == "payload":
+        from utils import prepare_payload_bytes
+        return lambda: prepare_payload_bytes(case["secret"], password=case["password"])
+    if case["kind"] == "embed":
+        from steg import embed_file_into_image
+        out = os.path.join(workdir, "embed.png")
+        return lambda: embed_file_into_image(case["cover"], out, case["secret"], password=PASSWORD,
+                                             bits_per_channel=case["bits"])
+    if case["kind"] == "extract":
+        from steg import extract_file_from_image
+        out = os.path.join(workdir, "extracted.bin")
+        return lambda: extract_file_from_image(case["stego"], out, password=PASSWORD,
+                                               bits_per_channel=case["bits"])
+    if case["kind"] == "features":
+        import steg_detect
+        return lambda: steg_detect.extract_features(case["cover"])
+    if case["kind"] == "predict":
+        import steg_detect
+
+        def predict():
+            with contextlib.redirect_stdout(io.StringIO()):
+                steg_detect.predict_image(case["cover"])
+        return predict
+    raise ValueError(f"Cas inconnu: {case['kind']}")
+
+def _peak_rss_mb():
+    # VmHWM repart de zéro à l'exec ; ru_maxrss (Linux) hérite du pic du processus parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / KB, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (MB if sys.platform == "darwin" else KB), 1)
+
+def run_case(case, repeat, workdir):
+    """Exécute un cas dans le processus courant : temps (min, médiane), débit, pic RSS"""
+    from utils import clear_key_cache
+    op = _operation(case, workdir)
+    setup_rss = _peak_rss_mb()
+    times = []
+    for _ in range(repeat):
+        clear_key_cache()  # la dérivation de clé fait partie du coût mesuré
+        start = time.perf_counter()
+        op()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    scale = 1e6 if case["unit"] == "MP/s" else MB
+    return {"seconds": round(best, 6), "median": round(float(np.median(times)), 6),
+            "throughput": round(case["units"] / scale / best, 3) if best > 0 else None,
+            "unit": case["unit"], "setup_rss_mb": setup_rss, "peak_rss_mb": _peak_rss_mb()}
+
+def _run_isolated(case, repeat, workdir):
+    """Lance le cas dans un nouveau processus (RSS propre au cas)"""
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case),
+           "--repeat", str(repeat), "--workdir", workdir]
+    # Modèle du dépôt pour predict ; pas de cache de features
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "échec"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def run_suite(preset="quick", repeat=3, only=None, cache_dir=CACHE_DIR, isolate=True, log=sys.stderr):
+    """Exécute tous les cas du preset (filtrés par sous-chaîne only) ; retourne le rapport JSON"""
+    import tempfile
+    cases = [c for c in build_cases(preset, cache_dir) if not only or only in c["name"]]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for case in cases:
+            result = _run_isolated(case, repeat, workdir) if isolate else run_case(case, repeat, workdir)
+            results[case["name"]] = result
+            if log:
+                print(_format_result(case["name"], result), file=log, flush=True)
+    return {"meta": _metadata(preset, repeat), "results": results}
+
+def _metadata(preset, repeat):
+    import PIL
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT)
+    return {"preset": preset, "repeat": repeat,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit.stdout.strip() or None, "python": platform.python_version(),
+            "numpy": np.__version__, "pillow": PIL.__version__, "platform": platform.platform(),
+            "cpu_count": os.cpu_count()}
+
+def _format_result(name, result):
+    if "error" in result:
+        return f"{name:<40} ERREUR {result['error']}"
+    return (f"{name:<40} {result['seconds']:>10.4f} s {result['throughput'] or 0:>10.2f} {result['unit']:<5}"
+            f" {result['peak_rss_mb'] or 0:>8.1f} Mo")
+
+# ---------- Comparaison ----------
+def compare(current, baseline, tolerance=0.2):
+    """
+    Compare deux rapports. Un cas régresse si son temps (ou son pic RSS) dépasse
+    celui de la référence de plus de tolerance (0.2 = +20 %).
+    Retourne une liste de dicts : name, baseline, current, ratio, rss_ratio, status
+    """
+    rows = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None or "error" in cur or "error" in base:
+            rows.append({"name": name, "status": "missing" if cur is None else "error"})
+            continue
+        ratio = cur["seconds"] / base["seconds"] if base["seconds"] else None
+        rss_ratio = (cur["peak_rss_mb"] / base["peak_rss_mb"]
+                     if cur.get("peak_rss_mb") and base.get("peak_rss_mb") else None)
+        if (ratio and ratio > 1 + tolerance) or (rss_ratio and rss_ratio > 1 + tolerance):
+            status = "regression"
+        elif ratio and ratio < 1 / (1 + tolerance):
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append({"name": name, "baseline": base["seconds"], "current": cur["seconds"],
+                     "ratio": round(ratio, 3) if ratio else None,
+                     "rss_ratio": round(rss_ratio, 3) if rss_ratio else None, "status": status})
+    for name in current["results"]:
+        if name not in baseline["results"]:
+            rows.append({"name": name, "status": "new"})
+    return rows
+
+def print_comparison(rows, out=sys.stdout):
+    for row in rows:
+        if "ratio" not in row:
+            print(f"{row['name']:<40} {row['status']}", file=out)
+            continue
+        rss = f"{row['rss_ratio']:.2f}x" if row["rss_ratio"] else "-"
+        print(f"{row['name']:<40} {row['baseline']:>10.4f} s -> {row['current']:>10.4f} s "
+              f"({row['ratio']:.2f}x, RSS {rss}) {row['status']}", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de l'outil de stéganographie")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick",
+                        help="Tailles des covers et secrets (défaut: quick)")
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions par cas (le minimum est retenu)")
+    parser.add_argument("--only", help="Ne lancer que les cas dont le nom contient ce texte")
+    parser.add_argument("--output", help="Écrire le rapport JSON (nouvelle référence)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Comparer à un rapport JSON de référence")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Écart toléré avant régression (0.2 = 20%%)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Dossier des covers et secrets générés")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case), args.repeat, args.workdir)))
+        return 0
+
+    report = run_suite(args.preset, args.repeat, args.only, args.cache_dir)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        print_comparison(rows)
+        if any(row["status"] == "regression" for row in rows):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,28 @@
 # cli.py
 import argparse
-from steg import embed_file_into_image, extract_file_from_image, capacity_bytes_for_image
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from steg import (embed_file_into_image, extract_file_from_image,
+                  embed_file_into_images, extract_file_from_images, carrier_channels,
+                  BITS_PER_CHANNEL, CARRIERS)
+from utils import DEFAULT_KDF, SCRYPT_KDF, COMPRESSION_NAMES, COMP_GZIP, COMP_BZ2, COMP_NONE
+from cover_library import cover_capacity, estimate_payload_size
 from PIL import Image
 import os
 
+KDF_CHOICES = {'pbkdf2': DEFAULT_KDF, 'scrypt': SCRYPT_KDF}
+
+def compression_arg(name, level=None):
+    """'auto' ou (méthode, niveau) à partir des options --compression / --level."""
+    if name == 'auto':
+        return 'auto'
+    method = COMPRESSION_NAMES[name]
+    if level is None:
+        level = 0 if method == COMP_NONE else 9 if method in (COMP_GZIP, COMP_BZ2) else 6
+    return (method, level)
+
 def cmd_encode(args):
     if not os.path.exists(args.input):
         print("[ERREUR] Image d'entrée introuvable")
@@ -15,7 +34,10 @@ def cmd_encode(args):
                                  password=args.password,
                                  bits_per_channel=args.bits,
                                  adaptive=args.adaptive,
-                                 dry_run=False)
+                                 dry_run=False,
+                                 kdf=KDF_CHOICES[args.kdf],
+                                 compression=compression_arg(args.compression, args.level),
+                                 carrier=args.carrier)
     print("[OK] Encodage terminé:", info)
 
 def cmd_decode(args):
@@ -28,13 +50,190 @@ def cmd_decode(args):
                                    adaptive=args.adaptive)
     print("[OK] Extraction terminée:", info)
 
+def cmd_encode_multi(args):
+    missing = [p for p in args.input + [args.secret] if not os.path.exists(p)]
+    if missing:
+        print(f"[ERREUR] Fichier introuvable: {missing[0]}")
+        return 1
+    os.makedirs(args.out_dir, exist_ok=True)
+    outputs = [os.path.join(args.out_dir, os.path.splitext(os.path.basename(p))[0] + '.png') for p in args.input]
+    if len(set(outputs)) != len(outputs):
+        print("[ERREUR] Plusieurs covers donneraient la même image de sortie")
+        return 1
+    info = embed_file_into_images(args.input, outputs, args.secret,
+                                  password=args.password,
+                                  bits_per_channel=args.bits,
+                                  adaptive=args.adaptive,
+                                  kdf=KDF_CHOICES[args.kdf],
+                                  compression=compression_arg(args.compression, args.level),
+                                  workers=args.workers,
+                                  carrier=args.carrier)
+    print(f"[OK] {len(outputs)} fragments écrits dans {args.out_dir}:", info)
+    return 0
+
+def cmd_decode_multi(args):
+    missing = [p for p in args.input if not os.path.exists(p)]
+    if missing:
+        print(f"[ERREUR] Image introuvable: {missing[0]}")
+        return 1
+    info = extract_file_from_images(args.input, args.output, password=args.password, workers=args.workers)
+    print("[OK] Extraction terminée:", info)
+    return 0
+
 def cmd_dry(args):
-    img = Image.open(args.input).convert('RGB')
-    cap = capacity_bytes_for_image(img, args.bits)
-    s = os.path.getsize(args.secret) if args.secret else 0
-    print(f"Capacité image: {cap} bytes. Taille secret: {s} bytes. Bits per channel: {args.bits}")
+    with Image.open(args.input) as img:  # entête seulement, pixels non décodés
+        cap = cover_capacity(*img.size, args.bits, carrier_channels(img, args.carrier))
+    if not args.secret:
+        print(f"Capacité image: {cap} bytes. Bits per channel: {args.bits}")
+        return
+    est = estimate_payload_size(args.secret, args.password,
+                                compression_arg(args.compression, args.level), KDF_CHOICES[args.kdf])
+    verdict = "OK" if est['required'] <= cap else "capacité insuffisante"
+    print(f"Capacité image: {cap} bytes. Taille secret: {est['source']} bytes. "
+          f"Payload estimé: {est['required']} bytes{'' if est['exact'] else ' (extrapolé)'}. "
+          f"Bits per channel: {args.bits} — {verdict}")
+
+# ---------- Batch ----------
+
+IMAGE_EXTENSIONS = ('.png', '.bmp')
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'oui')
+    return bool(value)
+
+def load_manifest(path):
+    """Lit un manifeste CSV (avec entête) ou JSONL ; retourne une liste de dicts."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.json')):
+            return [json.loads(line) for line in f if line.strip()]
+        return [{k: v for k, v in row.items() if v not in (None, '')} for row in csv.DictReader(f)]
+
+def _item_options(item, args):
+    """Options d'un élément : colonnes du manifeste, sinon options de la ligne de commande.
+    bits / adaptive absents des deux restent None (détection par le préambule au décodage)."""
+    bits = item.get('bits', args.bits)
+    adaptive = item.get('adaptive', args.adaptive)
+    return {
+        'password': item.get('password', args.password),
+        'bits_per_channel': None if bits is None else int(bits),
+        'adaptive': None if adaptive is None else _as_bool(adaptive),
+    }
+
+def _encode_options(row, args, salt):
+    options = _item_options(row, args)
+    options['kdf'] = KDF_CHOICES[row.get('kdf', args.kdf)]
+    level = row.get('level', args.level)
+    options['compression'] = compression_arg(row.get('compression', args.compression),
+                                             None if level is None else int(level))
+    options['salt'] = salt
+    options['carrier'] = row.get('carrier', args.carrier)
+    return options
+
+def _batch_item(row, fields, build_options):
+    """Élément de lot : champs de la ligne et ses options ; une ligne invalide
+    (kdf inconnu, niveau non entier...) garde son erreur au lieu d'interrompre le lot."""
+    item = {k: row.get(k) for k in fields}
+    try:
+        item['options'] = build_options(row)
+    except (KeyError, ValueError, TypeError) as e:
+        item['invalid'] = f"Option invalide: {type(e).__name__}: {e}"
+    return item
+
+def _encode_item(item):
+    try:
+        info = embed_file_into_image(item['cover'], item['output'], item['secret'], **item['options'])
+        return {'status': 'ok', 'info': info}
+    except Exception as e:
+        return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+
+def _decode_item(item):
+    try:
+        info = extract_file_from_image(item['image'], item['output'], **item['options'])
+        return {'status': 'ok', 'info': info}
+    except Exception as e:
+        return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
 
-def main():
+def run_batch(func, items, workers):
+    """Exécute func sur chaque élément dans un pool de processus.
+
+    Une ligne JSON est écrite par élément dès qu'il se termine ; un échec
+    n'interrompt pas les autres. Retourne le nombre d'échecs.
+    """
+    failures = 0
+
+    def report(index, result):
+        nonlocal failures
+        item = items[index]
+        line = {'index': index, **{k: v for k, v in item.items() if k not in ('options', 'invalid')}, **result}
+        failures += result['status'] != 'ok'
+        print(json.dumps(line, default=str), flush=True)
+
+    valid = []
+    for i, item in enumerate(items):
+        if 'invalid' in item:
+            report(i, {'status': 'error', 'error': item['invalid']})
+        else:
+            valid.append(i)
+
+    if workers <= 1:
+        for i in valid:
+            report(i, func(items[i]))
+        return failures
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, items[i]): i for i in valid}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:  # processus mort (mémoire, signal...)
+                result = {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+            report(futures[future], result)
+    return failures
+
+def _list_files(directory, extensions=None):
+    names = sorted(os.listdir(directory))
+    return [os.path.join(directory, n) for n in names
+            if os.path.isfile(os.path.join(directory, n))
+            and (extensions is None or n.lower().endswith(extensions))]
+
+def cmd_encode_batch(args):
+    if args.manifest:
+        rows = load_manifest(args.manifest)
+    else:
+        # Mode dossier : secrets et covers triés associés un à un, sortie <secret>.png
+        secrets = _list_files(args.secrets)
+        covers = _list_files(args.covers, IMAGE_EXTENSIONS)
+        if len(covers) < len(secrets):
+            print(f"[ERREUR] {len(secrets)} secrets pour seulement {len(covers)} covers")
+            return 2
+        rows = [{'cover': c, 'secret': s,
+                 'output': os.path.join(args.out_dir, os.path.basename(s) + '.png')}
+                for s, c in zip(secrets, covers)]
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    # --shared-salt : un seul salt pour le lot, la clé n'est dérivée qu'une fois par
+    # mot de passe et par processus, mais les images de même mot de passe ont la même clé AES
+    salt = os.urandom(16) if args.shared_salt else None
+    items = [_batch_item(row, ('cover', 'secret', 'output'), lambda r: _encode_options(r, args, salt))
+             for row in rows]
+    return 1 if run_batch(_encode_item, items, args.workers) else 0
+
+def cmd_decode_batch(args):
+    if args.manifest:
+        rows = load_manifest(args.manifest)
+    else:
+        # Mode dossier : <nom>.png est extrait en <nom> (inverse de encode-batch)
+        rows = []
+        for path in _list_files(args.dir, IMAGE_EXTENSIONS):
+            name = os.path.splitext(os.path.basename(path))[0]
+            rows.append({'image': path, 'output': os.path.join(args.out_dir, name)})
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    items = [_batch_item(row, ('image', 'output'), lambda r: _item_options(r, args)) for row in rows]
+    return 1 if run_batch(_decode_item, items, args.workers) else 0
+
+def main(argv=None):
     p = argparse.ArgumentParser(description="Stegano tool (LSB + permutation + gzip + checksum)")
     sub = p.add_subparsers(dest='cmd', required=True)
     enc = sub.add_parser('encode')
@@ -42,23 +241,97 @@ def main():
     enc.add_argument('-s','--secret', required=True, help='fichier secret')
     enc.add_argument('-o','--output', required=True, help='image stego sortie (PNG)')
     enc.add_argument('--password', default='', help='mot de passe/seed (optionnel)')
-    enc.add_argument('--bits', type=int, choices=[1,2], default=1, help='bits par canal')
+    enc.add_argument('--bits', type=int, choices=BITS_PER_CHANNEL, default=1, help='bits par canal')
     enc.add_argument('--adaptive', action='store_true', help='choisir pixels adaptatifs (texture)')
+    enc.add_argument('--carrier', choices=CARRIERS, default='auto',
+                     help="canaux porteurs (auto: alpha inclus si la cover en a un)")
+    enc.add_argument('--kdf', choices=sorted(KDF_CHOICES), default='pbkdf2', help='dérivation de clé du mot de passe')
+    enc.add_argument('--compression', choices=['auto'] + sorted(COMPRESSION_NAMES), default='auto',
+                     help='compression du secret (auto : brut si incompressible)')
+    enc.add_argument('--level', type=int, choices=range(0, 10), metavar='0-9', help='niveau de compression')
 
     dec = sub.add_parser('decode')
     dec.add_argument('-i','--input', required=True, help='image stego')
     dec.add_argument('-o','--output', required=True, help='fichier extrait')
     dec.add_argument('--password', default='', help='mot de passe/seed (optionnel)')
-    dec.add_argument('--bits', type=int, choices=[1,2], default=1, help='bits par canal')
-    dec.add_argument('--adaptive', action='store_true', help='utiliser adaptive (si encode a utilisé)')
+    dec.add_argument('--bits', type=int, choices=BITS_PER_CHANNEL, default=None,
+                     help='bits par canal (défaut: auto ; utilisé pour les images sans préambule)')
+    dec.add_argument('--adaptive', action='store_true', default=None,
+                     help='utiliser adaptive (défaut: auto ; utilisé pour les images sans préambule)')
 
     dry = sub.add_parser('dry-run')
     dry.add_argument('-i','--input', required=True)
     dry.add_argument('-s','--secret', required=False)
-    dry.add_argument('--bits', type=int, choices=[1,2], default=1)
+    dry.add_argument('--bits', type=int, choices=BITS_PER_CHANNEL, default=1)
+    dry.add_argument('--carrier', choices=CARRIERS, default='auto',
+                     help="canaux porteurs (auto: alpha inclus si la cover en a un)")
+    dry.add_argument('--password', default='', help='mot de passe (le chiffrement agrandit le payload)')
+    dry.add_argument('--kdf', choices=sorted(KDF_CHOICES), default='pbkdf2')
+    dry.add_argument('--compression', choices=['auto'] + sorted(COMPRESSION_NAMES), default='auto')
+    dry.add_argument('--level', type=int, choices=range(0, 10), metavar='0-9')
+
+    encb = sub.add_parser('encode-batch', help='encoder un lot (manifeste CSV/JSONL ou dossiers)')
+    src = encb.add_mutually_exclusive_group(required=True)
+    src.add_argument('--manifest', help='CSV/JSONL : cover, secret, output [, password, bits, adaptive, kdf, compression, level, carrier]')
+    src.add_argument('--secrets', help='dossier des fichiers secrets (avec --covers et --out-dir)')
+    encb.add_argument('--covers', help='dossier des images cover')
+    encb.add_argument('--out-dir', help='dossier des images stego')
+    encb.add_argument('--password', default='', help='mot de passe par défaut')
+    encb.add_argument('--bits', type=int, choices=BITS_PER_CHANNEL, default=1)
+    encb.add_argument('--adaptive', action='store_true')
+    encb.add_argument('--carrier', choices=CARRIERS, default='auto',
+                     help="canaux porteurs (auto: alpha inclus si la cover en a un)")
+    encb.add_argument('--kdf', choices=sorted(KDF_CHOICES), default='pbkdf2')
+    encb.add_argument('--compression', choices=['auto'] + sorted(COMPRESSION_NAMES), default='auto')
+    encb.add_argument('--level', type=int, choices=range(0, 10), metavar='0-9')
+    encb.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processus en parallèle')
+    encb.add_argument('--shared-salt', action='store_true',
+                      help='un seul salt pour tout le lot (KDF calculé une fois, même clé AES par mot de passe)')
+
+    decb = sub.add_parser('decode-batch', help='décoder un lot (manifeste CSV/JSONL ou dossier)')
+    src = decb.add_mutually_exclusive_group(required=True)
+    src.add_argument('--manifest', help='CSV/JSONL : image, output [, password, bits, adaptive]')
+    src.add_argument('--dir', help='dossier des images stego (avec --out-dir)')
+    decb.add_argument('--out-dir', help='dossier des fichiers extraits')
+    decb.add_argument('--password', default='', help='mot de passe par défaut')
+    decb.add_argument('--bits', type=int, choices=BITS_PER_CHANNEL, default=None, help='défaut: auto (préambule)')
+    decb.add_argument('--adaptive', action='store_true', default=None, help='défaut: auto (préambule)')
+    decb.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processus en parallèle')
+
+    encm = sub.add_parser('encode-multi', help='répartir un secret sur plusieurs images cover')
+    encm.add_argument('-i','--input', nargs='+', required=True, help='images cover (PNG/BMP)')
+    encm.add_argument('-s','--secret', required=True, help='fichier secret')
+    encm.add_argument('--out-dir', required=True, help='dossier des images stego (<cover>.png)')
+    encm.add_argument('--password', default='', help='mot de passe/seed (optionnel)')
+    encm.add_argument('--bits', type=int, choices=BITS_PER_CHANNEL, default=1, help='bits par canal')
+    encm.add_argument('--adaptive', action='store_true', help='choisir pixels adaptatifs (texture)')
+    encm.add_argument('--carrier', choices=CARRIERS, default='auto',
+                     help="canaux porteurs (auto: alpha inclus si la cover en a un)")
+    encm.add_argument('--kdf', choices=sorted(KDF_CHOICES), default='pbkdf2')
+    encm.add_argument('--compression', choices=['auto'] + sorted(COMPRESSION_NAMES), default='auto')
+    encm.add_argument('--level', type=int, choices=range(0, 10), metavar='0-9')
+    encm.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processus en parallèle')
+
+    decm = sub.add_parser('decode-multi', help='reconstituer un secret réparti (images dans un ordre quelconque)')
+    decm.add_argument('-i','--input', nargs='+', required=True, help='images stego du lot')
+    decm.add_argument('-o','--output', required=True, help='fichier extrait')
+    decm.add_argument('--password', default='', help='mot de passe/seed (optionnel)')
+    decm.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processus en parallèle')
 
-    args = p.parse_args()
-    if args.cmd == 'encode':
+    args = p.parse_args(argv)
+    if args.cmd == 'encode-batch':
+        if args.secrets and not (args.covers and args.out_dir):
+            p.error("--secrets nécessite --covers et --out-dir")
+        sys.exit(cmd_encode_batch(args))
+    elif args.cmd == 'decode-batch':
+        if args.dir and not args.out_dir:
+            p.error("--dir nécessite --out-dir")
+        sys.exit(cmd_decode_batch(args))
+    elif args.cmd == 'encode-multi':
+        sys.exit(cmd_encode_multi(args))
+    elif args.cmd == 'decode-multi':
+        sys.exit(cmd_decode_multi(args))
+    elif args.cmd == 'encode':
         cmd_encode(args)
     elif args.cmd == 'decode':
         cmd_decode(args)
@@ -0,0 +1,270 @@
+# cover_library.py
+"""Bibliothèque de covers indexée et choix de la plus petite cover qui convient.
+
+L'index SQLite garde pour chaque image : chemin, taille/mtime du fichier,
+dimensions, mode, canaux porteurs (4 avec l'alpha), capacité par bits par
+canal et un score de texture. Les
+dimensions et le mode sont lus dans l'entête du fichier (Image.open ne décode
+pas les pixels) ; seul le score de texture, optionnel, décode l'image, réduite.
+L'indexation est parallèle et incrémentale (fichiers inchangés ignorés).
+
+Le planificateur estime la taille réelle du payload (compression mesurée sur
+un échantillon, chiffrement, extensions, entête) sans
+traiter tout le secret, puis choisit par requête indexée la plus petite cover
+assez grande, ou le plus petit ensemble de covers pour embed_file_into_images.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import (PayloadStream, HEADER_SIZE, SAMPLE_SIZE, COMP_NONE, DEFAULT_KDF,
+                   pack_extensions, compress_chunks)
+
+LIBRARY_PATH = "covers.sqlite"
+IMAGE_EXTENSIONS = ('.png', '.bmp')
+BITS = (1, 2, 3, 4)     # bits par canal indexés
+SCHEMA_VERSION = 2      # PRAGMA user_version ; un index plus ancien est reconstruit
+TEXTURE_SIZE = 256      # côté maximal de la vignette du score de texture
+AES_OVERHEAD = 32       # salt + IV
+ESTIMATE_SEGMENTS = 16  # segments lus pour estimer la compression d'un grand fichier
+
+# ---------- Estimation du payload ----------
+def _sample(file_path, size, segments=ESTIMATE_SEGMENTS):
+    """Échantillon de segments de SAMPLE_SIZE octets répartis sur le fichier ; (octets, fichier entier ?)."""
+    with open(file_path, 'rb') as f:
+        if size <= segments * SAMPLE_SIZE:
+            return f.read(), True
+        sample = b''
+        for i in range(segments):
+            f.seek(i * (size - SAMPLE_SIZE) // (segments - 1))
+            sample += f.read(SAMPLE_SIZE)
+    return sample, False
+
+def estimate_payload_size(file_path, password=None, compression='auto', kdf=DEFAULT_KDF):
+    """
+    Estime les octets à insérer (entête compris) pour file_path, sans le lire en entier.
+
+    La méthode de compression est celle du mode choisi (choose_compression pour
+    'auto') ; le taux est mesuré sur ESTIMATE_SEGMENTS segments répartis dans le
+    fichier : exact si le fichier tient dans l'échantillon, extrapolé sinon.
+    Retourne {'source', 'data', 'required', 'exact', 'compression'}.
+    """
+    stream = PayloadStream(file_path, password, kdf=kdf, compression=compression)
+    method, level = stream.compression
+    source = os.path.getsize(file_path)
+    data, exact = source, True
+    if method != COMP_NONE:
+        sample, exact = _sample(file_path, source)
+        packed = sum(len(c) for c in compress_chunks([sample], level, method))
+        data = packed if exact else -(-source * packed // len(sample))
+    if stream.encrypted:
+        data = AES_OVERHEAD + (data // 16 + 1) * 16  # padding PKCS7
+    if stream.extensions:
+        data += len(pack_extensions(stream.extensions))
+    return {'source': source, 'data': data, 'required': HEADER_SIZE + data, 'exact': exact,
+            'compression': stream.compression}
+
+# ---------- Indexation ----------
+def image_info(path, texture=True):
+    """(largeur, hauteur, mode, canaux porteurs, score de texture ou None) ; la texture est la seule lecture des pixels."""
+    from PIL import Image
+    from steg import carrier_channels
+    with Image.open(path) as img:
+        width, height = img.size
+        mode = img.mode
+        channels = carrier_channels(img)
+        score = None
+        if texture:
+            score = texture_score(img)
+    return width, height, mode, channels, score
+
+def texture_score(img):
+    """Gradient absolu moyen (0-255) du niveau de gris, sur une vignette de TEXTURE_SIZE px au plus."""
+    import numpy as np
+    thumb = img.convert('L')
+    thumb.thumbnail((TEXTURE_SIZE, TEXTURE_SIZE))
+    g = np.asarray(thumb, dtype=np.int16)
+    if min(g.shape) < 2:
+        return 0.0
+    return float((np.abs(np.diff(g, axis=0)).mean() + np.abs(np.diff(g, axis=1)).mean()) / 2)
+
+def cover_capacity(width, height, bits_per_channel, channels=3):
+    """Octets insérables (entête compris) avec l'ordre par défaut, préambule déduit."""
+    from steg import payload_capacity
+    return payload_capacity((width, height), bits_per_channel, channels=channels)
+
+def _scan(path, texture):
+    try:
+        st = os.stat(path)
+        return (path, st.st_size, st.st_mtime_ns) + image_info(path, texture), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def list_covers(directory, extensions=IMAGE_EXTENSIONS):
+    """Images de directory (récursif), triées"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for f in sorted(files):
+            if f.lower().endswith(extensions):
+                paths.append(os.path.abspath(os.path.join(root, f)))
+    return paths
+
+class CoverLibrary:
+    """Index SQLite des covers ; les capacités sont dans une table indexée par (bits, capacité)."""
+
+    def __init__(self, path=LIBRARY_PATH):
+        self.db = sqlite3.connect(path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS covers")
+            self.db.execute("DROP TABLE IF EXISTS capacity")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.execute("CREATE TABLE IF NOT EXISTS covers (path TEXT PRIMARY KEY, size INTEGER, "
+                        "mtime_ns INTEGER, width INTEGER, height INTEGER, mode TEXT, channels INTEGER, "
+                        "texture REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS capacity (path TEXT, bits INTEGER, bytes INTEGER, "
+                        "PRIMARY KEY (path, bits))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS capacity_fit ON capacity (bits, bytes)")
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM covers").fetchone()[0]
+
+    def update(self, directory, workers=None, texture=True, extensions=IMAGE_EXTENSIONS):
+        """
+        Indexe les images de directory : nouvelles ou modifiées lues en parallèle
+        (workers processus), disparues retirées. Retourne les compteurs et les erreurs.
+        """
+        paths = list_covers(directory, extensions)
+        known = {p: (s, m) for p, s, m in self.db.execute("SELECT path, size, mtime_ns FROM covers")}
+        todo, present = [], set()
+        for p in paths:
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue  # supprimé depuis list_covers : traité comme disparu
+            present.add(p)
+            if known.get(p) != (st.st_size, st.st_mtime_ns):
+                todo.append(p)
+        root = os.path.join(os.path.abspath(directory), '')
+        gone = [p for p in known if p.startswith(root) and p not in present]
+
+        workers = min(workers or os.cpu_count() or 1, max(1, len(todo)))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_scan, todo, [texture] * len(todo), chunksize=16))
+        else:
+            results = [_scan(p, texture) for p in todo]
+
+        rows = [row for row, _ in results if row is not None]
+        errors = [(p, err) for p, (_, err) in zip(todo, results) if err is not None]
+        self._remove(gone + [p for p, _ in errors])
+        self.db.executemany("INSERT OR REPLACE INTO covers VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.executemany("INSERT OR REPLACE INTO capacity VALUES (?, ?, ?)",
+                            [(r[0], bits, cover_capacity(r[3], r[4], bits, r[6])) for r in rows for bits in BITS])
+        self.db.commit()
+        return {'indexed': len(rows), 'unchanged': len(present) - len(todo), 'removed': len(gone),
+                'errors': errors}
+
+    def _remove(self, paths):
+        for table in ("covers", "capacity"):
+            self.db.executemany(f"DELETE FROM {table} WHERE path = ?", [(p,) for p in paths])
+
+    def _fits(self, bits_per_channel, min_bytes, min_texture, descending=False):
+        """Curseur (path, capacité) des covers de capacité >= min_bytes, par capacité croissante."""
+        sql = "SELECT c.path, c.bytes FROM capacity c"
+        params = [bits_per_channel, min_bytes]
+        where = " WHERE c.bits = ? AND c.bytes >= ?"
+        if min_texture is not None:
+            sql += " JOIN covers v ON v.path = c.path"
+            where += " AND v.texture >= ?"
+            params.append(min_texture)
+        order = " DESC" if descending else ""
+        return self.db.execute(sql + where + f" ORDER BY c.bytes{order}, c.path{order}", params)
+
+    def best_fit(self, required, bits_per_channel=1, min_texture=None):
+        """Plus petite cover de capacité >= required octets : (path, capacité) ou None."""
+        return self._fits(bits_per_channel, required, min_texture).fetchone()
+
+    def best_fit_set(self, payload_size, bits_per_channel=1, min_texture=None):
+        """
+        Plus petit ensemble de covers pour répartir payload_size octets de payload
+        (sans entête) avec embed_file_into_images : les plus grandes d'abord, puis la
+        dernière remplacée par la plus petite suffisante. Retourne [(path, capacité)] ou None.
+        """
+        from steg import SHARD_OVERHEAD
+        overhead = HEADER_SIZE + SHARD_OVERHEAD
+        chosen, total = [], 0
+        for path, cap in self._fits(bits_per_channel, overhead + 1, min_texture, descending=True):
+            chosen.append((path, cap))
+            total += cap - overhead
+            if total >= payload_size:
+                break
+        else:
+            return None
+        # Dernière cover : la plus petite qui complète encore le lot
+        missing = payload_size - (total - (chosen[-1][1] - overhead))
+        taken = {p for p, _ in chosen[:-1]}
+        for path, cap in self._fits(bits_per_channel, missing + overhead, min_texture):
+            if path not in taken:
+                chosen[-1] = (path, cap)
+                break
+        return chosen
+
+    def plan(self, file_path, password=None, bits_per_channel=1, compression='auto', kdf=DEFAULT_KDF,
+             min_texture=None):
+        """
+        Estime le payload de file_path et choisit les covers :
+        {'estimate': ..., 'covers': [(path, capacité)]} ; une seule cover si possible, sinon
+        un ensemble (multi-covers) ; 'covers' vaut None si la bibliothèque est trop petite.
+        """
+        estimate = estimate_payload_size(file_path, password, compression, kdf)
+        single = self.best_fit(estimate['required'], bits_per_channel, min_texture)
+        covers = [single] if single else self.best_fit_set(estimate['data'], bits_per_channel, min_texture)
+        return {'estimate': estimate, 'covers': covers}
+
+    def close(self):
+        self.db.close()
+
+# ---------- CLI ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bibliothèque de covers indexée")
+    parser.add_argument("--db", default=LIBRARY_PATH, help="Index SQLite (défaut: covers.sqlite)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    idx = sub.add_parser("index", help="indexer (ou mettre à jour) un dossier de covers")
+    idx.add_argument("directory")
+    idx.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processus en parallèle")
+    idx.add_argument("--no-texture", action="store_true", help="entêtes seulement, sans score de texture")
+    pick = sub.add_parser("pick", help="choisir la plus petite cover (ou le plus petit lot) pour un secret")
+    pick.add_argument("-s", "--secret", required=True)
+    pick.add_argument("--password", default="")
+    pick.add_argument("--bits", type=int, choices=BITS, default=1)
+    pick.add_argument("--min-texture", type=float, help="score de texture minimal")
+    args = parser.parse_args(argv)
+
+    library = CoverLibrary(args.db)
+    try:
+        if args.cmd == "index":
+            result = library.update(args.directory, args.workers, texture=not args.no_texture)
+            for path, err in result['errors']:
+                print(f"[SKIP] {path}: {err}")
+            print(f"[OK] {result['indexed']} indexées, {result['unchanged']} inchangées, "
+                  f"{result['removed']} retirées ({len(library)} covers)")
+            return 0
+        plan = library.plan(args.secret, args.password, args.bits, min_texture=args.min_texture)
+        est = plan['estimate']
+        print(f"Payload estimé: {est['required']} bytes ({'exact' if est['exact'] else 'extrapolé'}), "
+              f"secret: {est['source']} bytes")
+        if not plan['covers']:
+            print("[ERREUR] Aucune cover (ni ensemble de covers) assez grande")
+            return 1
+        for path, cap in plan['covers']:
+            print(f"{path}\t{cap}")
+        return 0
+    finally:
+        library.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
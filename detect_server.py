@@ -0,0 +1,344 @@
+# detect_server.py
+"""Service de détection local : le modèle reste en mémoire, les requêtes sont regroupées.
+
+Un serveur HTTP (bibliothèque standard) écoute sur localhost ou sur un socket Unix.
+Chaque requête extrait ses features dans son propre thread ; un thread unique
+regroupe les vecteurs arrivés en même temps et les score en un seul appel
+scaler.transform / predict_proba.
+
+    POST /predict   corps = image encodée (PNG, BMP...) ou JSON {"path": "..."}
+    GET  /stats     requêtes, lots, latences, débit
+    GET  /health
+
+Les chemins sont lus avec les droits du serveur : ne l'exposer qu'en local.
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import steg_detect
+
+DEFAULT_PORT = 8765
+MAX_BATCH = 64
+MAX_WAIT = 0.002         # secondes d'attente pour compléter un lot
+MAX_BODY = 256 << 20     # taille maximale d'une image envoyée
+REQUEST_TIMEOUT = 60
+LATENCY_WINDOW = 1024    # requêtes récentes gardées pour les percentiles
+
+class ServiceStats:
+    """Compteurs du service, partagés entre threads"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched = 0
+        self.largest_batch = 0
+        self._recent = deque(maxlen=window)  # (fin de requête, latence)
+
+    def record_request(self, latency, ok=True):
+        with self._lock:
+            self.requests += 1
+            self.errors += not ok
+            self._recent.append((time.monotonic(), latency))
+
+    def record_batch(self, size):
+        with self._lock:
+            self.batches += 1
+            self.batched += size
+            self.largest_batch = max(self.largest_batch, size)
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            recent = list(self._recent)
+            stats = {
+                "uptime_s": round(now - self.started, 3),
+                "requests": self.requests,
+                "errors": self.errors,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched / self.batches, 2) if self.batches else 0,
+                "largest_batch": self.largest_batch,
+                "throughput_rps": round(self.requests / max(now - self.started, 1e-9), 2),
+            }
+        if recent:
+            lat = np.array([l for _, l in recent]) * 1000
+            span = now - recent[0][0]
+            stats["recent_throughput_rps"] = round(len(recent) / span, 2) if span > 0 else None
+            stats["latency_ms"] = {"mean": round(float(lat.mean()), 3),
+                                   "p50": round(float(np.percentile(lat, 50)), 3),
+                                   "p95": round(float(np.percentile(lat, 95)), 3),
+                                   "p99": round(float(np.percentile(lat, 99)), 3)}
+        return stats
+
+class MicroBatcher:
+    """
+    Regroupe les vecteurs soumis par plusieurs threads et les score par lot.
+    Le lot part quand il atteint max_batch ou max_wait après sa première requête :
+    à faible charge une requête attend au plus max_wait, sous charge les lots
+    grossissent d'eux-mêmes
+    """
+
+    def __init__(self, score, max_batch=MAX_BATCH, max_wait=MAX_WAIT, stats=None):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="detect-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, features):
+        """Retourne un Future résolu avec (heuristique, probabilité ML, score final)"""
+        future = Future()
+        self._queue.put((features, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch, stop = [first], False
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            futures = [f for _, f in batch]
+            try:
+                heur, ml_prob, final = self.score(np.stack([x for x, _ in batch]))
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+            else:
+                for i, f in enumerate(futures):
+                    f.set_result((heur[i], ml_prob[i], final[i]))
+            if self.stats is not None:
+                self.stats.record_batch(len(batch))
+            if stop:
+                return
+
+class DetectionService:
+    """Modèle chargé une fois + micro-batching des prédictions"""
+
+    def __init__(self, model=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.model = steg_detect.load_model() if model is None else model
+        self.version = steg_detect.model_feature_version(self.model)
+        self.stats = ServiceStats()
+        self.batcher = MicroBatcher(lambda X: steg_detect.score_features(X, self.model),
+                                    max_batch, max_wait, self.stats)
+
+    def predict(self, data=None, path=None, timeout=REQUEST_TIMEOUT):
+        """
+        Score une image donnée par son contenu (data) ou son chemin (path)
+        Retourne le dict de steg_detect.result_row ; ValueError si l'image est illisible
+        """
+        start = time.monotonic()
+        try:
+            if path is not None:
+                feat = steg_detect.extract_features(path, self.version)
+            else:
+                feat = steg_detect.extract_features_from_bytes(data, self.version)
+            row = steg_detect.result_row(*self.batcher.submit(feat).result(timeout))
+        except Exception:
+            self.stats.record_request(time.monotonic() - start, ok=False)
+            raise
+        self.stats.record_request(time.monotonic() - start)
+        return row
+
+    def close(self):
+        self.batcher.close()
+
+# ---------- HTTP ----------
+class DetectHandler(BaseHTTPRequestHandler):
+    server_version = "StegDetect/1.0"
+    protocol_version = "HTTP/1.1"  # connexions persistantes pour les clients en boucle
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.service.stats.snapshot())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok", "model": self.server.service.model[0] is not None})
+        else:
+            self._send_json(404, {"error": f"Ressource inconnue: {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Ressource inconnue: {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY:
+            self.close_connection = True
+            self._send_json(413 if length else 400, {"error": "Corps de requête vide ou trop volumineux"})
+            return
+        body = self.rfile.read(length)
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                path = json.loads(body).get("path")
+                if not path:
+                    raise ValueError("Champ 'path' manquant")
+                row = self.server.service.predict(path=path)
+            else:
+                row = self.server.service.predict(data=body)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+        else:
+            self._send_json(200, row)
+
+    def _send_json(self, code, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # client_address est vide sur un socket Unix
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Un socket laissé par un serveur précédent est remplacé ; tout autre fichier est conservé
+        try:
+            mode = os.stat(self.server_address).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f"{self.server_address} existe et n'est pas un socket Unix")
+            os.unlink(self.server_address)
+        super().server_bind()
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None, verbose=False):
+    """
+    Crée le serveur (pas encore démarré) ; port=0 choisit un port libre
+    """
+    if unix_socket:
+        server = UnixHTTPServer(unix_socket, DetectHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), DetectHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+# ---------- Client ----------
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+class DetectClient:
+    """Client minimal du service (une connexion par appel, utilisable depuis plusieurs threads)"""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None, timeout=REQUEST_TIMEOUT):
+        self.host, self.port, self.unix_socket, self.timeout = host, port, unix_socket, timeout
+
+    def _request(self, method, url, body=None, headers=None):
+        if self.unix_socket:
+            conn = _UnixConnection(self.unix_socket, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, url, body=body, headers=headers or {})
+            resp = conn.getresponse()
+            payload = json.loads(resp.read() or b"{}")
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise RuntimeError(f"{resp.status}: {payload.get('error', resp.reason)}")
+        return payload
+
+    def predict(self, data=None, path=None):
+        """Envoie le contenu de l'image (data) ou seulement son chemin (path, lu par le serveur)"""
+        if path is not None:
+            return self._request("POST", "/predict", json.dumps({"path": os.path.abspath(path)}),
+                                 {"Content-Type": "application/json"})
+        return self._request("POST", "/predict", data, {"Content-Type": "application/octet-stream"})
+
+    def stats(self):
+        return self._request("GET", "/stats")
+
+    def health(self):
+        return self._request("GET", "/health")
+
+# ---------- CLI ----------
+def main():
+    parser = argparse.ArgumentParser(description="Service de détection stéganographique (local)")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse d'écoute (défaut: localhost)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", help="Écouter sur un socket Unix plutôt qu'en TCP")
+    parser.add_argument("--model", default=None, help="Modèle (défaut: stego_model.pkl)")
+    parser.add_argument("--scaler", default=None, help="Scaler (défaut: scaler.pkl)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Images scorées par lot au maximum")
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT * 1000,
+                        help="Attente maximale pour compléter un lot (ms)")
+    parser.add_argument("--verbose", action="store_true", help="Journaliser chaque requête")
+    args = parser.parse_args()
+
+    model = steg_detect.load_model(args.model, args.scaler)
+    if model[0] is None:
+        print("Modèle non entraîné : score heuristique seul")
+    service = DetectionService(model, args.max_batch, args.max_wait / 1000)
+    server = make_server(service, args.host, args.port, args.unix_socket, args.verbose)
+    where = args.unix_socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"Service de détection prêt sur {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,81 @@
 # gui.py
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from steg import embed_file_into_image, extract_file_from_image, capacity_bytes_for_image
+from steg import embed_file_into_image, extract_file_from_image, Cancelled, carrier_channels, BITS_PER_CHANNEL
 from PIL import Image
+from cover_library import cover_capacity, estimate_payload_size
+
+POLL_MS = 100  # intervalle de lecture des messages du worker
+
+class BackgroundTask:
+    """Exécute func(progress=..., cancel=...) dans un thread.
+
+    Le worker ne touche jamais aux widgets : progression, résultat et erreur
+    passent par une file lue depuis la boucle Tk (poll).
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        kwargs.update(progress=self._progress, cancel=self.cancel_event)
+        self.thread = threading.Thread(target=self._run, args=(func, args, kwargs), daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _progress(self, stage, done, total):
+        self.events.put(('progress', (stage, done, total)))
+
+    def _run(self, func, args, kwargs):
+        try:
+            self.events.put(('done', func(*args, **kwargs)))
+        except Cancelled:
+            self.events.put(('cancelled', None))
+        except Exception as e:
+            self.events.put(('error', e))
+
+    def poll(self):
+        """Retourne (dernière progression ou None, événement final ou None)"""
+        progress, final = None, None
+        while final is None:
+            try:
+                kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                progress = value
+            else:
+                final = (kind, value)
+        return progress, final
+
+STAGE_LABELS = {'order': "Pixels ordonnés", 'embed': "Secret inséré", 'extract': "Payload lu"}
+
+def _format_progress(stage, done, total):
+    percent = 100 * done // total if total else 100
+    return f"[{percent:3d}%] {STAGE_LABELS.get(stage, stage)}: {done}/{total}"
+
+def _dry_run(cover, secret, bits, password=None, progress=None, cancel=None):
+    with Image.open(cover) as img:  # entête seulement, pixels non décodés
+        cap = cover_capacity(*img.size, bits, carrier_channels(img))
+    if not secret:
+        return f"[Dry-run] Capacité image: {cap} bytes, Bits: {bits}"
+    est = estimate_payload_size(secret, password)
+    verdict = "OK" if est['required'] <= cap else "capacité insuffisante"
+    return (f"[Dry-run] Capacité image: {cap} bytes, Taille secret: {est['source']} bytes, "
+            f"Payload estimé: {est['required']} bytes, Bits: {bits} — {verdict}")
 
 class StegoGUI:
     def __init__(self, root):
         self.root = root
         root.title("Steganography Tool")
-        
+        self.task = None
+
         # Variables
         self.cover_path = tk.StringVar()
         self.secret_path = tk.StringVar()
@@ -16,93 +83,133 @@ class StegoGUI:
         self.password = tk.StringVar()
         self.bits = tk.IntVar(value=1)
         self.adaptive = tk.BooleanVar(value=False)
-        
+
         # Widgets
         tk.Label(root, text="Image cover:").grid(row=0, column=0, sticky="w")
         tk.Entry(root, textvariable=self.cover_path, width=40).grid(row=0, column=1)
         tk.Button(root, text="Parcourir", command=self.choose_cover).grid(row=0, column=2)
-        
+
         tk.Label(root, text="Fichier secret:").grid(row=1, column=0, sticky="w")
         tk.Entry(root, textvariable=self.secret_path, width=40).grid(row=1, column=1)
         tk.Button(root, text="Parcourir", command=self.choose_secret).grid(row=1, column=2)
-        
+
         tk.Label(root, text="Fichier sortie:").grid(row=2, column=0, sticky="w")
         tk.Entry(root, textvariable=self.output_path, width=40).grid(row=2, column=1)
         tk.Button(root, text="Parcourir", command=self.choose_output).grid(row=2, column=2)
-        
+
         tk.Label(root, text="Mot de passe:").grid(row=3, column=0, sticky="w")
         tk.Entry(root, textvariable=self.password, show="*").grid(row=3, column=1, sticky="w")
-        
+
         tk.Label(root, text="Bits par canal:").grid(row=4, column=0, sticky="w")
-        tk.OptionMenu(root, self.bits, 1, 2).grid(row=4, column=1, sticky="w")
-        
+        tk.OptionMenu(root, self.bits, *BITS_PER_CHANNEL).grid(row=4, column=1, sticky="w")
+
         tk.Checkbutton(root, text="Adaptive (texture)", variable=self.adaptive).grid(row=5, column=1, sticky="w")
-        
-        tk.Button(root, text="Dry-run", command=self.dry_run).grid(row=6, column=0)
-        tk.Button(root, text="Encoder", command=self.encode).grid(row=6, column=1)
-        tk.Button(root, text="Décoder", command=self.decode).grid(row=6, column=2)
-        
+
+        self.buttons = [
+            tk.Button(root, text="Dry-run", command=self.dry_run),
+            tk.Button(root, text="Encoder", command=self.encode),
+            tk.Button(root, text="Décoder", command=self.decode),
+        ]
+        for column, button in enumerate(self.buttons):
+            button.grid(row=6, column=column)
+        self.cancel_button = tk.Button(root, text="Annuler", command=self.cancel, state=tk.DISABLED)
+        self.cancel_button.grid(row=8, column=1)
+
         self.log = tk.Text(root, height=15, width=70)
         self.log.grid(row=7, column=0, columnspan=3)
-    
+
     # Fonctions pour parcourir fichiers
     def choose_cover(self):
         path = filedialog.askopenfilename(filetypes=[("Images", "*.png *.bmp")])
         if path:
             self.cover_path.set(path)
-    
+
     def choose_secret(self):
         path = filedialog.askopenfilename(filetypes=[("Tous fichiers", "*.*")])
         if path:
             self.secret_path.set(path)
-    
+
     def choose_output(self):
         path = filedialog.asksaveasfilename(defaultextension=".png")
         if path:
             self.output_path.set(path)
-    
+
+    # Exécution en arrière-plan
+    def run_task(self, label, on_done, func, *args, **kwargs):
+        if self.task is not None:
+            return
+        self.task = BackgroundTask(func, *args, **kwargs).start()
+        self.task_label = label
+        self.on_done = on_done
+        for button in self.buttons:
+            button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        # Une ligne de progression dans le log, réécrite à chaque lecture
+        self.progress_line = self.log.index("end-1c linestart")
+        self._set_progress(f"{label} en cours...")
+        self.root.after(POLL_MS, self._poll)
+
+    def _set_progress(self, text):
+        self.log.delete(self.progress_line, f"{self.progress_line} lineend")
+        self.log.insert(self.progress_line, text)
+        self.log.see(tk.END)
+
+    def _poll(self):
+        progress, final = self.task.poll()
+        if progress is not None:
+            self._set_progress(f"{self.task_label} {_format_progress(*progress)}")
+        if final is None:
+            self.root.after(POLL_MS, self._poll)
+            return
+        self.task = None
+        for button in self.buttons:
+            button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        kind, value = final
+        if kind == 'done':
+            self._set_progress(self.on_done(value) + "\n")
+        elif kind == 'cancelled':
+            self._set_progress(f"[ANNULÉ] {self.task_label}\n")
+        else:
+            self._set_progress(f"[ERREUR] {self.task_label}: {value}\n")
+            messagebox.showerror("Erreur", str(value))
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+            self._set_progress(f"{self.task_label}: annulation...")
+
     # Dry-run: vérifier capacité
     def dry_run(self):
-        try:
-            img = Image.open(self.cover_path.get()).convert('RGB')
-            cap = capacity_bytes_for_image(img, self.bits.get())
-            import os
-            secret_size = os.path.getsize(self.secret_path.get()) if self.secret_path.get() else 0
-            self.log.insert(tk.END, f"[Dry-run] Capacité image: {cap} bytes, Taille secret: {secret_size} bytes, Bits: {self.bits.get()}\n")
-        except Exception as e:
-            messagebox.showerror("Erreur", str(e))
-    
+        self.run_task("Dry-run", lambda message: message, _dry_run,
+                      self.cover_path.get(), self.secret_path.get(), self.bits.get(), self.password.get())
+
     # Encodage
     def encode(self):
-        try:
-            info = embed_file_into_image(
-                self.cover_path.get(),
-                self.output_path.get(),
-                self.secret_path.get(),
-                password=self.password.get(),
-                bits_per_channel=self.bits.get(),
-                adaptive=self.adaptive.get()
-            )
-            self.log.insert(tk.END, f"[OK] Encodage terminé: {info}\n")
-        except Exception as e:
-            messagebox.showerror("Erreur", str(e))
-    
+        self.run_task(
+            "Encodage", lambda info: f"[OK] Encodage terminé: {info}",
+            embed_file_into_image,
+            self.cover_path.get(),
+            self.output_path.get(),
+            self.secret_path.get(),
+            password=self.password.get(),
+            bits_per_channel=self.bits.get(),
+            adaptive=self.adaptive.get()
+        )
+
     # Décodage
     def decode(self):
-        try:
-            info = extract_file_from_image(
-                self.cover_path.get(),
-                self.output_path.get(),
-                password=self.password.get(),
-                bits_per_channel=self.bits.get(),
-                adaptive=self.adaptive.get()
-            )
-            self.log.insert(tk.END, f"[OK] Extraction terminée: {info}\n")
-        except Exception as e:
-            messagebox.showerror("Erreur", str(e))
+        self.run_task(
+            "Extraction", lambda info: f"[OK] Extraction terminée: {info}",
+            extract_file_from_image,
+            self.cover_path.get(),
+            self.output_path.get(),
+            password=self.password.get(),
+            bits_per_channel=self.bits.get(),
+            adaptive=self.adaptive.get()
+        )
 
 if __name__ == "__main__":
     root = tk.Tk()
     gui = StegoGUI(root)
     root.mainloop()
-
@@ -0,0 +1,90 @@
+# permutation.py
+"""Permutation de pixels à clé, calculable indice par indice.
+
+Un réseau de Feistel équilibré sur 2^(2k) >= n éléments, ramené à [0, n)
+par cycle-walking, donne une bijection de [0, n) dérivée du mot de passe.
+Chaque position se calcule indépendamment : on peut évaluer seulement les
+N premières positions sans construire la permutation complète.
+"""
+import hashlib
+from functools import lru_cache
+import numpy as np
+
+ROUNDS = 4
+CHUNK = 1 << 20  # indices évalués par bloc (borne la mémoire temporaire)
+
+@lru_cache(maxsize=32)
+def _round_keys(password, rounds=ROUNDS):
+    """Clés de tour (uint32) dérivées du mot de passe."""
+    secret = (password or '').encode('utf-8')
+    keys = []
+    for r in range(rounds):
+        digest = hashlib.sha256(b'steg-order' + bytes([r]) + secret).digest()
+        keys.append(int.from_bytes(digest[:4], 'big'))
+    keys = np.array(keys, dtype=np.uint32)
+    keys.setflags(write=False)  # partagé par le cache
+    return keys
+
+def _mix32(z):
+    """Finaliseur murmur3 (arithmétique uint32 modulo 2^32)."""
+    z = z ^ (z >> np.uint32(16))
+    z = z * np.uint32(0x85EBCA6B)
+    z = z ^ (z >> np.uint32(13))
+    z = z * np.uint32(0xC2B2AE35)
+    return z ^ (z >> np.uint32(16))
+
+class KeyedPermutation:
+    """Bijection pseudo-aléatoire de [0, n) paramétrée par un mot de passe."""
+
+    def __init__(self, n, password=None):
+        if n <= 0:
+            raise ValueError("La permutation doit contenir au moins un élément")
+        if n > 0xFFFFFFFF:
+            raise ValueError("La permutation est limitée à 2^32 éléments")
+        self.n = int(n)
+        self.half_bits = max(1, ((self.n - 1).bit_length() + 1) // 2)
+        self.keys = _round_keys(password)
+
+    def _feistel(self, x):
+        hb = np.uint32(self.half_bits)
+        mask = np.uint32((1 << self.half_bits) - 1)
+        left = x >> hb
+        right = x & mask
+        for key in self.keys:
+            left, right = right, left ^ (_mix32(right ^ key) & mask)
+        return (left << hb) | right
+
+    def _map(self, x):
+        y = self._feistel(x)
+        out = np.flatnonzero(y >= self.n)
+        while out.size:
+            y[out] = self._feistel(y[out])
+            out = out[y[out] >= self.n]
+        return y
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        """Évaluation paresseuse : perm[a:b] ne calcule que les positions a..b-1."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.n)
+            if step != 1:
+                raise ValueError("Seules les tranches contiguës sont supportées")
+            return self.take(start, stop)
+        if key < 0:
+            key += self.n
+        if not 0 <= key < self.n:
+            raise IndexError("Indice hors de la permutation")
+        return int(self.take(key, key + 1)[0])
+
+    def take(self, start=0, stop=None):
+        """Retourne les positions permutées des indices start..stop-1 (int64)."""
+        stop = self.n if stop is None else min(int(stop), self.n)
+        start = min(int(start), stop)
+        result = np.empty(stop - start, dtype=np.int64)
+        for lo in range(start, stop, CHUNK):
+            hi = min(lo + CHUNK, stop)
+            idx = np.arange(lo, hi, dtype=np.uint32)
+            result[lo - start:hi - start] = self._map(idx)
+        return result
@@ -1,136 +1,735 @@
 # steg.py
 from PIL import Image
+import os
 import random
 import hashlib
+import tempfile
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from utils import (prepare_payload_bytes, parse_header_from_bytes, verify_payload,
-                   bytes_to_bits, bits_to_bytes, decrypt_payload, decode_flags, HEADER_SIZE)
+from utils import (PayloadStream, parse_header_from_bytes, encode_flags, decrypt_chunks, decompress_chunks,
+                   decode_flags, parse_extensions, unpack_kdf, HEADER_SIZE, CHUNK_SIZE,
+                   FLAG_KEYED_ORDER, FLAG_STABLE_MAP, FLAG_EXTENDED, FLAG_PREAMBLE, EXT_KDF, EXT_COMPRESSION, EXT_SHARD,
+                   DEFAULT_KDF, COMP_GZIP, PREAMBLE_SIZE, pack_preamble, parse_preamble,
+                   ShardStream, SHARD_SIZE, pack_shard, unpack_shard, read_chunks)
+from permutation import KeyedPermutation
 
-def capacity_bytes_for_image(img, bits_per_channel=1):
-    w, h = img.size
-    return (w * h * 3 * bits_per_channel) // 8
+ORDER_LEGACY = 0   # random.shuffle sur une liste Python (anciennes images)
+ORDER_KEYED = 1    # permutation de Feistel à clé (flag FLAG_KEYED_ORDER)
+ORDER_PREAMBLE = 2 # idem, après les pixels du préambule (flag FLAG_PREAMBLE)
 
-def get_pixel_order(width, height, password=None, adaptive=False, img=None):
+PREAMBLE_PIXELS = -(-PREAMBLE_SIZE * 8 // 3)  # préambule à 1 bit par canal
+
+BITS_PER_CHANNEL = (1, 2, 3, 4)
+CARRIERS = ('auto', 'rgb', 'rgba')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def _has_alpha(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+def carrier_channels(img, carrier='auto'):
+    """Nombre de canaux porteurs de l'image PIL (entête seulement) : 4 avec l'alpha, sinon 3.
+
+    carrier : 'auto' garde l'alpha de la cover s'il existe, 'rgb' l'ignore
+    (comportement historique), 'rgba' l'ajoute, opaque, s'il manque.
+    """
+    if carrier not in CARRIERS:
+        raise ValueError(f"carrier must be one of {CARRIERS}")
+    return 4 if carrier == 'rgba' or (carrier == 'auto' and _has_alpha(img)) else 3
+
+def capacity_bytes_for_image(img, bits_per_channel=1, carrier='auto'):
+    """Octets insérables (entête compris) avec l'ordre par défaut, préambule déduit (voir payload_capacity)."""
+    return payload_capacity(img.size, bits_per_channel, channels=carrier_channels(img, carrier))
+
+def _is_png16(path):
+    """PNG à 16 bits par canal (gris, gris + alpha, RGB ou RGBA), d'après l'entête IHDR ;
+    PIL le réduirait à 8 bits."""
+    with open(path, 'rb') as f:
+        head = f.read(26)
+    return (len(head) == 26 and head[:8] == PNG_SIGNATURE and head[12:16] == b'IHDR'
+            and head[24] == 16 and head[25] in (0, 2, 4, 6))
+
+def load_carrier(image_path, carrier='auto'):
+    """Pixels porteurs de l'image : tableau (hauteur, largeur, 3 ou 4 canaux).
+
+    uint16 pour un PNG 16 bits (lu par OpenCV, en pleine profondeur), uint8 sinon.
+    Un PNG gris devient RGB, comme en 8 bits. Voir carrier_channels pour carrier.
+    """
+    if carrier not in CARRIERS:
+        raise ValueError(f"carrier must be one of {CARRIERS}")
+    if _is_png16(image_path):
+        import cv2
+        pixels = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        if pixels is None:
+            raise ValueError(f"Impossible de lire l'image: {image_path}")
+        if pixels.ndim == 2:
+            pixels = np.repeat(pixels[..., None], 3, axis=2)  # gris -> RGB
+        else:
+            pixels = pixels[..., [2, 1, 0, 3][:pixels.shape[2]]]  # BGR(A) -> RGB(A), gris + alpha compris
+        alpha = pixels.shape[2] == 4
+    else:
+        img = Image.open(image_path)
+        alpha = _has_alpha(img)
+        pixels = np.array(img.convert('RGBA' if carrier == 'rgba' or (carrier == 'auto' and alpha) else 'RGB'))
+    if carrier == 'rgb' and pixels.shape[2] == 4:
+        pixels = pixels[..., :3]
+    elif carrier == 'rgba' and pixels.shape[2] == 3:
+        opaque = np.full(pixels.shape[:2] + (1,), np.iinfo(pixels.dtype).max, dtype=pixels.dtype)
+        pixels = np.concatenate([pixels, opaque], axis=2)
+    return np.ascontiguousarray(pixels)
+
+def _save_carrier(out_path, pixels):
+    """Écrit les pixels en PNG ; 16 bits par canal (OpenCV) si le tableau est en uint16."""
+    if pixels.dtype != np.uint16:
+        Image.fromarray(pixels).save(out_path, 'PNG')
+        return
+    import cv2
+    ok, data = cv2.imencode('.png', np.ascontiguousarray(pixels[..., [2, 1, 0, 3][:pixels.shape[2]]]))
+    if not ok:
+        raise ValueError(f"Impossible d'écrire l'image: {out_path}")
+    with open(out_path, 'wb') as f:
+        f.write(data.tobytes())
+
+def _local_variance(gray):
+    """Variance locale 3x3 multipliée par 81 (entier exact, bords en miroir
+    comme scipy.ndimage mode 'reflect'). gray : niveaux entiers <= 765.
+
+    Les sommes de x et x² sur la fenêtre sont calculées par filtre boîte
+    séparable. L'ordre induit est identique à celui de l'ancien
+    generic_filter(..., np.var) en float32, donc l'ordre adaptatif reste compatible.
+    """
+    g = np.pad(gray.astype(np.int32), 1, mode='symmetric')
+    def box(a):
+        rows = a[:-2] + a[1:-1] + a[2:]
+        return rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:]
+    s1 = box(g)
+    s2 = box(g * g)
+    return 9 * s2 - s1 * s1
+
+_texture_cache = OrderedDict()
+TEXTURE_CACHE_SIZE = 2
+
+def _texture_map(img, bits_per_channel=1, stable=True):
+    """Carte de texture (variance locale x81) utilisée par le mode adaptatif.
+
+    img : image PIL ou pixels porteurs (voir load_carrier).
+    stable=True : calculée sur la somme des canaux R+G+B dont les
+    bits_per_channel bits de poids faible sont masqués (octet de poids fort
+    pour 16 bits par canal). L'insertion ne touche que ces bits, la carte est
+    donc identique avant et après encodage ; elle est mise en cache par
+    empreinte de ce contenu.
+    stable=False : ancienne carte, sur le niveau de gris 8 bits complet.
+    """
+    if isinstance(img, np.ndarray):
+        rgb = img[..., :3]
+    else:
+        rgb = np.array(img.convert('RGB'), dtype=np.uint8)
+    if not stable:
+        return _local_variance(np.array(Image.fromarray(rgb).convert('L'), dtype=np.uint8))
+    if rgb.dtype == np.uint16:
+        rgb = rgb >> 8
+    else:
+        rgb = rgb & np.uint8(~((1 << bits_per_channel) - 1) & 0xFF)
+    gray = rgb.sum(axis=2, dtype=np.int32)
+    key = (hashlib.sha256(gray.tobytes()).digest(), gray.shape)
+    if key in _texture_cache:
+        _texture_cache.move_to_end(key)
+        return _texture_cache[key]
+    variance = _local_variance(gray)
+    _texture_cache[key] = variance
+    if len(_texture_cache) > TEXTURE_CACHE_SIZE:
+        _texture_cache.popitem(last=False)
+    return variance
+
+def _sort_by_texture(indices, variance, count=None):
+    """Trie les indices par variance décroissante ; à égalité l'ordre d'entrée est conservé.
+
+    Clé et rang sont combinés en un int64 unique : un tri non stable (ou une
+    partition pour les count premiers) suffit et évite argsort(kind='stable').
+    """
+    keys = (-variance.reshape(-1)[indices].astype(np.int64) << 32) | np.arange(indices.size, dtype=np.int64)
+    if count is not None and count < keys.size:
+        keys = np.partition(keys, count)[:count] if count > 0 else keys[:0]
+    keys.sort()
+    return indices[keys & 0xFFFFFFFF]
+
+def get_pixel_order(width, height, password=None, adaptive=False, img=None, order_version=ORDER_LEGACY,
+                    count=None, bits_per_channel=1):
+    """Ordre de parcours des pixels (tableau int64 d'indices de pixels).
+
+    ORDER_LEGACY reproduit le random.shuffle historique (seed 32 bits du mot de
+    passe) ; ORDER_KEYED utilise la permutation de Feistel à clé de permutation.py.
+    ORDER_PREAMBLE est la même permutation privée de ses PREAMBLE_PIXELS premiers
+    pixels, réservés au préambule.
+    Avec count, seules les count premières positions sont retournées (calculées
+    sans construire l'ordre complet pour ORDER_KEYED non adaptatif).
+
+    En mode adaptatif, ORDER_KEYED calcule la texture sans les bits_per_channel
+    bits de poids faible (voir _texture_map) : l'ordre est le même sur la cover
+    et sur l'image stego.
+    """
     total = width * height
-    indices = list(range(total))
-    seed = 0
-    if password:
-        seed = int(hashlib.sha256(password.encode()).hexdigest(), 16) & 0xFFFFFFFF
-    rnd = random.Random(seed)
-    rnd.shuffle(indices)
-
-    if adaptive and img is not None:
-        try:
-            from scipy.ndimage import generic_filter
-            arr = np.array(img.convert('L'), dtype=np.float32)
-            def local_var(block):
-                return float(np.array(block).var())
-            varmap = generic_filter(arr, local_var, size=3)
-            flat_var = varmap.reshape(-1)
-            indices.sort(key=lambda i: -float(flat_var[i]))
-        except Exception:
-            pass
-    return indices
-
-def embed_file_into_image(image_path, out_path, file_path, password=None, bits_per_channel=1, adaptive=False, dry_run=False):
-    if bits_per_channel not in (1,2):
-        raise ValueError("bits_per_channel must be 1 or 2")
-
-    img = Image.open(image_path).convert('RGB')
-    w,h = img.size
-    cap = capacity_bytes_for_image(img, bits_per_channel)
-    payload = prepare_payload_bytes(file_path, bits_per_channel, adaptive, password=password)
-
-    if len(payload) > cap:
-        raise ValueError(f"Capacité insuffisante: {len(payload)} > {cap} bytes")
+    skip = PREAMBLE_PIXELS if order_version == ORDER_PREAMBLE else 0
+    if order_version in (ORDER_KEYED, ORDER_PREAMBLE) and not adaptive:
+        return KeyedPermutation(total, password).take(skip, None if count is None else skip + count)
+    if order_version in (ORDER_KEYED, ORDER_PREAMBLE):
+        indices = KeyedPermutation(total, password).take(skip)
+    elif order_version == ORDER_LEGACY:
+        indices = list(range(total))
+        seed = 0
+        if password:
+            seed = int(hashlib.sha256(password.encode()).hexdigest(), 16) & 0xFFFFFFFF
+        rnd = random.Random(seed)
+        rnd.shuffle(indices)
+        indices = np.array(indices, dtype=np.int64)
+    else:
+        raise ValueError(f"Version d'ordre inconnue: {order_version}")
+
+    if adaptive:
+        if img is None:
+            raise ValueError("Le mode adaptatif nécessite l'image")
+        variance = _texture_map(img, bits_per_channel, stable=(order_version != ORDER_LEGACY))
+        indices = _sort_by_texture(indices, variance, count)
+    return indices[:count]
+
+def _order_sequence(width, height, password=None, adaptive=False, img=None, order_version=ORDER_LEGACY,
+                    count=None, bits_per_channel=1):
+    """Ordre des pixels indexable par tranches ; paresseux pour l'ordre à clé non adaptatif."""
+    if order_version == ORDER_KEYED and not adaptive:
+        return KeyedPermutation(width * height, password)
+    if order_version == ORDER_PREAMBLE and not adaptive:
+        return _OrderView(KeyedPermutation(width * height, password), PREAMBLE_PIXELS)
+    return get_pixel_order(width, height, password, adaptive, img, order_version, count, bits_per_channel)
+
+class _OrderView:
+    """Vue paresseuse order[offset:] (tranches contiguës uniquement)."""
+
+    def __init__(self, order, offset):
+        self.order = order
+        self.offset = offset
+
+    def __len__(self):
+        return max(0, len(self.order) - self.offset)
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        return self.order[start + self.offset:stop + self.offset]
+
+def iter_pixel_order(width, height, password=None, adaptive=False, img=None, order_version=ORDER_KEYED,
+                     chunk_size=65536, bits_per_channel=1):
+    """Itère sur l'ordre des pixels par blocs de chunk_size indices (tableaux int64).
+
+    En mode à clé non adaptatif chaque bloc est calculé à la demande : s'arrêter
+    tôt ne coûte que les positions déjà produites.
+    """
+    order = _order_sequence(width, height, password, adaptive, img, order_version,
+                            bits_per_channel=bits_per_channel)
+    for start in range(0, len(order), chunk_size):
+        yield order[start:start + chunk_size]
+
+def _group_values(bits, bits_per_channel):
+    """Regroupe un tableau de bits (longueur multiple de bits_per_channel, MSB d'abord) en valeurs."""
+    groups = bits.reshape(-1, bits_per_channel)
+    weights = (1 << np.arange(bits_per_channel - 1, -1, -1)).astype(np.uint8)
+    return (groups * weights).sum(axis=1, dtype=np.uint8)
+
+class _CapacityExceeded(ValueError):
+    pass
+
+class _BitWriter:
+    """Écrit un flux d'octets dans les canaux, bloc par bloc, selon l'ordre des pixels.
+
+    pixels : tableau (pixels, canaux) uint8 ou uint16, modifié sur place.
+    Les bits qui ne remplissent pas un groupe complet sont gardés pour le bloc
+    suivant ; close() complète le dernier groupe par des 0, comme l'ancien
+    encodeur, ou par les bits déjà présents avec keep_tail. Si start_bit ne
+    tombe pas au début d'un groupe (3 bits par canal), le premier groupe
+    commence par des 0, réécrits ensuite par le writer qui précède (keep_tail).
+    """
+
+    def __init__(self, pixels, order, bits_per_channel, start_bit=0):
+        self.pixels = pixels
+        self.flat = pixels.reshape(-1)
+        self.order = order
+        self.bpc = bits_per_channel
+        self.group = start_bit // bits_per_channel
+        self.capacity = len(order) * pixels.shape[1]
+        self.mask_clear = pixels.dtype.type(~((1 << bits_per_channel) - 1) & np.iinfo(pixels.dtype).max)
+        self.pending = np.zeros(start_bit % bits_per_channel, dtype=np.uint8)
+
+    def write(self, data):
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+        if self.pending.size:
+            bits = np.concatenate([self.pending, bits])
+        n = bits.size - bits.size % self.bpc
+        self._store(bits[:n])
+        self.pending = bits[n:]
+
+    def close(self, keep_tail=False):
+        if self.pending.size:
+            n = self.bpc - self.pending.size
+            if keep_tail:
+                pad = _read_bits(self.pixels, self.order, self.bpc, self.group * self.bpc + self.pending.size, n)
+            else:
+                pad = np.zeros(n, dtype=np.uint8)
+            self._store(np.concatenate([self.pending, pad]))
+            self.pending = self.pending[:0]
+
+    @property
+    def bits_written(self):
+        return self.group * self.bpc
+
+    def _store(self, bits):
+        groups = _group_values(bits, self.bpc)
+        if self.group + groups.size > self.capacity:
+            raise _CapacityExceeded("Capacité insuffisante")
+        positions = _channel_positions(self.order, groups.size, start=self.group, channels=self.pixels.shape[1])
+        self.flat[positions] = (self.flat[positions] & self.mask_clear) | groups
+        self.group += groups.size
+
+def _channel_positions(order, n_groups, start=0, channels=3):
+    """Indices (dans le tableau plat des canaux) des canaux start..start+n_groups selon l'ordre des pixels."""
+    first_pix = start // channels
+    last_pix = -(-(start + n_groups) // channels)
+    pix = np.asarray(order[first_pix:last_pix], dtype=np.int64)
+    positions = pix[:, None] * channels + np.arange(channels, dtype=np.int64)
+    skip = start - first_pix * channels
+    return positions.reshape(-1)[skip:skip + n_groups]
+
+def _read_bits(pixels, order, bits_per_channel, start_bit, n_bits):
+    """Lit n_bits bits insérés à partir du bit start_bit (tableau uint8 de 0/1, MSB d'abord).
+
+    pixels : tableau (pixels, canaux). Seuls les pixels couvrant cette plage
+    sont lus ; le résultat est plus court que n_bits si l'image ne contient
+    pas assez de pixels.
+    """
+    first_group = start_bit // bits_per_channel
+    last_group = -(-(start_bit + n_bits) // bits_per_channel)
+    positions = _channel_positions(order, last_group - first_group, start=first_group, channels=pixels.shape[1])
+    shifts = np.arange(bits_per_channel - 1, -1, -1, dtype=np.uint8)
+    values = pixels.reshape(-1)[positions]
+    bits = ((values[:, None] >> shifts) & 1).astype(np.uint8, copy=False).reshape(-1)
+    skip = start_bit - first_group * bits_per_channel
+    return bits[skip:skip + n_bits]
+
+class Cancelled(Exception):
+    """Opération interrompue par son jeton d'annulation."""
+
+def _checkpoint(progress, cancel, stage, done, total):
+    """Lève Cancelled si l'annulation est demandée, puis signale la progression."""
+    if cancel is not None and cancel.is_set():
+        raise Cancelled("Opération annulée")
+    if progress is not None:
+        progress(stage, done, total)
+
+def embed_file_into_image(image_path, out_path, file_path, password=None, bits_per_channel=1, adaptive=False, dry_run=False,
+                          order_version=ORDER_PREAMBLE, kdf=DEFAULT_KDF, compression='auto', salt=None,
+                          progress=None, cancel=None, carrier='auto'):
+    """Cache file_path dans l'image.
+
+    Avec ORDER_PREAMBLE (défaut), bits_per_channel et adaptive sont aussi écrits
+    dans un préambule : l'extraction les retrouve sans qu'on les lui donne.
+
+    carrier choisit les canaux porteurs (voir carrier_channels) : par défaut
+    l'alpha d'une cover RGBA porte aussi des bits. Un PNG 16 bits reste en 16
+    bits, seuls les bits de poids faible de chaque canal sont modifiés.
+
+    progress(stage, done, total) est appelé entre les blocs : 'order' (pixels
+    ordonnés) puis 'embed' (octets du secret traités). cancel est un objet à
+    is_set() (threading.Event) ; s'il est levé, Cancelled est levée et aucune
+    image n'est écrite.
+    """
+    if bits_per_channel not in BITS_PER_CHANNEL:
+        raise ValueError("bits_per_channel must be between 1 and 4")
+
+    pixels = load_carrier(image_path, carrier)
+    stream = PayloadStream(file_path, password, kdf=kdf, compression=compression, salt=salt)
+    source_size = os.path.getsize(file_path)
+
     if dry_run:
-        return {'capacity': cap, 'required': len(payload)}
+        h, w, channels = pixels.shape
+        cap = payload_capacity((w, h), bits_per_channel, order_version, channels)
+        for _ in stream:
+            _checkpoint(progress, cancel, 'embed', stream.bytes_read, source_size)
+            if HEADER_SIZE + stream.size > cap:
+                raise ValueError(f"Capacité insuffisante: ≥ {HEADER_SIZE + stream.size} > {cap} bytes")
+        return {'capacity': cap, 'required': HEADER_SIZE + stream.size}
 
-    bits = bytes_to_bits(payload)
-    total_bits = len(bits)
-    pixels = list(img.getdata())
-    order = get_pixel_order(w,h,password,adaptive,img if adaptive else None)
-    bit_idx = 0
-    mask_clear = (~((1<<bits_per_channel)-1)) & 0xFF
+    return _embed_stream(pixels, out_path, stream, source_size, password, bits_per_channel, adaptive,
+                         order_version, progress, cancel)
 
-    for idx in order:
-        if bit_idx >= total_bits:
-            break
-        r,g,b = pixels[idx]
-        channels = [r,g,b]
-        for chan in range(3):
-            if bit_idx >= total_bits:
-                break
-            chunk = bits[bit_idx: bit_idx+bits_per_channel]
-            if len(chunk) < bits_per_channel:
-                chunk += ['0']*(bits_per_channel-len(chunk))
-            val = (channels[chan]&mask_clear) | int(''.join(chunk),2)
-            channels[chan] = val
-            bit_idx += bits_per_channel
-        pixels[idx] = tuple(channels)
-
-    out_img = Image.new('RGB',(w,h))
-    out_img.putdata(pixels)
-    out_img.save(out_path,'PNG')
-    return {'out': out_path, 'bits_embedded': bit_idx, 'payload_bytes': len(payload)}
-
-def extract_file_from_image(image_path, out_file_path, password=None, bits_per_channel=1, adaptive=False):
-    if bits_per_channel not in (1,2):
-        raise ValueError("bits_per_channel must be 1 or 2")
-
-    img = Image.open(image_path).convert('RGB')
-    w,h = img.size
-    pixels = list(img.getdata())
-    order = get_pixel_order(w,h,password,adaptive,img if adaptive else None)
-
-    collected_bits = []
-    header_parsed = False
-    payload_bits_needed = None
-
-    for idx in order:
-        r,g,b = pixels[idx]
-        collected_bits.extend(list(format(r,'08b')[-bits_per_channel:]))
-        collected_bits.extend(list(format(g,'08b')[-bits_per_channel:]))
-        collected_bits.extend(list(format(b,'08b')[-bits_per_channel:]))
-
-        if not header_parsed and len(collected_bits) >= HEADER_SIZE*8:
-            header_bits = ''.join(collected_bits[:HEADER_SIZE*8])
-            header_bytes = bytes(int(header_bits[i:i+8],2) for i in range(0,len(header_bits),8))
-            magic, size, checksum, flags = parse_header_from_bytes(header_bytes)
-            if magic != b'STEG':
-                raise ValueError("Magic header not found")
-            _, _, encrypted = decode_flags(flags)
-            payload_bits_needed = size*8
-            header_parsed = True
-            if payload_bits_needed==0:
-                break
-
-        if header_parsed and len(collected_bits)-HEADER_SIZE*8 >= payload_bits_needed:
+def payload_capacity(size, bits_per_channel, order_version=ORDER_PREAMBLE, channels=3):
+    """Octets disponibles (entête compris) dans une image de taille size=(w, h) à channels canaux porteurs."""
+    w, h = size
+    reserved = PREAMBLE_PIXELS if order_version == ORDER_PREAMBLE else 0
+    return ((w*h - reserved) * channels * bits_per_channel) // 8
+
+def _embed_stream(pixels, out_path, stream, source_size, password, bits_per_channel, adaptive, order_version,
+                  progress=None, cancel=None):
+    """Insère un flux de payload (PayloadStream ou ShardStream) dans les pixels porteurs et écrit l'image PNG."""
+    h, w, channels = pixels.shape
+    cap = payload_capacity((w, h), bits_per_channel, order_version, channels)
+    with_preamble = order_version == ORDER_PREAMBLE
+    keyed = order_version in (ORDER_KEYED, ORDER_PREAMBLE)
+    flags = encode_flags(bits_per_channel, adaptive, stream.encrypted, keyed, adaptive and keyed)
+    if with_preamble:
+        flags |= FLAG_PREAMBLE
+
+    # Le payload est écrit au fil du flux après l'emplacement de l'entête ;
+    # l'entête (taille + sha256) n'est connu, et écrit, qu'à la fin.
+    grid = pixels.reshape(-1, channels)
+    _checkpoint(progress, cancel, 'order', 0, w*h)
+    order = _order_sequence(w,h,password,adaptive,pixels if adaptive else None, order_version,
+                            bits_per_channel=bits_per_channel)
+    _checkpoint(progress, cancel, 'order', w*h, w*h)
+    writer = _BitWriter(grid, order, bits_per_channel, start_bit=HEADER_SIZE*8)
+    chunks = iter(stream)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+            _checkpoint(progress, cancel, 'embed', stream.bytes_read, source_size)
+        writer.close()
+    except _CapacityExceeded:
+        # Inutile de préparer le reste du secret pour chiffrer la taille exacte
+        raise ValueError(f"Capacité insuffisante: ≥ {HEADER_SIZE + stream.size} > {cap} bytes") from None
+    header_writer = _BitWriter(grid, order, bits_per_channel)
+    header_writer.write(stream.header(flags))
+    header_writer.close(keep_tail=True)
+    if with_preamble:
+        preamble_writer = _BitWriter(grid, _preamble_order(w, h, password), 1)
+        preamble_writer.write(pack_preamble(bits_per_channel, adaptive))
+        preamble_writer.close()
+    bit_idx = writer.bits_written
+
+    _save_carrier(out_path, pixels)
+    return {'out': out_path, 'bits_embedded': bit_idx, 'payload_bytes': HEADER_SIZE + stream.size,
+            'channels': channels, 'depth': pixels.dtype.itemsize * 8}
+
+def _read_payload(pixels, order, bits_per_channel, offset, n):
+    """Lit n octets du payload inséré à partir de l'octet offset (après l'entête)."""
+    bits = _read_bits(pixels, order, bits_per_channel, (HEADER_SIZE + offset) * 8, n * 8)
+    return np.packbits(bits).tobytes()
+
+def _payload_chunks(pixels, order, bits_per_channel, start, size, hasher, chunk_size=CHUNK_SIZE,
+                    progress=None, cancel=None):
+    """Produit les octets start..size du payload par blocs de chunk_size, en mettant à jour hasher."""
+    for offset in range(start, size, chunk_size):
+        _checkpoint(progress, cancel, 'extract', offset, size)
+        n = min(chunk_size, size - offset)
+        chunk = _read_payload(pixels, order, bits_per_channel, offset, n)
+        hasher.update(chunk)
+        yield chunk
+    _checkpoint(progress, cancel, 'extract', size, size)
+
+@contextmanager
+def _atomic_output(out):
+    """Ouvre la sortie de l'extraction.
+
+    Un chemin est écrit dans un fichier temporaire du même dossier, renommé à la
+    fin avec os.replace ; en cas d'erreur le fichier partiel est supprimé et la
+    destination n'est pas touchée. Un objet fichier est utilisé tel quel.
+    """
+    if hasattr(out, 'write'):
+        yield out
+        return
+    prefix = os.path.join(os.path.dirname(os.path.abspath(out)), '.' + os.path.basename(out) + '.')
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp_path = prefix + os.urandom(6).hex() + '.part'
+        try:
+            # 0o666 filtré par l'umask du noyau : mêmes droits qu'un open(out, 'wb'),
+            # sans toucher à l'umask du processus (extraction dans les threads de la GUI)
+            fd = os.open(tmp_path, flags, 0o666)
             break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp_path, out)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def _preamble_order(w, h, password):
+    return KeyedPermutation(w*h, password).take(0, PREAMBLE_PIXELS)
 
-    if not header_parsed:
-        raise ValueError("Entête non trouvé")
-    payload_bits = collected_bits[HEADER_SIZE*8:HEADER_SIZE*8+payload_bits_needed]
-    if len(payload_bits) < payload_bits_needed:
+def _read_preamble(pixels, w, h, password):
+    """(bits_per_channel, adaptive) lus dans le préambule, None si l'image n'en a pas."""
+    if w*h <= PREAMBLE_PIXELS:
+        return None
+    bits = _read_bits(pixels, _preamble_order(w, h, password), 1, 0, PREAMBLE_SIZE*8)
+    return parse_preamble(np.packbits(bits).tobytes())
+
+def _find_header(pixels, w, h, password, bits_per_channel, adaptive, img, order_version):
+    """Cherche l'entête avec chaque ordre candidat ; retourne (order, header)."""
+    versions = (ORDER_KEYED, ORDER_LEGACY) if order_version is None else (order_version,)
+    for version in versions:
+        order = _order_sequence(w,h,password,adaptive,img if adaptive else None, version,
+                                bits_per_channel=bits_per_channel)
+        header_bits = _read_bits(pixels, order, bits_per_channel, 0, HEADER_SIZE*8)
+        if header_bits.size < HEADER_SIZE*8:
+            raise ValueError("Entête non trouvé")
+        header = parse_header_from_bytes(np.packbits(header_bits).tobytes())
+        magic, flags = header[0], header[3]
+        keyed = version != ORDER_LEGACY
+        if (magic == b'STEG' and bool(flags & FLAG_KEYED_ORDER) == keyed
+                and bool(flags & FLAG_STABLE_MAP) == (adaptive and keyed)
+                and bool(flags & FLAG_PREAMBLE) == (version == ORDER_PREAMBLE)):
+            return order, header
+    raise ValueError("Magic header not found")
+
+def _open_stego(image_path, password, bits_per_channel, adaptive, order_version, progress=None, cancel=None):
+    """Ouvre une image stego et localise son entête (préambule d'abord, voir extract_file_from_image).
+
+    Les canaux porteurs sont ceux de l'image telle qu'écrite (3 ou 4, 8 ou 16 bits).
+    Retourne (pixels, order, bits_per_channel, adaptive, (magic, size, checksum, flags))
+    avec pixels de forme (pixels, canaux).
+    """
+    img = load_carrier(image_path)
+    h, w, channels = img.shape
+    pixels = img.reshape(-1, channels)
+    _checkpoint(progress, cancel, 'order', 0, w*h)
+    params = _read_preamble(pixels, w, h, password) if order_version in (None, ORDER_PREAMBLE) else None
+    if params is not None:
+        (bits_per_channel, adaptive), order_version = params, ORDER_PREAMBLE
+    elif order_version == ORDER_PREAMBLE:
+        raise ValueError("Préambule non trouvé")
+    else:
+        bits_per_channel = bits_per_channel or 1
+        adaptive = bool(adaptive)
+    order, header = _find_header(pixels, w, h, password, bits_per_channel, adaptive, img, order_version)
+    _checkpoint(progress, cancel, 'order', w*h, w*h)
+    size, flags = header[1], header[3]
+    header_bits, header_adaptive, _ = decode_flags(flags)
+    if (header_bits, header_adaptive) != (bits_per_channel, adaptive):
+        if order_version == ORDER_PREAMBLE:
+            raise ValueError("Paramètres de l'entête incohérents avec le préambule")
+        raise ValueError(f"Paramètres de l'entête incohérents avec les paramètres demandés "
+                         f"(bits_per_channel={bits_per_channel}, adaptive={adaptive})")
+    if len(order) * channels * bits_per_channel < (HEADER_SIZE + size) * 8:
         raise ValueError("Bits du payload insuffisants")
+    return pixels, order, bits_per_channel, adaptive, header
 
-    payload_bytes = bytes(int(''.join(payload_bits[i:i+8]),2) for i in range(0,len(payload_bits),8))
-    if not verify_payload(payload_bytes, checksum):
-        raise ValueError("Checksum mismatch")
+def _read_extensions(pixels, order, bits_per_channel, flags, size, hasher):
+    """Bloc d'extensions éventuel en tête du payload (couvert par le checksum) : (taille, champs)."""
+    if not flags & FLAG_EXTENDED:
+        return 0, {}
+    length = _read_payload(pixels, order, bits_per_channel, 0, 2)
+    start = 2 + int.from_bytes(length, 'big')
+    if start > size:
+        raise ValueError("Bloc d'extensions tronqué")
+    block = _read_payload(pixels, order, bits_per_channel, 0, start)
+    hasher.update(block)
+    return start, parse_extensions(block)
 
-    # Déchiffrement si le flag encrypted est activé
-    if encrypted:
-        if not password:
-            raise ValueError("Cette image est chiffrée — un mot de passe est requis")
-        payload_bytes = decrypt_payload(payload_bytes, password)
+def _write_payload(chunks, hasher, checksum, encrypted, password, extensions, out_file_path):
+    """Déchiffre et décompresse au fil des blocs le payload (sans son bloc d'extensions) vers la sortie.
 
-    import gzip
-    try:
-        data = gzip.decompress(payload_bytes)
-    except Exception as e:
-        raise ValueError(f"Erreur décompression: {e}")
+    chunks met à jour hasher au passage ; le checksum est vérifié à la fin.
+    Retourne le nombre d'octets écrits.
+    """
+    kdf = unpack_kdf(extensions[EXT_KDF]) if EXT_KDF in extensions else DEFAULT_KDF
+    method = extensions[EXT_COMPRESSION][0] if EXT_COMPRESSION in extensions else COMP_GZIP
+    data = decrypt_chunks(chunks, password, kdf) if encrypted else chunks
+    written = 0
+    with _atomic_output(out_file_path) as f:
+        try:
+            for piece in decompress_chunks(data, method):
+                f.write(piece)
+                written += len(piece)
+        except ValueError:
+            # Un payload corrompu est signalé comme tel, même s'il casse d'abord
+            # le déchiffrement ou la décompression
+            for _ in chunks:
+                pass
+            if hasher.digest() != checksum:
+                raise ValueError("Checksum mismatch")
+            if encrypted:
+                raise ValueError("Déchiffrement échoué — mot de passe incorrect ou données corrompues")
+            raise
+        if hasher.digest() != checksum:
+            raise ValueError("Checksum mismatch")
+    return written
+
+def extract_file_from_image(image_path, out_file_path, password=None, bits_per_channel=None, adaptive=None,
+                            order_version=None, progress=None, cancel=None):
+    """Extrait le fichier caché.
+
+    Si l'image a un préambule, bits_per_channel et adaptive y sont lus et les
+    valeurs données sont ignorées. Sinon (anciennes images) elles sont utilisées,
+    avec 1 et False par défaut, et order_version=None essaie l'ordre à clé puis
+    l'ordre historique.
+
+    progress(stage, done, total) : 'order' (pixels ordonnés) puis 'extract'
+    (octets du payload lus). cancel (threading.Event) interrompt avec Cancelled ;
+    le fichier de sortie partiel est alors supprimé.
+    """
+    if bits_per_channel not in (None,) + BITS_PER_CHANNEL:
+        raise ValueError("bits_per_channel must be between 1 and 4")
+
+    pixels, order, bits_per_channel, adaptive, (magic, size, checksum, flags) = _open_stego(
+        image_path, password, bits_per_channel, adaptive, order_version, progress, cancel)
+    _, _, encrypted = decode_flags(flags)
+    if encrypted and not password:
+        raise ValueError("Cette image est chiffrée — un mot de passe est requis")
+
+    hasher = hashlib.sha256()
+    start, extensions = _read_extensions(pixels, order, bits_per_channel, flags, size, hasher)
+    if EXT_SHARD in extensions:
+        raise ValueError("Cette image ne contient qu'un fragment — extraire l'ensemble avec extract_file_from_images")
+
+    # Lecture, hachage, déchiffrement et décompression au fil des blocs
+    chunks = _payload_chunks(pixels, order, bits_per_channel, start, size, hasher,
+                             progress=progress, cancel=cancel)
+    written = _write_payload(chunks, hasher, checksum, encrypted, password, extensions, out_file_path)
+    return {'out_file': out_file_path, 'size': written,
+            'bits_per_channel': bits_per_channel, 'adaptive': adaptive}
+
+# ---------- Plusieurs images ----------
+# Un payload trop grand pour une image est préparé une fois puis découpé en
+# fragments, chacun inséré comme un payload ordinaire (avec préambule) dont le
+# bloc d'extensions porte EXT_SHARD : identifiant du lot, indice, nombre de
+# fragments et entête du payload complet.
+
+SHARD_OVERHEAD = 2 + 2 + SHARD_SIZE  # bloc d'extensions d'un fragment
+
+def _shard_bounds(total, capacities):
+    """Découpe total octets proportionnellement aux capacités : [(offset, longueur)]."""
+    whole = sum(capacities)
+    bounds, acc = [0], 0
+    for cap in capacities:
+        acc += cap
+        bounds.append(total * acc // whole if whole else 0)
+    return [(a, b - a) for a, b in zip(bounds, bounds[1:])]
+
+def _run_jobs(func, jobs, workers=None):
+    """func(*job) pour chaque job, dans un pool de processus ; résultats dans l'ordre des jobs."""
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        return [func(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(func, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+def _embed_shard(image_path, out_path, payload_path, offset, length, shard_field, encrypted,
+                 password, bits_per_channel, adaptive, carrier='auto'):
+    pixels = load_carrier(image_path, carrier)
+    stream = ShardStream(payload_path, offset, length, shard_field, encrypted)
+    info = _embed_stream(pixels, out_path, stream, length, password, bits_per_channel, adaptive, ORDER_PREAMBLE)
+    info['shard_bytes'] = length
+    return info
+
+def embed_file_into_images(image_paths, out_paths, file_path, password=None, bits_per_channel=1, adaptive=False,
+                           kdf=DEFAULT_KDF, compression='auto', workers=None, carrier='auto'):
+    """Répartit file_path sur plusieurs images (une image PNG de sortie par cover, dans le même ordre).
+
+    Le payload (compressé, chiffré si password) est découpé proportionnellement
+    à la capacité de chaque cover (canaux porteurs selon carrier) ; les
+    fragments sont insérés en parallèle dans un pool de workers processus.
+    """
+    if bits_per_channel not in BITS_PER_CHANNEL:
+        raise ValueError("bits_per_channel must be between 1 and 4")
+    if not image_paths or len(image_paths) != len(out_paths):
+        raise ValueError("Il faut une image de sortie par image cover")
+    if len(image_paths) > 0xFFFF:
+        raise ValueError("Trop d'images (65535 au maximum)")
+
+    capacities = []
+    for path in image_paths:
+        with Image.open(path) as img:  # seul l'entête du fichier est lu
+            cap = payload_capacity(img.size, bits_per_channel, channels=carrier_channels(img, carrier))
+            capacities.append(max(0, cap - HEADER_SIZE - SHARD_OVERHEAD))
+    stream = PayloadStream(file_path, password, kdf=kdf, compression=compression)
+    with tempfile.TemporaryDirectory() as tmp:
+        payload_path = os.path.join(tmp, 'payload')
+        with open(payload_path, 'wb') as f:
+            for chunk in stream:
+                f.write(chunk)
+        if stream.size > sum(capacities):
+            raise ValueError(f"Capacité insuffisante: {stream.size} > {sum(capacities)} bytes")
+        set_id = os.urandom(16)
+        set_header = stream.header(encode_flags(0, False, stream.encrypted))
+        jobs = [(image_paths[i], out_paths[i], payload_path, offset, length,
+                 pack_shard(set_id, i, len(image_paths), set_header), stream.encrypted,
+                 password, bits_per_channel, adaptive, carrier)
+                for i, (offset, length) in enumerate(_shard_bounds(stream.size, capacities))]
+        shards = _run_jobs(_embed_shard, jobs, workers)
+    return {'set_id': set_id.hex(), 'payload_bytes': stream.size, 'shards': shards}
+
+def _extract_shard(image_path, tmp_path, password):
+    """Lit un fragment vers tmp_path après vérification de son checksum."""
+    pixels, order, bits_per_channel, _, (_, size, checksum, flags) = _open_stego(
+        image_path, password, None, None, ORDER_PREAMBLE)
+    hasher = hashlib.sha256()
+    start, extensions = _read_extensions(pixels, order, bits_per_channel, flags, size, hasher)
+    if EXT_SHARD not in extensions:
+        raise ValueError(f"{image_path}: cette image ne contient pas de fragment")
+    set_id, index, count, set_header = unpack_shard(extensions[EXT_SHARD])
+    with open(tmp_path, 'wb') as f:
+        for chunk in _payload_chunks(pixels, order, bits_per_channel, start, size, hasher):
+            f.write(chunk)
+    if hasher.digest() != checksum:
+        raise ValueError(f"{image_path}: Checksum mismatch")
+    return {'image': image_path, 'path': tmp_path, 'set_id': set_id, 'index': index,
+            'count': count, 'set_header': set_header}
+
+def _hashed(chunks, hasher):
+    for chunk in chunks:
+        hasher.update(chunk)
+        yield chunk
+
+def _split_extensions(chunks):
+    """Sépare le bloc d'extensions en tête d'un flux : (champs, flux restant)."""
+    chunks = iter(chunks)
+    buf = b''
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) >= 2 and len(buf) >= 2 + int.from_bytes(buf[:2], 'big'):
+            break
+    if len(buf) < 2:
+        raise ValueError("Bloc d'extensions tronqué")
+    end = 2 + int.from_bytes(buf[:2], 'big')
+    return parse_extensions(buf[:end]), _prepend(buf[end:], chunks)
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
+
+def extract_file_from_images(image_paths, out_file_path, password=None, workers=None):
+    """Reconstitue un fichier réparti par embed_file_into_images ; les images sont données dans n'importe quel ordre.
+
+    Les fragments sont lus et vérifiés en parallèle (fichiers temporaires), puis
+    enchaînés par indice, déchiffrés et décompressés au fil des blocs vers la sortie.
+    """
+    if not image_paths:
+        raise ValueError("Aucune image")
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = [(path, os.path.join(tmp, f"{i}.part"), password) for i, path in enumerate(image_paths)]
+        shards = _run_jobs(_extract_shard, jobs, workers)
 
-    with open(out_file_path,'wb') as f:
-        f.write(data)
+        first = shards[0]
+        if any(s['set_id'] != first['set_id'] or s['set_header'] != first['set_header'] for s in shards):
+            raise ValueError("Les images n'appartiennent pas au même lot")
+        by_index = {s['index']: s for s in shards}
+        if len(by_index) != len(shards):
+            raise ValueError("Fragment en double")
+        missing = sorted(set(range(first['count'])) - set(by_index))
+        if missing:
+            raise ValueError(f"Fragments manquants: {missing} (sur {first['count']})")
 
-    return {'out_file': out_file_path, 'size': len(data)}
+        _, size, checksum, flags = parse_header_from_bytes(first['set_header'])
+        _, _, encrypted = decode_flags(flags)
+        if encrypted and not password:
+            raise ValueError("Ces images sont chiffrées — un mot de passe est requis")
+        hasher = hashlib.sha256()
+        chunks = _hashed((chunk for i in range(first['count']) for chunk in read_chunks(by_index[i]['path'])),
+                         hasher)
+        extensions = {}
+        if flags & FLAG_EXTENDED:
+            extensions, chunks = _split_extensions(chunks)
+        written = _write_payload(chunks, hasher, checksum, encrypted, password, extensions, out_file_path)
+    return {'out_file': out_file_path, 'size': written, 'shards': first['count'],
+            'set_id': first['set_id'].hex()}
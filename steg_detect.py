@@ -1,31 +1,73 @@
 import argparse
+import csv
+import hashlib
+import json
+import math
 import os
 import pickle
-import cv2
+import sqlite3
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
-from scipy.stats import chisquare
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
 
 # ----- Paths des modèles -----
 MODEL_PATH = "stego_model.pkl"
 SCALER_PATH = "scaler.pkl"
+FEATURE_CACHE_PATH = "features_cache.sqlite"
+
+# Version du schéma de features : à incrémenter à chaque changement des features.
+# Les modèles enregistrent la version avec laquelle ils ont été entraînés
+# (clf.feature_version_) ; un modèle sans cet attribut date de la version 1.
+FEATURE_VERSION = 3
+
+STRUCTURAL_SAMPLE = 1 << 20  # pixels par canal analysés par RS et SPA
 
 # ---------- Feature extraction ----------
-def extract_features(path):
+def extract_features(path, version=FEATURE_VERSION):
     """
     Extrait 9 features pour chaque image : LSB ratio, bruit, chi-square par canal RGB
     """
+    import cv2
     img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
     if img is None:
         raise ValueError(f"Image invalide ou introuvable: {path}")
+    return features_from_image(img, version)
+
+def extract_features_from_bytes(data, version=FEATURE_VERSION):
+    """
+    Comme extract_features, pour une image encodée reçue en mémoire (PNG, BMP...)
+    """
+    import cv2
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("Image invalide ou format non supporté")
+    return features_from_image(img, version)
 
-    # Convertir toute image en RGB (3 canaux)
+def features_from_image(img, version=FEATURE_VERSION):
+    """
+    Features d'une image déjà décodée (tableau OpenCV, ordre BGR)
+    """
+    if version not in FEATURE_SETS:
+        raise ValueError(f"Version de features inconnue: {version}")
+    return FEATURE_SETS[version](_to_bgr(img))
+
+def _to_bgr(img):
+    import cv2
+    # Convertir toute image en 3 canaux
     if len(img.shape) == 2:  # Grayscale
         img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
     elif img.shape[2] == 4:  # RGBA -> RGB
         img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
 
+def _features_v1(img):
+    """
+    Features d'origine, canal par canal (conservées pour les modèles version 1).
+    Le bruit est calculé en uint8 : les différences négatives débordent.
+    """
+    import cv2
     channels = cv2.split(img)
     feats = []
     for ch in channels:
@@ -34,90 +76,833 @@ def extract_features(path):
         noise = np.mean(np.abs(ch - cv2.GaussianBlur(ch, (5,5), 0)))
         hist = cv2.calcHist([ch],[0],None,[256],[0,256]).flatten()
         hist_norm = hist / hist.sum()
-        chi = chisquare(hist_norm + 1e-6)[0]
+        chi = _chisquare_uniform(hist_norm + 1e-6)
         feats.extend([lsb_ratio, noise, chi])
 
     return np.array(feats, dtype=np.float32)
 
+def _chisquare_uniform(observed):
+    """Statistique de scipy.stats.chisquare(observed) : attendu uniforme (moyenne)"""
+    observed = np.asarray(observed, dtype=np.float64)
+    expected = observed.mean()
+    return float(((observed - expected) ** 2 / expected).sum())
+
+def _features_v2(img):
+    """
+    Mêmes 9 features pour les trois canaux à la fois : un seul flou multi-canal,
+    bruit = |pixel - flou| exact (sans débordement uint8), LSB ratio lu sur les
+    histogrammes et chi-square calculé en NumPy sur la matrice (3, 256)
+    """
+    return _base_features(img)[0]
+
+def _features_v3(img):
+    """
+    Features version 2 suivies, pour chaque canal, des trois attaques LSB
+    classiques : probabilité POV, taux estimé par RS, taux estimé par SPA
+    """
+    feats, hist = _base_features(img)
+    sample = _structural_sample(img)
+    attacks = np.stack([pov_probability(hist), rs_rate(sample), spa_rate(sample)], axis=1)
+    return np.concatenate([feats, attacks.ravel().astype(np.float32)])
+
+def _base_features(img):
+    import cv2
+    if img.dtype != np.uint8:
+        raise ValueError(f"Profondeur non supportée: {img.dtype}")
+    blur = cv2.GaussianBlur(img, (5, 5), 0)
+    noise = np.array(cv2.sumElems(cv2.absdiff(img, blur))[:3])
+    hist = _histograms(img)
+    return _base_vector(hist, noise, img.shape[0] * img.shape[1]), hist
+
+def _histograms(img):
+    import cv2
+    return np.stack([cv2.calcHist([img], [c], None, [256], [0, 256]).ravel() for c in range(3)])
+
+def _base_vector(hist, noise_sum, n):
+    """9 features de base à partir des histogrammes et de la somme des |pixel - flou|"""
+    noise = noise_sum / n
+    lsb_ratio = hist[:, 1::2].sum(axis=1) / n
+    observed = hist / n + 1e-6
+    expected = observed.mean(axis=1, keepdims=True)
+    chi = ((observed - expected) ** 2 / expected).sum(axis=1)
+    return np.stack([lsb_ratio, noise, chi], axis=1).ravel().astype(np.float32)
+
+FEATURE_SETS = {1: _features_v1, 2: _features_v2, 3: _features_v3}
+
+# ---------- Structural LSB attacks ----------
+def _structural_sample(img):
+    """
+    Plans (canaux, lignes, largeur) contigus de lignes régulièrement espacées :
+    au plus STRUCTURAL_SAMPLE pixels par canal, voisinage horizontal conservé
+    """
+    step = _structural_step(img.shape[0], img.shape[1])
+    return np.ascontiguousarray(img[::step].transpose(2, 0, 1))
+
+def _structural_step(h, w):
+    """Pas entre les lignes gardées par _structural_sample (aussi appliqué par le mode tuilé)"""
+    return max(1, -(-h * w // STRUCTURAL_SAMPLE))
+
+def pov_probability(hist, min_count=5):
+    """
+    Test chi-square des paires de valeurs (Westfeld) sur des histogrammes (canaux, 256).
+    Retourne, par canal, la probabilité que les paires (2k, 2k+1) soient égalisées,
+    c'est-à-dire que le canal soit entièrement rempli par un message LSB
+    """
+    hist = np.atleast_2d(np.asarray(hist, dtype=np.float64))
+    even, odd = hist[:, 0::2], hist[:, 1::2]
+    expected = (even + odd) / 2
+    valid = expected >= min_count
+    safe = np.where(valid, expected, 1)
+    chi = np.where(valid, (even - expected) ** 2 / safe, 0).sum(axis=1)
+    df = valid.sum(axis=1) - 1
+    return np.array([_chi2_sf(c, k) if k > 0 else 0.0 for c, k in zip(chi, df)])
+
+def _chi2_sf(chi, df):
+    """
+    P(X > chi) pour X ~ chi2(df) : gamma incomplète régularisée Q(df/2, chi/2),
+    par série ou fraction continue (évite d'importer scipy pour trois valeurs)
+    """
+    a, x = df / 2, chi / 2
+    if x <= 0:
+        return 1.0
+    prefix = math.exp(-x + a * math.log(x) - math.lgamma(a))
+    if x < a + 1:
+        term = total = 1 / a
+        for i in range(1, 10000):
+            term *= x / (a + i)
+            total += term
+            if term < total * 1e-16:
+                break
+        return max(0.0, 1 - prefix * total)
+    tiny = 1e-300
+    b = x + 1 - a
+    c, d = 1 / tiny, 1 / b
+    h = d
+    for i in range(1, 10000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = b + an / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        if abs(d * c - 1) < 1e-16:
+            break
+    return prefix * h
+
+def _rs_counts(x):
+    """
+    Comptes (R_M - S_M, R_-M - S_-M) pour des groupes de 4 pixels x0..x3 et le masque [0, 1, 1, 0].
+    F1(x) = x + s et F-1(x) = x - s avec s = 1 - 2 * LSB(x)
+    """
+    s1, s2 = 1 - 2 * (x[1] & 1), 1 - 2 * (x[2] & 1)
+    d01, d12, d23 = x[1] - x[0], x[2] - x[1], x[3] - x[2]
+    base = np.abs(d01) + np.abs(d12) + np.abs(d23)
+    out = []
+    for k in (1, -1):
+        f = np.abs(d01 + k * s1) + np.abs(d12 + k * (s2 - s1)) + np.abs(d23 - k * s2)
+        out.append(np.count_nonzero(f > base) - np.count_nonzero(f < base))
+    return out
+
+def _rs_stats(planes):
+    """
+    Comptes RS additifs d'un tableau (canaux, h, w) uint8 : (d (4, canaux), nombre de groupes).
+    Des comptes de plusieurs régions s'additionnent avant _rs_solve
+    """
+    w = planes.shape[2] // 4 * 4
+    d = np.zeros((4, len(planes)), dtype=np.int64)
+    for c, plane in enumerate(planes):
+        x = [plane[:, k:w:4].astype(np.int16) for k in range(4)]
+        d[0:2, c] = _rs_counts(x)
+        d[2:4, c] = _rs_counts([xi ^ 1 for xi in x])  # image aux LSB inversés
+    return d, planes.shape[1] * (w // 4)
+
+def _rs_solve(d, groups):
+    d0, dn0, d1, dn1 = np.asarray(d, dtype=np.float64) / max(groups, 1)
+    a = 2 * (d1 + d0)
+    b = dn0 - dn1 - d1 - 3 * d0
+    c = d0 - dn0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        disc = np.sqrt(np.maximum(b * b - 4 * a * c, 0))
+        roots = np.stack([(-b + disc) / (2 * a), (-b - disc) / (2 * a)])
+        x = np.where(np.abs(a) > 1e-12,
+                     np.take_along_axis(roots, np.abs(roots).argmin(axis=0)[None], axis=0)[0],
+                     -c / b)
+        rate = x / (x - 0.5)
+    return np.clip(np.nan_to_num(rate), 0.0, 1.0)
+
+def rs_rate(planes):
+    """
+    Analyse RS (Fridrich) : taux d'insertion LSB estimé (0 à 1) pour chaque plan
+    d'un tableau (canaux, h, w) uint8
+    """
+    return _rs_solve(*_rs_stats(planes))
+
+def _spa_stats(planes):
+    """
+    Comptes SPA additifs (x, y, gamma) par canal et nombre de paires horizontales
+    """
+    counts = np.zeros((3, len(planes)), dtype=np.int64)
+    for c, plane in enumerate(planes):
+        u, v = plane[:, :-1], plane[:, 1:]
+        odd = (v & 1).astype(bool)
+        lower, higher = u < v, u > v
+        counts[:, c] = (np.count_nonzero((lower & ~odd) | (higher & odd)),
+                        np.count_nonzero((higher & ~odd) | (lower & odd)),
+                        np.count_nonzero((u >> 1) == (v >> 1)))
+    return counts, planes.shape[1] * max(planes.shape[2] - 1, 0)
+
+def _spa_solve(counts, n):
+    x, y, gamma = np.asarray(counts, dtype=np.float64)
+    # gamma/2 p^2 + (2x - n) p + y - x = 0, plus petite racine
+    a, b, c = gamma / 2, 2 * x - n, y - x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        disc = np.sqrt(np.maximum(b * b - 4 * a * c, 0))
+        rate = np.minimum((-b + disc) / (2 * a), (-b - disc) / (2 * a))
+    return np.clip(np.nan_to_num(rate), 0.0, 1.0)
+
+def spa_rate(planes):
+    """
+    Sample pair analysis (Dumitrescu, Wu, Wang) : taux d'insertion LSB estimé (0 à 1)
+    pour chaque plan d'un tableau (canaux, h, w) uint8, paires horizontales
+    """
+    return _spa_solve(*_spa_stats(planes))
+
+def lsb_attacks(path):
+    """
+    Estimations par canal (ordre B, G, R) des trois attaques : {'pov', 'rs', 'spa'}
+    """
+    import cv2
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError(f"Image invalide ou introuvable: {path}")
+    img = _to_bgr(img)
+    if img.dtype != np.uint8:
+        raise ValueError(f"Profondeur non supportée: {img.dtype}")
+    hist = _histograms(img)
+    sample = _structural_sample(img)
+    return {"pov": pov_probability(hist), "rs": rs_rate(sample), "spa": spa_rate(sample)}
+
+def model_feature_version(model):
+    """
+    Version des features attendue par un modèle (clf, scaler) ; version courante sans modèle
+    """
+    clf = model[0]
+    if clf is None:
+        return FEATURE_VERSION
+    return getattr(clf, "feature_version_", 1)
+
+# ---------- Tiled analysis ----------
+TILE_SIZE = 512       # côté des tuiles (multiple de 4 : groupes RS alignés)
+EARLY_MIN_TILES = 8   # tuiles analysées avant tout arrêt anticipé
+
+def open_image_array(path):
+    """
+    Image (h, w, 3) BGR uint8. Un BMP 24/32 bits non compressé est projeté en
+    mémoire (np.memmap) : seules les tuiles lues sont chargées. Les autres formats
+    sont décodés entièrement ; les modes réduits de cv2.imread (IMREAD_REDUCED_*)
+    ne sont pas utilisés car le sous-échantillonnage détruit les LSB
+    """
+    import cv2
+    img = _bmp_memmap(path)
+    if img is not None:
+        return img
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError(f"Image invalide ou introuvable: {path}")
+    img = _to_bgr(img)
+    if img.dtype != np.uint8:
+        raise ValueError(f"Profondeur non supportée: {img.dtype}")
+    return img
+
+def _bmp_memmap(path):
+    try:
+        with open(path, "rb") as f:
+            head = f.read(54)
+    except OSError:
+        return None
+    if len(head) < 54 or head[:2] != b"BM":
+        return None
+    offset, = struct.unpack_from("<I", head, 10)
+    dib, width, height, _, bpp, compression = struct.unpack_from("<IiiHHI", head, 14)
+    if dib < 40 or bpp not in (24, 32) or compression != 0 or width <= 0 or height == 0:
+        return None
+    channels = bpp // 8
+    stride = (width * channels + 3) // 4 * 4
+    rows = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(abs(height), stride))
+    img = rows[:, :width * channels].reshape(abs(height), width, channels)[..., :3]
+    return img[::-1] if height > 0 else img  # lignes stockées de bas en haut si height > 0
+
+def _tile_stats(img, y0, y1, x0, x1, step=1):
+    """
+    Statistiques additives d'une tuile. Une marge de 2 pixels rend le flou identique
+    à celui de l'image entière ; une colonne de plus garde les paires SPA à cheval.
+    RS et SPA ne lisent que les lignes multiples de step (de l'image), comme _structural_sample
+    """
+    import cv2
+    h, w = img.shape[:2]
+    ry0, rx0 = max(y0 - 2, 0), max(x0 - 2, 0)
+    region = np.ascontiguousarray(img[ry0:min(y1 + 2, h), rx0:min(x1 + 2, w)])
+    iy, ix = y0 - ry0, x0 - rx0
+    th, tw = y1 - y0, x1 - x0
+    tile = region[iy:iy + th, ix:ix + tw]
+    blur = cv2.GaussianBlur(region, (5, 5), 0)[iy:iy + th, ix:ix + tw]
+    noise = np.array(cv2.sumElems(cv2.absdiff(tile, blur))[:3])
+    rows = slice(iy + (-y0) % step, iy + th, step)
+    planes = np.ascontiguousarray(region[rows, ix:ix + tw + (x1 < w)].transpose(2, 0, 1))
+    return _histograms(tile), noise, _rs_stats(planes[:, :, :tw]), _spa_stats(planes)
+
+def analyze_tiled(path, tile=TILE_SIZE, early_stop=False, version=FEATURE_VERSION):
+    """
+    Analyse une image tuile par tuile : la mémoire reste bornée par la taille des tuiles
+    (hors décodage des formats compressés). Les statistiques des tuiles s'additionnent
+    en features globales, identiques à celles de l'image entière : RS/SPA lisent les
+    mêmes lignes que _structural_sample.
+    early_stop : tuiles visitées dans un ordre dispersé, arrêt dès que le taux
+    estimé global dépasse RATE_FULL (une image propre est toujours lue en entier)
+    Retourne {'features', 'heatmap' (suspicion par tuile, NaN si non analysée),
+    'tiles', 'total_tiles', 'early_stop'}
+    """
+    if version < 2:
+        raise ValueError("Le mode tuilé nécessite des features version 2 ou plus")
+    img = open_image_array(path)
+    h, w = img.shape[:2]
+    tile = max(4, int(tile) // 4 * 4)
+    ny, nx = -(-h // tile), -(-w // tile)
+    heatmap = np.full((ny, nx), np.nan)
+    hist, noise = np.zeros((3, 256)), np.zeros(3)
+    rs_d, rs_groups = np.zeros((4, 3), dtype=np.int64), 0
+    spa_c, spa_pairs = np.zeros((3, 3), dtype=np.int64), 0
+    step = _structural_step(h, w)
+    order = np.random.default_rng(0).permutation(ny * nx) if early_stop else range(ny * nx)
+
+    done, stopped = 0, False
+    for k in order:
+        ty, tx = divmod(int(k), nx)
+        y0, x0 = ty * tile, tx * tile
+        t_hist, t_noise, (t_rs, t_groups), (t_spa, t_pairs) = _tile_stats(
+            img, y0, min(y0 + tile, h), x0, min(x0 + tile, w), step)
+        hist += t_hist
+        noise += t_noise
+        rs_d += t_rs
+        rs_groups += t_groups
+        spa_c += t_spa
+        spa_pairs += t_pairs
+        rate = (_rs_solve(t_rs, t_groups).mean() + _spa_solve(t_spa, t_pairs).mean()) / 2
+        heatmap[ty, tx] = rate_suspicion(rate)
+        done += 1
+        if early_stop and done >= EARLY_MIN_TILES and done < ny * nx:
+            rate = (_rs_solve(rs_d, rs_groups).mean() + _spa_solve(spa_c, spa_pairs).mean()) / 2
+            if rate >= RATE_FULL:
+                stopped = True
+                break
+
+    feats = _base_vector(hist, noise, hist[0].sum())
+    if version >= 3:
+        attacks = np.stack([pov_probability(hist), _rs_solve(rs_d, rs_groups),
+                            _spa_solve(spa_c, spa_pairs)], axis=1)
+        feats = np.concatenate([feats, attacks.ravel().astype(np.float32)])
+    return {"features": feats, "heatmap": heatmap, "tiles": done, "total_tiles": ny * nx,
+            "early_stop": stopped}
+
+def extract_features_tiled(path, version=FEATURE_VERSION, tile=TILE_SIZE):
+    """
+    Comme extract_features, en mode tuilé (même schéma de features, version 2 ou plus)
+    """
+    return analyze_tiled(path, tile, version=version)["features"]
+
+def save_heatmap(heatmap, path):
+    """
+    Enregistre la carte de suspicion : .npy brut, sinon image en niveaux de gris
+    (blanc = suspect, tuiles non analysées en noir)
+    """
+    import cv2
+    if path.lower().endswith(".npy"):
+        np.save(path, heatmap)
+        return
+    img = (np.nan_to_num(heatmap) * 255).round().astype(np.uint8)
+    scale = max(1, 256 // max(img.shape))
+    img = cv2.resize(img, (img.shape[1] * scale, img.shape[0] * scale), interpolation=cv2.INTER_NEAREST)
+    if not cv2.imwrite(path, img):
+        raise ValueError(f"Impossible d'écrire la carte: {path}")
+
 # ---------- Heuristic score ----------
+# Taux estimé (RS/SPA) en dessous duquel on reste dans le bruit des covers naturelles,
+# et au-delà duquel le terme structurel est plein
+RATE_FLOOR = 0.02
+RATE_FULL = 0.10
+
+def rate_suspicion(rate):
+    """Taux d'insertion estimé ramené à une suspicion [0-1]"""
+    return np.clip((rate - RATE_FLOOR) / (RATE_FULL - RATE_FLOOR), 0.0, 1.0)
+
 def heuristic_score(feat):
     """
-    Retourne un score heuristique [0-1] basé sur LSB, bruit et chi-square
+    Retourne un score heuristique [0-1] basé sur LSB, bruit et chi-square.
+    Avec les features version 3, le terme de bruit est remplacé par les attaques
+    structurelles : max(probabilité POV, taux RS/SPA moyen ramené à [0, 1])
     """
-    lsb = np.mean(feat[0::3])
-    noise = np.mean(feat[1::3])
-    chi = np.mean(feat[2::3])
+    base = feat[:9]
+    lsb = np.mean(base[0::3])
+    noise = np.mean(base[1::3])
+    chi = np.mean(base[2::3])
 
     score = 0
     if abs(lsb - 0.5) < 0.03:
         score += 0.4
-    if noise > 6:
+    if len(feat) >= 18:
+        attacks = np.reshape(feat[9:18], (3, 3))
+        score += 0.4 * max(np.max(attacks[:, 0]), float(rate_suspicion(np.mean(attacks[:, 1:]))))
+    elif noise > 6:
         score += 0.4
     if chi < 0.05:
         score += 0.2
 
     return min(score, 1.0)
 
+def heuristic_scores(X):
+    """
+    Version vectorisée de heuristic_score pour une matrice (n_images, n_features)
+    """
+    X = np.asarray(X, dtype=np.float64)
+    base = X[:, :9]
+    lsb = base[:, 0::3].mean(axis=1)
+    noise = base[:, 1::3].mean(axis=1)
+    chi = base[:, 2::3].mean(axis=1)
+    if X.shape[1] >= 18:
+        attacks = X[:, 9:18].reshape(-1, 3, 3)
+        structural = np.maximum(attacks[:, :, 0].max(axis=1),
+                                rate_suspicion(attacks[:, :, 1:].mean(axis=(1, 2))))
+    else:
+        structural = (noise > 6).astype(np.float64)
+    score = 0.4 * (np.abs(lsb - 0.5) < 0.03) + 0.4 * structural + 0.2 * (chi < 0.05)
+    return np.minimum(score, 1.0)
+
+# ---------- Parallel extraction ----------
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.jpg', '.jpeg', '.tif', '.tiff', '.webp')
+
+def list_images(directory, extensions=IMAGE_EXTENSIONS):
+    """
+    Parcourt récursivement directory et retourne les images (extension filtrée), triées
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for f in sorted(files):
+            if f.lower().endswith(tuple(extensions)):
+                paths.append(os.path.join(root, f))
+    return paths
+
+def _safe_features(path, version=FEATURE_VERSION, tile=None):
+    """
+    extract_features (ou extract_features_tiled si tile) sans exception :
+    retourne (features ou None, message d'erreur)
+    """
+    try:
+        if tile:
+            return extract_features_tiled(path, version, tile), None
+        return extract_features(path, version), None
+    except Exception as e:
+        return None, str(e)
+
+def _init_worker():
+    import cv2
+    # Un thread OpenCV par processus : le parallélisme vient du pool
+    cv2.setNumThreads(1)
+
+def _pool_map(task, paths, workers, pool=None):
+    if not paths or (pool is None and (workers <= 1 or len(paths) <= 1)):
+        return [task(p) for p in paths]
+    chunksize = max(1, min(64, len(paths) // (workers * 4)))
+    if pool is not None:
+        return list(pool.map(task, paths, chunksize=chunksize))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return list(pool.map(task, paths, chunksize=chunksize))
+
+def _compute_features(paths, workers, pool=None, version=FEATURE_VERSION, tile=None):
+    return _pool_map(partial(_safe_features, version=version, tile=tile), paths, workers, pool)
+
+def extract_features_parallel(paths, workers=None, cache=None, pool=None, version=FEATURE_VERSION,
+                              tile=None):
+    """
+    Extrait les features de chaque image sur un pool de processus.
+    Avec un FeatureCache, seules les images nouvelles ou modifiées sont recalculées.
+    pool : ProcessPoolExecutor déjà ouvert, réutilisé d'un appel à l'autre
+    version : schéma de features (celui du modèle utilisé)
+    tile : côté des tuiles pour le mode tuilé (mémoire bornée), None = image entière
+    Retourne une liste de (path, features ou None, erreur ou None), dans l'ordre de paths
+    """
+    workers = workers or os.cpu_count() or 1
+    if cache is None:
+        results = _compute_features(paths, workers, pool, version, tile)
+        return [(p, feat, err) for p, (feat, err) in zip(paths, results)]
+
+    keys = cache.file_hashes(paths, workers, pool)
+    mode = cache_mode(tile)
+    found = cache.get_many([k for k in keys.values() if k], version, mode)
+    missing = [p for p in paths if keys[p] not in found]
+    computed = dict(zip(missing, _compute_features(missing, workers, pool, version, tile)))
+    cache.put_many([(keys[p], feat) for p, (feat, _) in computed.items() if feat is not None], version, mode)
+
+    out = []
+    for p in paths:
+        if p in computed:
+            out.append((p,) + tuple(computed[p]))
+        else:
+            out.append((p, found[keys[p]], None))
+    return out
+
+# ---------- Feature cache ----------
+CACHE_SCHEMA = 2  # PRAGMA user_version ; table features d'un schéma plus ancien recréée
+
+def cache_mode(tile=None):
+    """Mode d'extraction enregistré avec les features : 'full' ou 'tile:<côté>'"""
+    return f"tile:{int(tile)}" if tile else "full"
+
+def _file_digest(path):
+    """(taille, mtime_ns, sha256) du fichier, None s'il est illisible ; exécuté dans les workers"""
+    try:
+        st = os.stat(path)
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, h.hexdigest()
+
+class FeatureCache:
+    """
+    Cache SQLite des features, indexé par sha256 du fichier + version des features
+    + mode d'extraction (image entière ou tuilée, voir cache_mode).
+    Une table (path, taille, mtime) -> sha256 évite de relire les fichiers inchangés
+    """
+
+    def __init__(self, path=FEATURE_CACHE_PATH, version=FEATURE_VERSION):
+        self.version = version
+        self.db = sqlite3.connect(path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA:
+            self.db.execute("DROP TABLE IF EXISTS features")
+            self.db.execute(f"PRAGMA user_version = {CACHE_SCHEMA}")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, "
+                        "mtime_ns INTEGER, hash TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS features (hash TEXT, version INTEGER, mode TEXT, "
+                        "vector BLOB, PRIMARY KEY (hash, version, mode))")
+        self.db.commit()
+
+    def file_hash(self, path):
+        """sha256 du contenu (None si le fichier est illisible)"""
+        return self.file_hashes([path])[path]
+
+    def file_hashes(self, paths, workers=1, pool=None):
+        """
+        Retourne {path: sha256 ou None}. Les fichiers inchangés (taille, mtime) sont
+        résolus par la table files ; les autres sont hachés sur le pool
+        """
+        hashes, todo = {}, []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                hashes[path] = None
+                continue
+            row = self.db.execute("SELECT size, mtime_ns, hash FROM files WHERE path = ?",
+                                  (os.path.abspath(path),)).fetchone()
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                hashes[path] = row[2]
+            else:
+                todo.append(path)
+        rows = []
+        for path, entry in zip(todo, _pool_map(_file_digest, todo, workers, pool)):
+            hashes[path] = entry and entry[2]
+            if entry:
+                rows.append((os.path.abspath(path),) + entry)
+        if rows:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", rows)
+            self.db.commit()
+        return hashes
+
+    def get_many(self, hashes, version=None, mode="full"):
+        """Retourne {hash: features} pour les hashs présents dans le cache"""
+        version = self.version if version is None else version
+        found = {}
+        hashes = list(set(hashes))
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT hash, vector FROM features WHERE version = ? AND mode = ? "
+                f"AND hash IN ({','.join('?' * len(part))})",
+                [version, mode] + part)
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32).copy()
+        return found
+
+    def put_many(self, entries, version=None, mode="full"):
+        version = self.version if version is None else version
+        self.db.executemany("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?)",
+                            [(h, version, mode, np.asarray(f, dtype=np.float32).tobytes()) for h, f in entries])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
 # ---------- Training ----------
-def train_model(cover_dir, stego_dir):
+def train_model(cover_dir, stego_dir, workers=None, n_jobs=-1, extensions=IMAGE_EXTENSIONS, cache=None):
     """
     Entraîne un RandomForest sur les images cover (label=0) et stego (label=1)
+    Les dossiers sont parcourus récursivement ; features extraites en parallèle (workers
+    processus) et forêt entraînée sur n_jobs cœurs (-1 = tous)
+    cache : FeatureCache optionnel, seules les images nouvelles ou modifiées sont recalculées
     """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
     X, y = [], []
 
-    for f in os.listdir(cover_dir):
-        path = os.path.join(cover_dir, f)
-        try:
-            X.append(extract_features(path))
-            y.append(0)
-        except Exception as e:
-            print(f"[SKIP] {f}: {e}")
+    labelled = [(p, 0) for p in list_images(cover_dir, extensions)]
+    labelled += [(p, 1) for p in list_images(stego_dir, extensions)]
+    results = extract_features_parallel([p for p, _ in labelled], workers, cache)
 
-    for f in os.listdir(stego_dir):
-        path = os.path.join(stego_dir, f)
-        try:
-            X.append(extract_features(path))
-            y.append(1)
-        except Exception as e:
-            print(f"[SKIP] {f}: {e}")
+    for (path, label), (_, feat, err) in zip(labelled, results):
+        if feat is None:
+            print(f"[SKIP] {path}: {err}")
+            continue
+        X.append(feat)
+        y.append(label)
 
     X, y = np.array(X), np.array(y)
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
 
-    clf = RandomForestClassifier(n_estimators=300, random_state=42)
+    clf = RandomForestClassifier(n_estimators=300, random_state=42, n_jobs=n_jobs)
     clf.fit(X_scaled, y)
+    clf.feature_version_ = FEATURE_VERSION
 
     pickle.dump(clf, open(MODEL_PATH, "wb"))
     pickle.dump(scaler, open(SCALER_PATH, "wb"))
+    export_model((clf, scaler), compact_model_path())
 
     print("Modèle entraîné et sauvegardé.")
 
+# ---------- Compact model ----------
+COMPACT_FORMAT = 1
+
+def compact_model_path(model_path=None):
+    """Chemin du modèle .npz associé au modèle pickle (stego_model.pkl -> stego_model.npz)"""
+    return os.path.splitext(model_path or MODEL_PATH)[0] + ".npz"
+
+class CompactScaler:
+    """Équivalent de StandardScaler.transform (mêmes arrondis float32)"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+
+    def transform(self, X):
+        X = np.asarray(X)
+        X = np.array(X, dtype=X.dtype if X.dtype in (np.float32, np.float64) else np.float64)
+        X -= self.mean_.astype(X.dtype)
+        X /= self.scale_.astype(X.dtype)
+        return X
+
+class CompactForest:
+    """
+    Forêt aplatie : les nœuds de tous les arbres dans des tableaux communs
+    (enfants en indices absolus, feature < 0 pour une feuille, probabilité de la
+    classe stego par feuille). Évaluée en NumPy, sans sklearn
+    """
+    BLOCK = 4096  # images évaluées par bloc
+
+    def __init__(self, left, right, feature, threshold, proba, roots, feature_version=1):
+        self.left, self.right = left, right
+        self.children = np.stack([left, right], axis=1).ravel()  # 2 * nœud + (x > seuil)
+        self.feature, self.threshold = feature, threshold
+        self.proba, self.roots = proba, roots
+        self.feature_version_ = int(feature_version)
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def predict_proba(self, X):
+        """Moyenne des probabilités des arbres, colonnes (cover, stego) comme sklearn"""
+        X = np.asarray(X, dtype=np.float32)
+        stego = np.empty(len(X))
+        for lo in range(0, len(X), self.BLOCK):
+            stego[lo:lo + self.BLOCK] = self._stego_proba(X[lo:lo + self.BLOCK])
+        return np.stack([1 - stego, stego], axis=1)
+
+    def _stego_proba(self, X):
+        # Un chemin (arbre, image) par élément ; seuls les chemins encore internes avancent
+        values = X.ravel()
+        offsets = np.tile(np.arange(len(X), dtype=np.int64) * X.shape[1], len(self.roots))
+        node = np.repeat(self.roots, len(X))
+        active = np.flatnonzero(self.feature[node] >= 0)
+        while active.size:
+            n = node[active]
+            right = values[offsets[active] + self.feature[n]] > self.threshold[n]
+            n = self.children[2 * n + right]
+            node[active] = n
+            active = active[self.feature[n] >= 0]
+        return self.proba[node].reshape(len(self.roots), len(X)).mean(axis=0)
+
+def export_model(model, path):
+    """
+    Enregistre (RandomForestClassifier, StandardScaler) entraînés dans un .npz
+    (sans pickle) : moyenne/échelle du scaler et arbres aplatis
+    """
+    clf, scaler = model
+    lefts, rights, features, thresholds, probas, roots = [], [], [], [], [], []
+    stego = list(clf.classes_).index(1) if 1 in clf.classes_ else None
+    offset = 0
+    for est in clf.estimators_:
+        tree = est.tree_
+        leaf = tree.children_left < 0
+        lefts.append(np.where(leaf, -1, tree.children_left + offset))
+        rights.append(np.where(leaf, -1, tree.children_right + offset))
+        features.append(np.where(leaf, -1, tree.feature))
+        thresholds.append(tree.threshold)
+        value = tree.value[:, 0, :]
+        totals = value.sum(axis=1)
+        probas.append(value[:, stego] / np.where(totals > 0, totals, 1) if stego is not None
+                      else np.zeros(tree.node_count))
+        roots.append(offset)
+        offset += tree.node_count
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones_like(scaler.mean_)
+    np.savez_compressed(
+        path, format=COMPACT_FORMAT, feature_version=getattr(clf, "feature_version_", 1),
+        left=np.concatenate(lefts).astype(np.int32), right=np.concatenate(rights).astype(np.int32),
+        feature=np.concatenate(features).astype(np.int32), threshold=np.concatenate(thresholds),
+        proba=np.concatenate(probas), roots=np.array(roots, dtype=np.int32),
+        scaler_mean=scaler.mean_, scaler_scale=scale)
+
+def load_compact_model(path):
+    """Charge un modèle .npz : (CompactForest, CompactScaler)"""
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["format"]) != COMPACT_FORMAT:
+            raise ValueError(f"Format de modèle non supporté: {int(data['format'])}")
+        forest = CompactForest(data["left"], data["right"], data["feature"], data["threshold"],
+                               data["proba"], data["roots"], data["feature_version"])
+        scaler = CompactScaler(data["scaler_mean"], data["scaler_scale"])
+    return forest, scaler
+
 # ---------- Prediction ----------
-def predict_image(path):
+SUSPECT_THRESHOLD = 30  # pourcentage au-delà duquel une image est suspecte
+
+def load_model(model_path=None, scaler_path=None):
+    """
+    Charge (clf, scaler) une seule fois ; (None, None) si le modèle n'est pas entraîné.
+    Le modèle .npz (export_model) est préféré aux pickles : pas de sklearn à importer
+    """
+    if model_path and model_path.endswith(".npz"):
+        return load_compact_model(model_path)
+    if not scaler_path and os.path.exists(compact_model_path(model_path)):
+        return load_compact_model(compact_model_path(model_path))
+    model_path = model_path or MODEL_PATH
+    scaler_path = scaler_path or SCALER_PATH
+    if not (os.path.exists(model_path) and os.path.exists(scaler_path)):
+        return None, None
+    with open(model_path, "rb") as f:
+        clf = pickle.load(f)
+    with open(scaler_path, "rb") as f:
+        scaler = pickle.load(f)
+    return clf, scaler
+
+def score_features(X, model=(None, None)):
+    """
+    Scores d'une matrice de features : (heuristique, probabilité ML, score final)
+    Un seul scaler.transform / predict_proba pour tout le lot
+    """
+    X = np.asarray(X, dtype=np.float32)
+    heur = heuristic_scores(X)
+    clf, scaler = model
+    ml_prob = np.zeros(len(X))
+    if clf is not None and len(X):
+        ml_prob = clf.predict_proba(scaler.transform(X))[:, 1]
+    # Combinaison heuristique + ML
+    return heur, ml_prob, 0.6 * heur + 0.4 * ml_prob
+
+def result_row(heur, ml_prob, final_score):
+    """
+    Résultat sérialisable d'une image : heuristic, ml_prob, score, verdict
+    """
+    percent = round(final_score * 100)
+    return {"heuristic": round(float(heur), 4), "ml_prob": round(float(ml_prob), 4),
+            "score": round(float(final_score), 4),
+            "verdict": "suspect" if percent > SUSPECT_THRESHOLD else "clean"}
+
+def scan_paths(paths, model=None, workers=None, cache=None, batch_size=4096, tile=None):
+    """
+    Analyse un grand nombre d'images avec un seul chargement du modèle.
+    Les features sont extraites en parallèle par lots de batch_size et scorées par lot.
+    tile : mode tuilé (mémoire bornée par worker) pour les très grandes images
+    Produit un dict par image : path, heuristic, ml_prob, score, verdict (ou error)
+    """
+    model = load_model() if model is None else model
+    version = model_feature_version(model)
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+    try:
+        for start in range(0, len(paths), batch_size):
+            results = extract_features_parallel(paths[start:start + batch_size], workers, cache, pool, version,
+                                                tile)
+            ok = [(p, feat) for p, feat, err in results if feat is not None]
+            by_path = {}
+            if ok:  # lot entièrement en erreur : rien à scorer
+                scores = score_features(np.array([f for _, f in ok]).reshape(len(ok), -1), model)
+                by_path = {p: tuple(float(s[i]) for s in scores) for i, (p, _) in enumerate(ok)}
+            for path, feat, err in results:
+                if feat is None:
+                    yield {"path": path, "error": err}
+                    continue
+                yield dict(path=path, **result_row(*by_path[path]))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def scan_directory(directory, output, fmt="jsonl", **kwargs):
+    """
+    Analyse récursivement directory et écrit une ligne JSONL ou CSV par image dans output
+    Retourne le nombre d'images analysées
+    """
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(output, fieldnames=["path", "heuristic", "ml_prob", "score", "verdict", "error"])
+        writer.writeheader()
+    count = 0
+    for row in scan_paths(list_images(directory), **kwargs):
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            output.write(json.dumps(row) + "\n")
+        count += 1
+    output.flush()
+    return count
+
+def predict_image(path, tile=None, early_stop=False, heatmap_path=None):
     """
     Prédit si une image contient un fichier caché
+    tile : mode tuilé ; early_stop et heatmap_path (carte de suspicion) s'y appliquent
     """
+    model = load_model()
+    version = model_feature_version(model)
     try:
-        feat = extract_features(path)
+        if tile:
+            result = analyze_tiled(path, tile, early_stop, version)
+            feat = result["features"]
+            stop = " (arrêt anticipé)" if result["early_stop"] else ""
+            print(f"Tuiles analysées: {result['tiles']}/{result['total_tiles']}{stop}")
+            if heatmap_path:
+                save_heatmap(result["heatmap"], heatmap_path)
+        else:
+            feat = extract_features(path, version)
     except Exception as e:
         print(f"[ERREUR] {e}")
         return
 
-    heur = heuristic_score(feat)
-    ml_prob = 0
-
-    if os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH):
-        clf = pickle.load(open(MODEL_PATH, "rb"))
-        scaler = pickle.load(open(SCALER_PATH, "rb"))
-        feat_scaled = scaler.transform(feat.reshape(1,-1))
-        ml_prob = clf.predict_proba(feat_scaled)[0][1]
+    _, _, final_score = score_features(feat.reshape(1, -1), model)
+    percent = round(float(final_score[0]) * 100)
 
-    # Combinaison heuristique + ML
-    final_score = 0.6 * heur + 0.4 * ml_prob
-    percent = round(final_score * 100)
-
-    if percent > 30:
+    if percent > SUSPECT_THRESHOLD:
         print(f"Image suspecte ({percent}%)")
     else:
         print(f" Image propre ({percent}%)")
@@ -129,20 +914,50 @@ def main():
     parser.add_argument("--cover", help="Dossier images cover")
     parser.add_argument("--stego", help="Dossier images stego")
     parser.add_argument("--predict", help="Image à tester")
+    parser.add_argument("--workers", type=int, default=None, help="Processus pour l'extraction (défaut: nb de cœurs)")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Cœurs pour la forêt (-1 = tous)")
+    parser.add_argument("--cache", default=FEATURE_CACHE_PATH, help="Cache SQLite des features")
+    parser.add_argument("--no-cache", action="store_true", help="Recalculer toutes les features")
+    parser.add_argument("--scan", help="Dossier à analyser (récursif)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="Format des résultats de --scan")
+    parser.add_argument("--output", help="Fichier de résultats de --scan (défaut: sortie standard)")
+    parser.add_argument("--batch-size", type=int, default=4096, help="Images scorées par lot")
+    parser.add_argument("--tiled", action="store_true", help="Analyse par tuiles (mémoire bornée, grandes images)")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="Côté des tuiles en pixels")
+    parser.add_argument("--early-stop", action="store_true", help="--predict --tiled : arrêt dès un résultat net")
+    parser.add_argument("--heatmap", help="--predict --tiled : carte de suspicion par tuile (.npy ou image)")
+    parser.add_argument("--export-model", metavar="NPZ", help="Convertir le modèle pickle en .npz (sans sklearn)")
     args = parser.parse_args()
 
     if args.train:
         if not args.cover or not args.stego:
             print("Erreur: --cover et --stego requis pour l'entraînement")
         else:
-            train_model(args.cover, args.stego)
+            cache = None if args.no_cache else FeatureCache(args.cache)
+            train_model(args.cover, args.stego, workers=args.workers, n_jobs=args.n_jobs, cache=cache)
     elif args.predict:
         if not args.predict:
             print("Erreur: --predict requis pour la prédiction")
         else:
-            predict_image(args.predict)
+            predict_image(args.predict, args.tile_size if args.tiled else None, args.early_stop, args.heatmap)
+    elif args.export_model:
+        model = load_model(MODEL_PATH, SCALER_PATH)
+        if model[0] is None:
+            print("Erreur: aucun modèle entraîné à exporter")
+        else:
+            export_model(model, args.export_model)
+            print(f"Modèle exporté: {args.export_model}")
+    elif args.scan:
+        cache = None if args.no_cache else FeatureCache(args.cache)
+        out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+        try:
+            scan_directory(args.scan, out, args.format, workers=args.workers, cache=cache,
+                           batch_size=args.batch_size, tile=args.tile_size if args.tiled else None)
+        finally:
+            if args.output:
+                out.close()
     else:
-        print("Utilise --train ou --predict")
+        print("Utilise --train, --predict, --scan ou --export-model")
 
 if __name__ == "__main__":
     main()
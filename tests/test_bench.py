@@ -0,0 +1,61 @@
+"""Tests pour benchmarks/bench.py — exécution d'un preset minimal et comparaison."""
+import os
+import sys
+
+# Ajouter le dossier parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import bench
+
+
+def _report(**seconds):
+    return {"meta": {}, "results": {name: {"seconds": s, "peak_rss_mb": 100.0} for name, s in seconds.items()}}
+
+
+def test_smoke_suite_runs_in_process(tmp_path):
+    report = bench.run_suite("smoke", repeat=1, cache_dir=str(tmp_path), isolate=False, log=None)
+    results = report["results"]
+    kinds = {name.split("_")[0] for name in results}
+    assert kinds == {"order", "features", "predict", "embed", "extract", "payload"}
+    for result in results.values():
+        assert "error" not in result
+        assert result["seconds"] > 0 and result["throughput"] > 0
+    assert report["meta"]["preset"] == "smoke"
+
+
+def test_inputs_are_cached_and_deterministic(tmp_path):
+    first = bench.make_cover(0.01, str(tmp_path))
+    with open(first, "rb") as f:
+        content = f.read()
+    os.remove(first)
+    with open(bench.make_cover(0.01, str(tmp_path)), "rb") as f:
+        assert f.read() == content
+    assert os.path.getsize(bench.make_secret(3000, str(tmp_path))) == 3000
+
+
+def test_secret_too_large_for_cover_is_skipped():
+    assert bench._bits_for(1, 1024) == 1
+    assert bench._bits_for(1, 700 * 1024) == 2
+    assert bench._bits_for(1, 10 * 1024 * 1024) is None
+
+
+def test_compare_flags_regressions():
+    baseline = _report(a=1.0, b=1.0, c=1.0, gone=1.0)
+    current = _report(a=1.1, b=1.5, c=0.5, new=1.0)
+    current["results"]["a"]["peak_rss_mb"] = 200.0
+    rows = {row["name"]: row for row in bench.compare(current, baseline, tolerance=0.2)}
+    assert rows["a"]["status"] == "regression"  # mémoire doublée
+    assert rows["b"]["status"] == "regression"
+    assert rows["c"]["status"] == "faster"
+    assert rows["gone"]["status"] == "missing"
+    assert rows["new"]["status"] == "new"
+
+
+def test_compare_exit_status(tmp_path, monkeypatch):
+    import json
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(_report(x=1.0)))
+    monkeypatch.setattr(bench, "run_suite", lambda *a, **k: _report(x=2.0))
+    assert bench.main(["--compare", str(baseline)]) == 1
+    monkeypatch.setattr(bench, "run_suite", lambda *a, **k: _report(x=1.05))
+    assert bench.main(["--compare", str(baseline)]) == 0
@@ -0,0 +1,167 @@
+"""Tests des sous-commandes batch de cli.py."""
+import csv
+import json
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+
+# Ajouter le dossier parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
+
+
+def _make_cover(path, seed):
+    rng = np.random.default_rng(seed)
+    Image.fromarray(rng.integers(0, 256, (60, 60, 3), dtype=np.uint8)).save(path)
+
+
+def _run(argv, capsys):
+    with pytest.raises(SystemExit) as exc:
+        cli.main(argv)
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.strip()]
+    return exc.value.code, sorted(lines, key=lambda r: r['index'])
+
+
+@pytest.fixture
+def batch_dirs(tmp_path):
+    covers, secrets = tmp_path / "covers", tmp_path / "secrets"
+    covers.mkdir()
+    secrets.mkdir()
+    for i in range(3):
+        _make_cover(str(covers / f"c{i}.png"), i)
+        (secrets / f"s{i}.txt").write_bytes(f"secret numéro {i}".encode() * 5)
+    return tmp_path
+
+
+class TestBatch:
+    def test_directory_roundtrip(self, batch_dirs, capsys):
+        stego, out = batch_dirs / "stego", batch_dirs / "out"
+        code, lines = _run(['encode-batch', '--secrets', str(batch_dirs / "secrets"),
+                            '--covers', str(batch_dirs / "covers"), '--out-dir', str(stego),
+                            '--password', 'pw', '--workers', '2'], capsys)
+        assert code == 0
+        assert [l['status'] for l in lines] == ['ok'] * 3
+
+        code, lines = _run(['decode-batch', '--dir', str(stego), '--out-dir', str(out),
+                            '--password', 'pw', '--workers', '2'], capsys)
+        assert code == 0
+        for i in range(3):
+            assert (out / f"s{i}.txt").read_bytes() == (batch_dirs / "secrets" / f"s{i}.txt").read_bytes()
+
+    def test_failing_item_does_not_abort(self, batch_dirs, capsys):
+        manifest = batch_dirs / "manifest.csv"
+        with open(manifest, 'w', newline='') as f:
+            w = csv.DictWriter(f, fieldnames=['cover', 'secret', 'output', 'bits'])
+            w.writeheader()
+            w.writerow({'cover': batch_dirs / "covers" / "c0.png", 'secret': batch_dirs / "secrets" / "s0.txt",
+                        'output': batch_dirs / "o0.png", 'bits': 2})
+            w.writerow({'cover': batch_dirs / "missing.png", 'secret': batch_dirs / "secrets" / "s1.txt",
+                        'output': batch_dirs / "o1.png"})
+            w.writerow({'cover': batch_dirs / "covers" / "c2.png", 'secret': batch_dirs / "secrets" / "s2.txt",
+                        'output': batch_dirs / "o2.png"})
+        code, lines = _run(['encode-batch', '--manifest', str(manifest), '--workers', '1'], capsys)
+        assert code == 1
+        assert [l['status'] for l in lines] == ['ok', 'error', 'ok']
+        assert os.path.exists(batch_dirs / "o2.png")
+
+    @pytest.mark.parametrize("bad", [{'kdf': 'argon2'}, {'level': 'max'}, {'compression': 'zstd'},
+                                     {'bits': 'deux'}])
+    def test_invalid_row_options_do_not_abort(self, batch_dirs, capsys, bad):
+        rows = [{'cover': str(batch_dirs / "covers" / f"c{i}.png"), 'secret': str(batch_dirs / "secrets" / f"s{i}.txt"),
+                 'output': str(batch_dirs / f"o{i}.png")} for i in range(3)]
+        rows[1].update(bad)
+        code, lines = _run(['encode-batch', '--manifest', str(self._jsonl(batch_dirs / "enc.jsonl", rows)),
+                            '--workers', '2'], capsys)
+        assert code == 1
+        assert [l['status'] for l in lines] == ['ok', 'error', 'ok']
+        assert lines[1]['error'].startswith("Option invalide")
+
+        code, lines = _run(['decode-batch', '--manifest', str(self._jsonl(batch_dirs / "dec.jsonl", [
+            {'image': str(batch_dirs / "o0.png"), 'output': str(batch_dirs / "a.txt"), 'bits': 'deux'},
+            {'image': str(batch_dirs / "o2.png"), 'output': str(batch_dirs / "b.txt")}])),
+                            '--workers', '1'], capsys)
+        assert code == 1
+        assert [l['status'] for l in lines] == ['error', 'ok']
+
+    def test_jsonl_manifest_per_item_options(self, batch_dirs, capsys):
+        src = batch_dirs / "secrets" / "s0.txt"
+        _run(['encode-batch', '--manifest', str(self._jsonl(batch_dirs / "enc.jsonl", [
+            {'cover': str(batch_dirs / "covers" / "c0.png"), 'secret': str(src),
+             'output': str(batch_dirs / "a.png"), 'password': 'k', 'bits': 2, 'adaptive': True}])),
+              '--workers', '1'], capsys)
+        code, lines = _run(['decode-batch', '--manifest', str(self._jsonl(batch_dirs / "dec.jsonl", [
+            {'image': str(batch_dirs / "a.png"), 'output': str(batch_dirs / "a.txt"),
+             'password': 'k', 'bits': 2, 'adaptive': True}])), '--workers', '1'], capsys)
+        assert code == 0
+        assert (batch_dirs / "a.txt").read_bytes() == src.read_bytes()
+
+    @pytest.mark.parametrize("shared", [False, True])
+    def test_salt_per_item_unless_shared(self, batch_dirs, capsys, shared):
+        from steg import _open_stego, _read_extensions, _read_payload
+        import hashlib
+        stego = batch_dirs / "stego"
+        _run(['encode-batch', '--secrets', str(batch_dirs / "secrets"), '--covers', str(batch_dirs / "covers"),
+              '--out-dir', str(stego), '--password', 'pw', '--workers', '1'] + ['--shared-salt'] * shared, capsys)
+        salts = set()
+        for path in sorted(stego.iterdir()):
+            pixels, order, bpc, _, (_, size, _, flags) = _open_stego(str(path), 'pw', None, None, None)
+            start, _ = _read_extensions(pixels, order, bpc, flags, size, hashlib.sha256())
+            salts.add(_read_payload(pixels, order, bpc, start, 16))
+        assert len(salts) == (1 if shared else 3)
+
+    def test_decode_batch_detects_parameters(self, batch_dirs, capsys):
+        src = batch_dirs / "secrets" / "s1.txt"
+        _run(['encode-batch', '--manifest', str(self._jsonl(batch_dirs / "enc.jsonl", [
+            {'cover': str(batch_dirs / "covers" / "c1.png"), 'secret': str(src),
+             'output': str(batch_dirs / "b.png"), 'bits': 2, 'adaptive': True}])),
+              '--workers', '1'], capsys)
+        code, lines = _run(['decode-batch', '--manifest', str(self._jsonl(batch_dirs / "dec.jsonl", [
+            {'image': str(batch_dirs / "b.png"), 'output': str(batch_dirs / "b.txt")}])),
+                            '--workers', '1'], capsys)
+        assert code == 0
+        assert lines[0]['info']['bits_per_channel'] == 2 and lines[0]['info']['adaptive']
+        assert (batch_dirs / "b.txt").read_bytes() == src.read_bytes()
+
+    @staticmethod
+    def _jsonl(path, rows):
+        path.write_text(''.join(json.dumps(r) + '\n' for r in rows))
+        return path
+
+
+def test_encode_decode_multi(batch_dirs, capsys):
+    covers = [str(batch_dirs / "covers" / f"c{i}.png") for i in range(3)]
+    secret = batch_dirs / "big.bin"
+    secret.write_bytes(np.random.default_rng(3).integers(0, 256, 2500, dtype=np.uint8).tobytes())
+    with pytest.raises(SystemExit) as exc:
+        cli.main(['encode-multi', '-i', *covers, '-s', str(secret), '--out-dir', str(batch_dirs / "multi"),
+                  '--password', 'pw', '--workers', '2'])
+    assert exc.value.code == 0
+    stego = sorted(str(p) for p in (batch_dirs / "multi").iterdir())
+    assert len(stego) == 3
+    with pytest.raises(SystemExit) as exc:
+        cli.main(['decode-multi', '-i', *reversed(stego), '-o', str(batch_dirs / "big.out"), '--password', 'pw'])
+    assert exc.value.code == 0
+    assert (batch_dirs / "big.out").read_bytes() == secret.read_bytes()
+
+
+def test_dry_run_estimates_payload(batch_dirs, capsys):
+    secret = batch_dirs / "secrets" / "s0.txt"
+    cli.main(['dry-run', '-i', str(batch_dirs / "covers" / "c0.png"), '-s', str(secret), '--password', 'pw'])
+    out = capsys.readouterr().out
+    assert "Payload estimé" in out and "OK" in out
+    big = batch_dirs / "big.bin"
+    big.write_bytes(np.random.default_rng(1).integers(0, 256, 3000, dtype=np.uint8).tobytes())
+    cli.main(['dry-run', '-i', str(batch_dirs / "covers" / "c0.png"), '-s', str(big)])
+    assert "capacité insuffisante" in capsys.readouterr().out
+
+
+def test_dry_run_counts_alpha_channel(batch_dirs, capsys):
+    cover = batch_dirs / "alpha.png"
+    Image.new('RGBA', (40, 40), (10, 20, 30, 255)).save(cover)
+    cli.main(['dry-run', '-i', str(cover), '--bits', '4'])
+    assert f"Capacité image: {(40 * 40 - 16) * 4 * 4 // 8} bytes" in capsys.readouterr().out
+    cli.main(['dry-run', '-i', str(cover), '--bits', '4', '--carrier', 'rgb'])
+    assert f"Capacité image: {(40 * 40 - 16) * 3 * 4 // 8} bytes" in capsys.readouterr().out
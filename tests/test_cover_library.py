@@ -0,0 +1,135 @@
+"""Tests pour cover_library.py — index des covers, estimation du payload, choix des covers."""
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+
+# Ajouter le dossier parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cover_library import CoverLibrary, estimate_payload_size, cover_capacity
+from steg import embed_file_into_image, embed_file_into_images, extract_file_from_images
+from utils import COMP_LZMA
+
+
+def _noise(path, size, seed=0):
+    rng = np.random.default_rng(seed)
+    Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)).save(path)
+
+
+@pytest.fixture
+def library(tmp_path):
+    covers = tmp_path / "covers"
+    covers.mkdir()
+    for i, size in enumerate([(40, 40), (100, 80), (60, 60), (200, 150)]):
+        _noise(str(covers / f"c{i}.png"), size, i)
+    Image.new('RGB', (120, 120), (90, 90, 90)).save(covers / "flat.png")
+    lib = CoverLibrary(str(tmp_path / "covers.sqlite"))
+    yield lib, covers
+    lib.close()
+
+
+class TestEstimate:
+    @pytest.mark.parametrize("password", [None, "pw"])
+    @pytest.mark.parametrize("compression", ['auto', (COMP_LZMA, 6)])
+    @pytest.mark.parametrize("kind", ["text", "random", "empty"])
+    def test_exact_for_small_files(self, tmp_path, password, compression, kind):
+        data = {"text": b"ligne de journal\n" * 2000,
+                "random": np.random.default_rng(1).integers(0, 256, 5000, dtype=np.uint8).tobytes(),
+                "empty": b""}[kind]
+        secret = tmp_path / "secret"
+        secret.write_bytes(data)
+        _noise(str(tmp_path / "cover.png"), (300, 300))
+        est = estimate_payload_size(str(secret), password, compression)
+        real = embed_file_into_image(str(tmp_path / "cover.png"), str(tmp_path / "out.png"), str(secret),
+                                     password=password, compression=compression, dry_run=True)
+        assert est['exact'] and est['required'] == real['required']
+        assert est['source'] == len(data)
+
+    def test_large_file_is_extrapolated(self, tmp_path):
+        secret = tmp_path / "secret"
+        rng = np.random.default_rng(2)
+        secret.write_bytes(b"".join(b"%d req=%x\n" % (i, rng.integers(1 << 40)) for i in range(40000)))
+        est = estimate_payload_size(str(secret))
+        _noise(str(tmp_path / "cover.png"), (1200, 1200))
+        real = embed_file_into_image(str(tmp_path / "cover.png"), str(tmp_path / "out.png"), str(secret),
+                                     dry_run=True)
+        assert not est['exact']
+        assert abs(est['required'] - real['required']) < 0.1 * real['required']
+
+
+class TestLibrary:
+    def test_index_is_incremental(self, library):
+        lib, covers = library
+        result = lib.update(str(covers), workers=2)
+        assert result['indexed'] == 5 and not result['errors'] and len(lib) == 5
+        assert lib.update(str(covers), workers=1)['unchanged'] == 5
+
+        os.remove(covers / "c0.png")
+        _noise(str(covers / "c1.png"), (30, 30), 9)
+        (covers / "broken.png").write_bytes(b"pas une image")
+        result = lib.update(str(covers), workers=1)
+        assert result['removed'] == 1 and result['indexed'] == 1
+        assert [p for p, _ in result['errors']] == [str(covers / "broken.png")]
+        assert len(lib) == 4
+
+    def test_file_deleted_during_update(self, library, monkeypatch):
+        import cover_library
+        lib, covers = library
+        lib.update(str(covers), workers=1, texture=False)
+        listed = cover_library.list_covers(str(covers))
+        os.remove(covers / "c0.png")
+        monkeypatch.setattr(cover_library, "list_covers", lambda *a: listed)
+        result = lib.update(str(covers), workers=1, texture=False)
+        assert result['removed'] == 1 and result['unchanged'] == 4 and not result['errors']
+        assert len(lib) == 4
+
+    def test_best_fit_picks_smallest(self, library):
+        lib, covers = library
+        lib.update(str(covers), workers=1, texture=False)
+        path, cap = lib.best_fit(cover_capacity(60, 60, 1))
+        assert path == str(covers / "c2.png") and cap == cover_capacity(60, 60, 1)
+        path, _ = lib.best_fit(cover_capacity(60, 60, 1) + 1)
+        assert path == str(covers / "c1.png")
+        assert lib.best_fit(cover_capacity(40, 40, 2), bits_per_channel=2)[0] == str(covers / "c0.png")
+        assert lib.best_fit(10 ** 9) is None
+
+    def test_texture_filter(self, library):
+        lib, covers = library
+        lib.update(str(covers), workers=1)
+        assert lib.best_fit(100)[0] == str(covers / "c0.png")
+        flat_only = cover_capacity(120, 120, 1)
+        assert lib.best_fit(flat_only)[0] == str(covers / "flat.png")
+        assert lib.best_fit(flat_only, min_texture=10)[0] == str(covers / "c3.png")
+
+    def test_capacity_per_mode(self, library, tmp_path):
+        lib, covers = library
+        rgba = np.random.default_rng(7).integers(0, 256, (60, 60, 4), dtype=np.uint8)
+        Image.fromarray(rgba).save(covers / "alpha.png")
+        lib.update(str(covers), workers=1, texture=False)
+        cap = cover_capacity(60, 60, 4, channels=4)
+        assert lib.best_fit(cap, bits_per_channel=4) == (str(covers / "alpha.png"), cap)
+
+    def test_outdated_schema_is_rebuilt(self, library, tmp_path):
+        lib, covers = library
+        lib.update(str(covers), workers=1, texture=False)
+        lib.db.execute("PRAGMA user_version = 1")
+        lib.db.commit()
+        reopened = CoverLibrary(str(tmp_path / "covers.sqlite"))
+        assert len(reopened) == 0
+        reopened.close()
+
+    def test_plan_uses_cover_set(self, library, tmp_path):
+        lib, covers = library
+        lib.update(str(covers), workers=1, texture=False)
+        secret = tmp_path / "big.bin"
+        secret.write_bytes(np.random.default_rng(5).integers(0, 256, 14000, dtype=np.uint8).tobytes())
+        plan = lib.plan(str(secret))
+        paths = [p for p, _ in plan['covers']]
+        assert len(paths) == 2 and paths[0] == str(covers / "c3.png")
+
+        outs = [str(tmp_path / f"s{i}.png") for i in range(len(paths))]
+        embed_file_into_images(paths, outs, str(secret), workers=1)
+        extract_file_from_images(outs, str(tmp_path / "out.bin"), workers=1)
+        assert (tmp_path / "out.bin").read_bytes() == secret.read_bytes()
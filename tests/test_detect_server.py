@@ -0,0 +1,136 @@
+"""Tests pour detect_server.py — service local, micro-batching, statistiques."""
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from PIL import Image
+
+# Ajouter le dossier parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import detect_server
+import steg_detect
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = np.random.default_rng(1)
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"img{i}.png"
+        Image.fromarray(rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def server():
+    service = detect_server.DetectionService(model=(None, None))
+    httpd = detect_server.make_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, detect_server.DetectClient(port=httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+
+
+class TestMicroBatcher:
+    def test_concurrent_submissions_are_batched(self):
+        calls = []
+        release = threading.Event()
+
+        def score(X):
+            calls.append(len(X))
+            release.wait(5)
+            return steg_detect.score_features(X)
+
+        stats = detect_server.ServiceStats()
+        batcher = detect_server.MicroBatcher(score, max_batch=8, max_wait=0.05, stats=stats)
+        X = np.random.default_rng(0).random((10, 9), dtype=np.float32)
+        futures = [batcher.submit(x) for x in X]
+        release.set()
+        results = [f.result(5) for f in futures]
+        batcher.close()
+
+        expected = steg_detect.score_features(X)
+        for i, (heur, ml_prob, final) in enumerate(results):
+            assert heur == pytest.approx(expected[0][i])
+            assert final == pytest.approx(expected[2][i])
+        assert sum(calls) == 10 and max(calls) > 1
+        assert stats.snapshot()["batches"] == len(calls)
+
+    def test_scoring_error_reaches_every_caller(self):
+        def score(X):
+            raise RuntimeError("boom")
+
+        batcher = detect_server.MicroBatcher(score)
+        future = batcher.submit(np.zeros(9, dtype=np.float32))
+        with pytest.raises(RuntimeError, match="boom"):
+            future.result(5)
+        batcher.close()
+
+
+class TestServer:
+    def test_predict_bytes_matches_offline_scan(self, server, images):
+        _, client = server
+        with open(images[0], "rb") as f:
+            row = client.predict(f.read())
+        expected = next(steg_detect.scan_paths(images[:1], model=(None, None), workers=1))
+        assert row == {k: v for k, v in expected.items() if k != "path"}
+
+    def test_predict_path(self, server, images):
+        _, client = server
+        assert client.predict(path=images[1])["verdict"] in ("clean", "suspect")
+
+    def test_invalid_image_is_rejected(self, server):
+        _, client = server
+        with pytest.raises(RuntimeError, match="400"):
+            client.predict(b"pas une image")
+
+    def test_concurrent_clients_and_stats(self, server, images):
+        _, client = server
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            rows = list(pool.map(lambda p: client.predict(path=p), images * 3))
+        assert len(rows) == 18
+        stats = client.stats()
+        assert stats["requests"] == 18 and stats["errors"] == 0
+        assert 1 <= stats["batches"] <= 18
+        assert stats["latency_ms"]["p95"] >= stats["latency_ms"]["p50"] > 0
+        assert client.health() == {"status": "ok", "model": False}
+
+    @pytest.mark.skipif(not hasattr(__import__("socket"), "AF_UNIX"), reason="socket Unix indisponible")
+    def test_unix_socket(self, images):
+        sock = os.path.join(tempfile.mkdtemp(), "detect.sock")
+        service = detect_server.DetectionService(model=(None, None))
+        httpd = detect_server.make_server(service, unix_socket=sock)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        try:
+            row = detect_server.DetectClient(unix_socket=sock).predict(path=images[0])
+            assert "score" in row
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            service.close()
+            os.unlink(sock)
+
+    @pytest.mark.skipif(not hasattr(__import__("socket"), "AF_UNIX"), reason="socket Unix indisponible")
+    def test_unix_socket_path_is_not_clobbered(self, tmp_path):
+        import socket
+        service = detect_server.DetectionService(model=(None, None))
+        try:
+            regular = tmp_path / "detect.sock"
+            regular.write_text("données")
+            with pytest.raises(FileExistsError):
+                detect_server.make_server(service, unix_socket=str(regular))
+            assert regular.read_text() == "données"
+
+            stale = str(tmp_path / "stale.sock")
+            with socket.socket(socket.AF_UNIX) as left_over:
+                left_over.bind(stale)
+            detect_server.make_server(service, unix_socket=stale).server_close()
+        finally:
+            service.close()
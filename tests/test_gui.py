@@ -0,0 +1,70 @@
+"""Tests pour gui.py — exécution en arrière-plan (sans affichage)."""
+import os
+import sys
+import threading
+import time
+import pytest
+
+# Ajouter le dossier parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+gui = pytest.importorskip("gui")
+from steg import Cancelled
+
+
+def wait_final(task, timeout=5):
+    """Lit la file comme le ferait la boucle Tk ; retourne (progressions vues, événement final)."""
+    seen, deadline = [], time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        progress, final = task.poll()
+        if progress is not None:
+            seen.append(progress)
+        if final is not None:
+            return seen, final
+        time.sleep(0.01)
+    raise AssertionError("la tâche ne s'est pas terminée")
+
+
+class TestBackgroundTask:
+    def test_result_and_progress(self):
+        def work(n, progress=None, cancel=None):
+            for i in range(n + 1):
+                progress('embed', i, n)
+            return n * 2
+
+        seen, final = wait_final(gui.BackgroundTask(work, 3).start())
+        assert final == ('done', 6)
+        assert seen[-1] == ('embed', 3, 3)
+
+    def test_error_is_reported(self):
+        def work(progress=None, cancel=None):
+            raise ValueError("Capacité insuffisante")
+
+        _, (kind, value) = wait_final(gui.BackgroundTask(work).start())
+        assert kind == 'error' and "Capacité" in str(value)
+
+    def test_cancel(self):
+        started = threading.Event()
+
+        def work(progress=None, cancel=None):
+            started.set()
+            while not cancel.is_set():
+                time.sleep(0.001)
+            raise Cancelled("Opération annulée")
+
+        task = gui.BackgroundTask(work).start()
+        started.wait(5)
+        task.cancel()
+        assert wait_final(task)[1] == ('cancelled', None)
+
+    def test_format_progress(self):
+        assert gui._format_progress('embed', 50, 200) == "[ 25%] Secret inséré: 50/200"
+        assert gui._format_progress('order', 0, 0).startswith("[100%]")
+
+
+def test_dry_run_reports_estimated_payload(tmp_path):
+    from PIL import Image
+    Image.new('RGB', (50, 50)).save(tmp_path / "cover.png")
+    (tmp_path / "secret.txt").write_bytes(b"abc" * 100)
+    message = gui._dry_run(str(tmp_path / "cover.png"), str(tmp_path / "secret.txt"), 1, "pw")
+    assert "Payload estimé" in message and "OK" in message
@@ -0,0 +1,46 @@
+"""Tests unitaires pour permutation.py — permutation de Feistel à clé."""
+import os
+import sys
+import numpy as np
+import pytest
+
+# Ajouter le dossier parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from permutation import KeyedPermutation
+
+
+class TestKeyedPermutation:
+    @pytest.mark.parametrize("n", [1, 2, 7, 100, 1000, 4097])
+    def test_is_bijection(self, n):
+        perm = KeyedPermutation(n, "pw").take()
+        assert perm.dtype == np.int64
+        assert np.array_equal(np.sort(perm), np.arange(n))
+
+    def test_deterministic_for_password(self):
+        a = KeyedPermutation(5000, "pw").take()
+        b = KeyedPermutation(5000, "pw").take()
+        assert np.array_equal(a, b)
+
+    def test_password_changes_order(self):
+        a = KeyedPermutation(5000, "pw1").take()
+        b = KeyedPermutation(5000, "pw2").take()
+        assert not np.array_equal(a, b)
+
+    def test_prefix_matches_full(self):
+        perm = KeyedPermutation(10000, None)
+        full = perm.take()
+        assert np.array_equal(perm.take(0, 123), full[:123])
+        assert np.array_equal(perm.take(500, 700), full[500:700])
+
+    def test_slicing_is_lazy_view_of_take(self):
+        perm = KeyedPermutation(1000, "pw")
+        assert len(perm) == 1000
+        assert np.array_equal(perm[10:20], perm.take(10, 20))
+        assert perm[-1] == perm.take()[-1]
+        with pytest.raises(IndexError):
+            perm[1000]
+
+    def test_empty_domain_rejected(self):
+        with pytest.raises(ValueError):
+            KeyedPermutation(0)
@@ -3,13 +3,17 @@ import os
 import sys
 import tempfile
 import shutil
+import numpy as np
 import pytest
 from PIL import Image
 
 # Ajouter le dossier parent au path pour les imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from steg import embed_file_into_image, extract_file_from_image, capacity_bytes_for_image
+from steg import (embed_file_into_image, extract_file_from_image, capacity_bytes_for_image,
+                  get_pixel_order, iter_pixel_order, ORDER_LEGACY, ORDER_KEYED, ORDER_PREAMBLE,
+                  PREAMBLE_PIXELS, Cancelled, embed_file_into_images, extract_file_from_images)
+from utils import HEADER_SIZE, KDF_SCRYPT, COMP_NONE, COMP_LZMA, COMP_BZ2
 
 
 @pytest.fixture
@@ -97,6 +101,28 @@ class TestRoundTrip:
             extracted = f.read()
         assert original == extracted
 
+    def test_roundtrip_scrypt(self, workspace):
+        """Le KDF choisi est lu dans l'entête au décodage."""
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              password="pw", kdf=(KDF_SCRYPT, 1 << 12, 8, 1))
+        extract_file_from_image(workspace['stego'], workspace['extracted'], password="pw")
+
+        with open(workspace['secret'], 'rb') as f:
+            original = f.read()
+        with open(workspace['extracted'], 'rb') as f:
+            assert f.read() == original
+
+    @pytest.mark.parametrize("compression", [(COMP_NONE, 0), (COMP_LZMA, 6), (COMP_BZ2, 9)])
+    def test_roundtrip_compression(self, workspace, compression):
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              password="pw", compression=compression)
+        extract_file_from_image(workspace['stego'], workspace['extracted'], password="pw")
+
+        with open(workspace['secret'], 'rb') as f:
+            original = f.read()
+        with open(workspace['extracted'], 'rb') as f:
+            assert f.read() == original
+
     def test_roundtrip_binary_file(self, workspace):
         """Encode/decode un fichier binaire."""
         binary_path = str(workspace['tmp_path'] / "binary.dat")
@@ -115,6 +141,25 @@ class TestRoundTrip:
         assert original == extracted
 
 
+    @pytest.mark.parametrize("bpc", [1, 2])
+    @pytest.mark.parametrize("password", [None, "adaptive-key"])
+    def test_roundtrip_adaptive(self, workspace, bpc, password):
+        """Le mode adaptatif se décode toujours : la carte ignore les bits modifiés."""
+        binary_path = str(workspace['tmp_path'] / "binary.dat")
+        with open(binary_path, 'wb') as f:
+            f.write(os.urandom(1500))
+
+        embed_file_into_image(workspace['cover'], workspace['stego'], binary_path,
+                              password=password, bits_per_channel=bpc, adaptive=True)
+        extract_file_from_image(workspace['stego'], workspace['extracted'],
+                                password=password, bits_per_channel=bpc, adaptive=True)
+
+        with open(binary_path, 'rb') as f:
+            original = f.read()
+        with open(workspace['extracted'], 'rb') as f:
+            assert f.read() == original
+
+
 class TestWrongPassword:
     """Tests d'échec avec mauvais mot de passe."""
 
@@ -142,10 +187,13 @@ class TestCapacityAndDryRun:
         img = Image.open(workspace['cover']).convert('RGB')
         cap1 = capacity_bytes_for_image(img, bits_per_channel=1)
         cap2 = capacity_bytes_for_image(img, bits_per_channel=2)
-        # 100x100 pixels, 3 canaux
-        assert cap1 == (100 * 100 * 3 * 1) // 8  # 3750
-        assert cap2 == (100 * 100 * 3 * 2) // 8  # 7500
+        # 100x100 pixels moins ceux du préambule, 3 canaux
+        assert cap1 == ((100 * 100 - PREAMBLE_PIXELS) * 3 * 1) // 8  # 3744
+        assert cap2 == ((100 * 100 - PREAMBLE_PIXELS) * 3 * 2) // 8  # 7488
         assert cap2 == cap1 * 2
+        info = embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                                     bits_per_channel=2, dry_run=True)
+        assert info['capacity'] == cap2
 
     def test_dry_run(self, workspace):
         info = embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
@@ -160,7 +208,7 @@ class TestCapacityAndDryRun:
     def test_file_too_large_fails(self, workspace):
         """Un fichier trop gros pour l'image doit lever une ValueError."""
         big_path = str(workspace['tmp_path'] / "big.dat")
-        # Créer un fichier incompressible plus gros que la capacité (3750 bytes)
+        # Créer un fichier incompressible plus gros que la capacité (3744 bytes)
         with open(big_path, 'wb') as f:
             f.write(os.urandom(5000))
 
@@ -170,7 +218,280 @@ class TestCapacityAndDryRun:
     def test_invalid_bits_per_channel(self, workspace):
         with pytest.raises(ValueError, match="bits_per_channel"):
             embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
-                                  bits_per_channel=3)
+                                  bits_per_channel=5)
+
+
+def _legacy_embed(cover_path, payload, password, bits_per_channel, adaptive):
+    """Encodeur historique, pixel par pixel (référence pour l'ordre ORDER_LEGACY)."""
+    import hashlib
+    import random
+    from scipy.ndimage import generic_filter
+    img = Image.open(cover_path).convert('RGB')
+    w, h = img.size
+    order = list(range(w * h))
+    seed = int(hashlib.sha256(password.encode()).hexdigest(), 16) & 0xFFFFFFFF if password else 0
+    random.Random(seed).shuffle(order)
+    if adaptive:
+        varmap = generic_filter(np.array(img.convert('L'), dtype=np.float32),
+                                lambda block: float(np.array(block).var()), size=3).reshape(-1)
+        order.sort(key=lambda i: -float(varmap[i]))
+    bits = [b for byte in payload for b in format(byte, '08b')]
+    pixels = list(img.getdata())
+    mask_clear = (~((1 << bits_per_channel) - 1)) & 0xFF
+    bit_idx = 0
+    for idx in order:
+        if bit_idx >= len(bits):
+            break
+        channels = list(pixels[idx])
+        for chan in range(3):
+            if bit_idx >= len(bits):
+                break
+            chunk = bits[bit_idx:bit_idx + bits_per_channel]
+            chunk += ['0'] * (bits_per_channel - len(chunk))
+            channels[chan] = (channels[chan] & mask_clear) | int(''.join(chunk), 2)
+            bit_idx += bits_per_channel
+        pixels[idx] = tuple(channels)
+    return np.array(pixels, dtype=np.uint8).reshape(h, w, 3)
+
+
+class TestVectorizedEngine:
+    """Moteur NumPy d'insertion / extraction."""
+
+    @pytest.mark.parametrize("bpc", [1, 2, 3, 4])
+    def test_embed_only_touches_low_bits(self, workspace, bpc):
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              bits_per_channel=bpc)
+        cover = np.array(Image.open(workspace['cover']).convert('RGB'))
+        stego = np.array(Image.open(workspace['stego']).convert('RGB'))
+        high = np.uint8(~((1 << bpc) - 1) & 0xFF)
+        assert np.array_equal(cover & high, stego & high)
+        assert not np.array_equal(cover, stego)
+
+    def test_extract_from_clean_cover_fails(self, workspace):
+        with pytest.raises(ValueError, match="Magic"):
+            extract_file_from_image(workspace['cover'], workspace['extracted'])
+
+    def test_legacy_order_still_decodes(self, workspace):
+        """Une image encodée avec l'ordre historique se décode sans option."""
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              password="pw", order_version=ORDER_LEGACY)
+        extract_file_from_image(workspace['stego'], workspace['extracted'], password="pw")
+
+        with open(workspace['secret'], 'rb') as f:
+            original = f.read()
+        with open(workspace['extracted'], 'rb') as f:
+            assert f.read() == original
+
+    @pytest.mark.parametrize("bpc", [1, 2])
+    @pytest.mark.parametrize("adaptive", [False, True])
+    @pytest.mark.parametrize("password", [None, "pw"])
+    def test_matches_legacy_encoder(self, workspace, monkeypatch, bpc, adaptive, password):
+        """Même cover, mot de passe et payload : pixels identiques à l'encodeur historique."""
+        from utils import PayloadStream, encode_flags
+        # IV et salt fixés : le payload chiffré est le même pour les deux encodeurs
+        monkeypatch.setattr("Crypto.Cipher._mode_cbc.get_random_bytes", lambda n: b'\x01' * n)
+        salt = b'\x02' * 16
+        stream = PayloadStream(workspace['secret'], password, compression=(COMP_BZ2, 9), salt=salt)
+        body = b''.join(stream)
+        payload = stream.header(encode_flags(bpc, adaptive, stream.encrypted)) + body
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'], password=password,
+                              bits_per_channel=bpc, adaptive=adaptive, order_version=ORDER_LEGACY,
+                              compression=(COMP_BZ2, 9), salt=salt)
+        expected = _legacy_embed(workspace['cover'], payload, password, bpc, adaptive)
+        assert np.array_equal(np.array(Image.open(workspace['stego'])), expected)
+
+    def test_keyed_order_is_permutation(self):
+        order = get_pixel_order(40, 30, "pw", order_version=ORDER_KEYED)
+        assert np.array_equal(np.sort(order), np.arange(40 * 30))
+
+    def test_iter_pixel_order_matches_full_order(self):
+        chunks = list(iter_pixel_order(40, 30, "pw", chunk_size=100))
+        assert len(chunks) == 12
+        full = get_pixel_order(40, 30, "pw", order_version=ORDER_KEYED)
+        assert np.array_equal(np.concatenate(chunks), full)
+
+    def test_pixel_order_prefix(self):
+        full = get_pixel_order(40, 30, "pw", order_version=ORDER_KEYED)
+        prefix = get_pixel_order(40, 30, "pw", order_version=ORDER_KEYED, count=50)
+        assert np.array_equal(prefix, full[:50])
+
+    def test_adaptive_order_requires_image(self):
+        with pytest.raises(ValueError, match="adaptatif"):
+            get_pixel_order(40, 30, "pw", adaptive=True)
+
+    @pytest.mark.parametrize("version", [ORDER_LEGACY, ORDER_KEYED, ORDER_PREAMBLE])
+    def test_adaptive_prefix_matches_full_order(self, workspace, version):
+        img = Image.open(workspace['cover']).convert('RGB')
+        full = get_pixel_order(100, 100, "pw", True, img, version)
+        prefix = get_pixel_order(100, 100, "pw", True, img, version, count=321)
+        assert np.array_equal(prefix, full[:321])
+
+    def test_preamble_order_skips_reserved_pixels(self):
+        keyed = get_pixel_order(40, 30, "pw", order_version=ORDER_KEYED)
+        order = get_pixel_order(40, 30, "pw", order_version=ORDER_PREAMBLE)
+        assert np.array_equal(order, keyed[PREAMBLE_PIXELS:])
+
+
+class TestPreamble:
+    """Préambule : bits par canal et mode adaptatif retrouvés sans option."""
+
+    @pytest.mark.parametrize("bpc,adaptive", [(1, False), (2, False), (1, True), (2, True),
+                                              (3, False), (3, True), (4, False), (4, True)])
+    def test_decode_without_parameters(self, workspace, bpc, adaptive):
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              password="pw", bits_per_channel=bpc, adaptive=adaptive)
+        info = extract_file_from_image(workspace['stego'], workspace['extracted'], password="pw")
+        assert (info['bits_per_channel'], info['adaptive']) == (bpc, adaptive)
+        with open(workspace['secret'], 'rb') as f, open(workspace['extracted'], 'rb') as g:
+            assert f.read() == g.read()
+
+    def test_preamble_overrides_given_parameters(self, workspace):
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              bits_per_channel=2, adaptive=True)
+        info = extract_file_from_image(workspace['stego'], workspace['extracted'],
+                                       bits_per_channel=1, adaptive=False)
+        assert info['bits_per_channel'] == 2 and info['adaptive']
+
+    def test_image_without_preamble_uses_given_parameters(self, workspace):
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              password="pw", bits_per_channel=2, order_version=ORDER_KEYED)
+        with pytest.raises(ValueError, match="Magic"):
+            extract_file_from_image(workspace['stego'], workspace['extracted'], password="pw")
+        with pytest.raises(ValueError, match="Préambule"):
+            extract_file_from_image(workspace['stego'], workspace['extracted'], password="pw",
+                                    bits_per_channel=2, order_version=ORDER_PREAMBLE)
+        info = extract_file_from_image(workspace['stego'], workspace['extracted'], password="pw",
+                                       bits_per_channel=2)
+        assert info['bits_per_channel'] == 2
+
+    @pytest.mark.parametrize("version,message", [(ORDER_PREAMBLE, "avec le préambule"),
+                                                 (ORDER_KEYED, "avec les paramètres demandés"),
+                                                 (ORDER_LEGACY, "avec les paramètres demandés")])
+    def test_header_mismatch_message_per_order(self, workspace, monkeypatch, version, message):
+        import steg
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              bits_per_channel=2, order_version=version)
+        monkeypatch.setattr(steg, "decode_flags", lambda flags: (3, False, False))
+        with pytest.raises(ValueError, match=message):
+            extract_file_from_image(workspace['stego'], workspace['extracted'], bits_per_channel=2,
+                                    order_version=version)
+
+    def test_unknown_preamble_version_is_rejected(self, workspace):
+        from steg import _BitWriter, _preamble_order
+        import struct
+        from utils import PREAMBLE_FMT, PREAMBLE_MAGIC
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'])
+        img = np.array(Image.open(workspace['stego']).convert('RGB'))
+        writer = _BitWriter(img.reshape(-1, 3), _preamble_order(100, 100, None), 1)
+        writer.write(struct.pack(PREAMBLE_FMT, PREAMBLE_MAGIC, 99, 1))
+        Image.fromarray(img).save(workspace['stego'])
+        with pytest.raises(ValueError, match="Version de format"):
+            extract_file_from_image(workspace['stego'], workspace['extracted'])
+
+
+class TestStreamingExtract:
+    """Extraction en flux vers un fichier ou un objet fichier."""
+
+    def test_extract_to_file_object(self, workspace):
+        import io
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              password="pw")
+        buf = io.BytesIO()
+        info = extract_file_from_image(workspace['stego'], buf, password="pw")
+
+        with open(workspace['secret'], 'rb') as f:
+            original = f.read()
+        assert buf.getvalue() == original
+        assert info['size'] == len(original)
+
+    def test_checksum_mismatch_leaves_no_output(self, workspace):
+        """Un payload corrompu ne laisse ni fichier de sortie ni fichier partiel."""
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'])
+        img = np.array(Image.open(workspace['stego']).convert('RGB'))
+        flat = img.reshape(-1)
+        order = get_pixel_order(100, 100, None, order_version=ORDER_PREAMBLE)
+        group = HEADER_SIZE * 8 + 20  # un bit du payload (1 bit par canal)
+        flat[order[group // 3] * 3 + group % 3] ^= 1
+        Image.fromarray(img).save(workspace['stego'])
+
+        with pytest.raises(ValueError, match="Checksum mismatch"):
+            extract_file_from_image(workspace['stego'], workspace['extracted'])
+        assert not os.path.exists(workspace['extracted'])
+        assert not [n for n in os.listdir(workspace['tmp_path']) if n.endswith('.part')]
+
+    @pytest.mark.skipif(os.name != 'posix', reason="droits POSIX")
+    def test_output_mode_follows_umask(self, workspace):
+        """La sortie a les droits d'un open(out, 'wb') et l'umask du processus reste inchangé."""
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'])
+        previous = os.umask(0o027)
+        try:
+            extract_file_from_image(workspace['stego'], workspace['extracted'])
+            assert os.umask(0o027) == 0o027
+        finally:
+            os.umask(previous)
+        assert os.stat(workspace['extracted']).st_mode & 0o777 == 0o640
+
+
+class TestProgressAndCancel:
+    """Progression et annulation (utilisées par le worker de la GUI)."""
+
+    def test_progress_events(self, workspace):
+        events = []
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                              progress=lambda *e: events.append(e))
+        size = os.path.getsize(workspace['secret'])
+        assert [e[0] for e in events[:2]] == ['order', 'order']
+        assert {e[0] for e in events[2:]} == {'embed'}
+        assert events[1] == ('order', 100 * 100, 100 * 100)
+        assert events[-1] == ('embed', size, size)
+
+        events.clear()
+        info = extract_file_from_image(workspace['stego'], workspace['extracted'],
+                                       progress=lambda *e: events.append(e))
+        stages = [e for e in events if e[0] == 'extract']
+        assert stages[0][1] < stages[-1][1] == stages[-1][2]
+        assert info['size'] == size
+
+    def test_cancel_embed_writes_nothing(self, workspace):
+        import threading
+        cancel = threading.Event()
+
+        def progress(stage, done, total):
+            if stage == 'embed':
+                cancel.set()
+        # L'annulation est vérifiée au point de contrôle suivant
+        with pytest.raises(Cancelled):
+            embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'],
+                                  progress=progress, cancel=cancel)
+        assert not os.path.exists(workspace['stego'])
+
+    def test_cancel_extract_removes_partial_output(self, workspace):
+        import threading
+        embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'])
+        cancel = threading.Event()
+        cancel.set()
+        with pytest.raises(Cancelled):
+            extract_file_from_image(workspace['stego'], workspace['extracted'], cancel=cancel)
+        assert not os.path.exists(workspace['extracted'])
+        assert not [n for n in os.listdir(workspace['tmp_path']) if n.endswith('.part')]
+
+    def test_capacity_error_hides_internal_exception(self, workspace):
+        with open(workspace['secret'], 'wb') as f:
+            f.write(os.urandom(20000))
+        with pytest.raises(ValueError, match="Capacité insuffisante") as excinfo:
+            embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'])
+        assert excinfo.value.__cause__ is None and excinfo.value.__suppress_context__
+
+    @pytest.mark.parametrize("dry_run", [False, True])
+    def test_capacity_error_stops_reading_secret(self, workspace, dry_run):
+        from utils import CHUNK_SIZE
+        with open(workspace['secret'], 'wb') as f:
+            f.write(os.urandom(4 * CHUNK_SIZE))
+        events = []
+        with pytest.raises(ValueError, match="Capacité insuffisante: ≥"):
+            embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'], dry_run=dry_run,
+                                  compression=(COMP_NONE, 0), progress=lambda *e: events.append(e))
+        assert max(done for stage, done, _ in events if stage == 'embed') <= CHUNK_SIZE
 
 
 class TestEdgeCases:
@@ -194,3 +515,137 @@ class TestEdgeCases:
         img = Image.open(workspace['stego'])
         assert img.format == 'PNG'
         assert img.size == (100, 100)
+
+
+class TestMultiImage:
+    """Secret réparti sur plusieurs images."""
+
+    @pytest.fixture
+    def covers(self, tmp_path):
+        rng = np.random.default_rng(7)
+        paths = []
+        for i, size in enumerate([(60, 60), (80, 50), (60, 60), (40, 70)]):
+            path = str(tmp_path / f"c{i}.png")
+            Image.fromarray(rng.integers(0, 256, size + (3,), dtype=np.uint8)).save(path)
+            paths.append(path)
+        secret = tmp_path / "secret.bin"
+        secret.write_bytes(rng.integers(0, 256, 4000, dtype=np.uint8).tobytes())
+        return tmp_path, paths, str(secret)
+
+    @pytest.mark.parametrize("password,workers", [(None, 1), ("pw", 2)])
+    def test_roundtrip_any_order(self, covers, password, workers):
+        tmp_path, paths, secret = covers
+        outs = [str(tmp_path / f"s{i}.png") for i in range(len(paths))]
+        info = embed_file_into_images(paths, outs, secret, password=password, workers=workers)
+        assert len(info['shards']) == 4
+        assert sum(s['shard_bytes'] for s in info['shards']) == info['payload_bytes']
+
+        out = str(tmp_path / "out.bin")
+        result = extract_file_from_images(outs[::-1], out, password=password, workers=workers)
+        with open(secret, 'rb') as f, open(out, 'rb') as g:
+            assert f.read() == g.read()
+        assert result['shards'] == 4 and result['set_id'] == info['set_id']
+
+    def test_too_large_for_all_covers(self, covers):
+        tmp_path, paths, secret = covers
+        with pytest.raises(ValueError, match="Capacité insuffisante"):
+            embed_file_into_images(paths[:2], [str(tmp_path / "a.png"), str(tmp_path / "b.png")], secret)
+
+    def test_missing_or_foreign_shard(self, covers):
+        tmp_path, paths, secret = covers
+        outs = [str(tmp_path / f"s{i}.png") for i in range(len(paths))]
+        embed_file_into_images(paths, outs, secret, workers=1)
+        with pytest.raises(ValueError, match=r"manquants: \[2\]"):
+            extract_file_from_images(outs[:2] + outs[3:], str(tmp_path / "out.bin"), workers=1)
+
+        other = [str(tmp_path / f"o{i}.png") for i in range(len(paths))]
+        embed_file_into_images(paths, other, secret, workers=1)
+        with pytest.raises(ValueError, match="même lot"):
+            extract_file_from_images(outs[:3] + other[3:], str(tmp_path / "out.bin"), workers=1)
+        assert not os.path.exists(tmp_path / "out.bin")
+
+    def test_single_image_extract_refuses_shard(self, covers):
+        tmp_path, paths, secret = covers
+        outs = [str(tmp_path / f"s{i}.png") for i in range(len(paths))]
+        embed_file_into_images(paths, outs, secret, workers=1)
+        with pytest.raises(ValueError, match="fragment"):
+            extract_file_from_image(outs[0], str(tmp_path / "out.bin"))
+
+
+class TestCarriers:
+    """Covers RGBA et 16 bits, 3 et 4 bits par canal."""
+
+    @pytest.fixture
+    def payload(self, tmp_path):
+        path = str(tmp_path / "payload.bin")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(2000))
+        return path
+
+    def _roundtrip(self, cover, stego, secret, tmp_path, **kwargs):
+        embed_file_into_image(cover, stego, secret, password="pw", compression=(COMP_NONE, 0), **kwargs)
+        out = str(tmp_path / "out.bin")
+        info = extract_file_from_image(stego, out, password="pw")
+        with open(secret, 'rb') as f, open(out, 'rb') as g:
+            assert f.read() == g.read()
+        return info
+
+    @pytest.mark.parametrize("bpc", [3, 4])
+    @pytest.mark.parametrize("adaptive", [False, True])
+    def test_high_bits_per_channel_roundtrip(self, workspace, payload, bpc, adaptive):
+        info = self._roundtrip(workspace['cover'], workspace['stego'], payload, workspace['tmp_path'],
+                               bits_per_channel=bpc, adaptive=adaptive)
+        assert (info['bits_per_channel'], info['adaptive']) == (bpc, adaptive)
+
+    def test_rgba_cover_carries_alpha(self, tmp_path, payload):
+        rnd = np.random.default_rng(1)
+        cover = str(tmp_path / "cover.png")
+        Image.fromarray(rnd.integers(0, 256, (70, 70, 4), dtype=np.uint8)).save(cover)
+        with Image.open(cover) as img:
+            assert capacity_bytes_for_image(img, 1) == (70 * 70 - PREAMBLE_PIXELS) * 4 // 8
+            assert capacity_bytes_for_image(img, 1, carrier='rgb') == (70 * 70 - PREAMBLE_PIXELS) * 3 // 8
+        stego = str(tmp_path / "stego.png")
+        self._roundtrip(cover, stego, payload, tmp_path, bits_per_channel=1)
+        before, after = np.array(Image.open(cover)), np.array(Image.open(stego))
+        assert Image.open(stego).mode == 'RGBA'
+        assert not np.array_equal(before[..., 3], after[..., 3])
+        assert np.array_equal(before & 0xFE, after & 0xFE)
+        # 2000 octets ne tiennent qu'avec l'alpha à 1 bit par canal
+        with pytest.raises(ValueError, match="Capacité insuffisante"):
+            embed_file_into_image(cover, stego, payload, compression=(COMP_NONE, 0), carrier='rgb')
+
+    def test_rgb_cover_with_forced_alpha(self, workspace, payload):
+        self._roundtrip(workspace['cover'], workspace['stego'], payload, workspace['tmp_path'], carrier='rgba')
+        stego = np.array(Image.open(workspace['stego']))
+        assert stego.shape[2] == 4 and (stego[..., 3] >= 254).all()
+
+    @pytest.mark.parametrize("bpc", [1, 4])
+    def test_16bit_png_keeps_full_depth(self, tmp_path, payload, bpc):
+        import cv2
+        rnd = np.random.default_rng(2)
+        pixels = rnd.integers(0, 65536, (80, 80, 3), dtype=np.uint16)
+        cover = str(tmp_path / "cover16.png")
+        cv2.imwrite(cover, pixels)
+        stego = str(tmp_path / "stego16.png")
+        self._roundtrip(cover, stego, payload, tmp_path, bits_per_channel=bpc, adaptive=True)
+        after = cv2.imread(stego, cv2.IMREAD_UNCHANGED)
+        assert after.dtype == np.uint16 and after.shape == pixels.shape
+        high = np.uint16(~((1 << bpc) - 1) & 0xFFFF)
+        assert np.array_equal(pixels & high, after & high)
+
+    def test_16bit_grayscale_png_keeps_full_depth(self, tmp_path, payload):
+        import cv2
+        gray = np.random.default_rng(3).integers(0, 65536, (80, 80), dtype=np.uint16)
+        cover = str(tmp_path / "gray16.png")
+        cv2.imwrite(cover, gray)
+        with Image.open(cover) as img:
+            assert capacity_bytes_for_image(img, 2) == (80 * 80 - PREAMBLE_PIXELS) * 3 * 2 // 8
+        stego = str(tmp_path / "stego16.png")
+        self._roundtrip(cover, stego, payload, tmp_path, bits_per_channel=2)
+        after = cv2.imread(stego, cv2.IMREAD_UNCHANGED)
+        assert after.dtype == np.uint16 and after.shape == (80, 80, 3)
+        assert all(np.array_equal(after[..., c] & 0xFFFC, gray & 0xFFFC) for c in range(3))
+
+    def test_invalid_carrier(self, workspace):
+        with pytest.raises(ValueError, match="carrier"):
+            embed_file_into_image(workspace['cover'], workspace['stego'], workspace['secret'], carrier='cmyk')
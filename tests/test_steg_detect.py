@@ -0,0 +1,374 @@
+"""Tests pour steg_detect.py — extraction de features, entraînement, détection."""
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+
+# Ajouter le dossier parent au path pour les imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import steg_detect
+from steg import embed_file_into_image
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """Petit corpus : covers (dont un sous-dossier) et leurs versions stego."""
+    cover_dir, stego_dir = tmp_path / "cover", tmp_path / "stego"
+    (cover_dir / "sub").mkdir(parents=True)
+    stego_dir.mkdir()
+    secret = tmp_path / "secret.bin"
+    secret.write_bytes(os.urandom(1200))
+    rng = np.random.default_rng(0)
+    for i in range(4):
+        base = rng.integers(60, 190, (64, 64, 3)).astype(np.int16)
+        smooth = np.clip(base // 8 * 8 + rng.integers(0, 3, base.shape), 0, 255).astype(np.uint8)
+        folder = cover_dir / "sub" if i % 2 else cover_dir
+        cover = folder / f"c{i}.png"
+        Image.fromarray(smooth).save(cover)
+        embed_file_into_image(str(cover), str(stego_dir / f"s{i}.png"), str(secret))
+    (cover_dir / "notes.txt").write_text("pas une image")
+    return tmp_path
+
+
+class TestParallelTraining:
+    def test_list_images_recursive_and_filtered(self, corpus):
+        paths = steg_detect.list_images(str(corpus / "cover"))
+        names = sorted(os.path.basename(p) for p in paths)
+        assert names == ["c0.png", "c1.png", "c2.png", "c3.png"]
+
+    def test_parallel_features_match_serial(self, corpus):
+        paths = steg_detect.list_images(str(corpus / "stego")) + [str(corpus / "missing.png")]
+        results = steg_detect.extract_features_parallel(paths, workers=2)
+        assert [p for p, _, _ in results] == paths
+        for path, feat, err in results[:-1]:
+            assert err is None
+            np.testing.assert_allclose(feat, steg_detect.extract_features(path))
+        assert results[-1][1] is None and results[-1][2]
+
+    def test_train_model(self, corpus, monkeypatch):
+        monkeypatch.setattr(steg_detect, "MODEL_PATH", str(corpus / "model.pkl"))
+        monkeypatch.setattr(steg_detect, "SCALER_PATH", str(corpus / "scaler.pkl"))
+        steg_detect.train_model(str(corpus / "cover"), str(corpus / "stego"), workers=2, n_jobs=2)
+        assert os.path.exists(corpus / "model.pkl")
+        assert os.path.exists(corpus / "scaler.pkl")
+
+
+class TestFeatureCache:
+    def test_cached_features_are_reused(self, corpus, monkeypatch):
+        cache = steg_detect.FeatureCache(str(corpus / "cache.sqlite"))
+        paths = steg_detect.list_images(str(corpus / "cover"))
+        first = steg_detect.extract_features_parallel(paths, workers=1, cache=cache)
+
+        def fail(path):
+            raise AssertionError("features recalculées")
+        monkeypatch.setattr(steg_detect, "extract_features", fail)
+        second = steg_detect.extract_features_parallel(paths, workers=1, cache=cache)
+        for (_, a, _), (_, b, err) in zip(first, second):
+            assert err is None
+            np.testing.assert_array_equal(a, b)
+
+    def test_modified_image_is_recomputed(self, corpus):
+        cache = steg_detect.FeatureCache(str(corpus / "cache.sqlite"))
+        path = str(corpus / "cover" / "c0.png")
+        before = steg_detect.extract_features_parallel([path], workers=1, cache=cache)[0][1]
+        Image.fromarray(np.zeros((64, 64, 3), dtype=np.uint8)).save(path)
+        after = steg_detect.extract_features_parallel([path], workers=1, cache=cache)[0][1]
+        np.testing.assert_allclose(after, steg_detect.extract_features(path))
+        assert not np.array_equal(before, after)
+
+    def test_hashing_runs_on_pool(self, corpus):
+        class RecordingPool:
+            def __init__(self):
+                self.calls = []
+
+            def map(self, task, items, chunksize=1):
+                items = list(items)
+                self.calls.append((task, items))
+                return map(task, items)
+
+        cache = steg_detect.FeatureCache(str(corpus / "cache.sqlite"))
+        paths = steg_detect.list_images(str(corpus / "cover"))
+        pool = RecordingPool()
+        steg_detect.extract_features_parallel(paths, workers=2, cache=cache, pool=pool)
+        assert pool.calls[0] == (steg_detect._file_digest, paths)
+        pool.calls.clear()
+        steg_detect.extract_features_parallel(paths, workers=2, cache=cache, pool=pool)
+        assert all(task is not steg_detect._file_digest for task, _ in pool.calls)
+
+    def test_version_separates_entries(self, corpus):
+        path = str(corpus / "cover" / "c0.png")
+        cache = steg_detect.FeatureCache(str(corpus / "cache.sqlite"))
+        key = cache.file_hash(path)
+        cache.put_many([(key, np.ones(9))])
+        other = steg_detect.FeatureCache(str(corpus / "cache.sqlite"), version=999)
+        assert other.get_many([key]) == {}
+        assert key in cache.get_many([key])
+
+    def test_extraction_mode_separates_entries(self, corpus, monkeypatch):
+        cache = steg_detect.FeatureCache(str(corpus / "cache.sqlite"))
+        path = str(corpus / "cover" / "c0.png")
+        steg_detect.extract_features_parallel([path], workers=1, cache=cache)
+        calls = []
+        monkeypatch.setattr(steg_detect, "extract_features_tiled", lambda *a: calls.append(a) or np.zeros(18))
+        tiled = steg_detect.extract_features_parallel([path], workers=1, cache=cache, tile=32)
+        assert len(calls) == 1 and not tiled[0][1].any()
+        assert steg_detect.extract_features_parallel([path], workers=1, cache=cache)[0][1].any()
+
+    def test_outdated_schema_is_recreated(self, corpus):
+        import sqlite3
+        db = sqlite3.connect(str(corpus / "old.sqlite"))
+        db.execute("CREATE TABLE features (hash TEXT, version INTEGER, vector BLOB, PRIMARY KEY (hash, version))")
+        db.commit()
+        db.close()
+        cache = steg_detect.FeatureCache(str(corpus / "old.sqlite"))
+        cache.put_many([("h", np.ones(9))], mode="tile:64")
+        assert list(cache.get_many(["h"], mode="tile:64")) == ["h"]
+
+
+class TestFeatureSchema:
+    def test_v2_matches_per_channel_reference(self):
+        import cv2
+        from scipy.stats import chisquare
+        img = np.random.default_rng(2).integers(0, 256, (48, 40, 3), dtype=np.uint8)
+        expected = []
+        for ch in cv2.split(img):
+            noise = np.mean(np.abs(ch.astype(np.int16) - cv2.GaussianBlur(ch, (5, 5), 0)))
+            hist = np.bincount(ch.ravel(), minlength=256) / ch.size
+            expected += [np.mean(ch & 1), noise, chisquare(hist + 1e-6)[0]]
+        np.testing.assert_allclose(steg_detect.features_from_image(img, 2), expected, rtol=1e-5)
+
+    def test_v1_kept_for_old_models(self, corpus):
+        path = str(corpus / "stego" / "s0.png")
+        v1 = steg_detect.extract_features(path, version=1)
+        assert v1.shape == (9,)
+        assert not np.allclose(v1, steg_detect.extract_features(path, version=2))
+
+        class OldForest:
+            pass
+        assert steg_detect.model_feature_version((OldForest(), None)) == 1
+        assert steg_detect.model_feature_version((None, None)) == steg_detect.FEATURE_VERSION
+        with pytest.raises(ValueError, match="Version de features"):
+            steg_detect.extract_features(path, version=999)
+
+    def test_trained_model_records_version(self, corpus, monkeypatch):
+        monkeypatch.setattr(steg_detect, "MODEL_PATH", str(corpus / "model.pkl"))
+        monkeypatch.setattr(steg_detect, "SCALER_PATH", str(corpus / "scaler.pkl"))
+        steg_detect.train_model(str(corpus / "cover"), str(corpus / "stego"), workers=1, n_jobs=1)
+        model = steg_detect.load_model()
+        assert steg_detect.model_feature_version(model) == steg_detect.FEATURE_VERSION
+
+
+def smooth_cover(h, w, seed=0):
+    """Cover synthétique lisse (corrélation spatiale proche d'une photo)."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    base = rng.normal(128, 60, (h // 8 + 2, w // 8 + 2, 3)).astype(np.float32)
+    img = cv2.GaussianBlur(cv2.resize(base, (w, h), interpolation=cv2.INTER_CUBIC), (0, 0), 3)
+    return np.clip(img + rng.normal(0, 2, img.shape), 0, 255).astype(np.uint8)
+
+
+def embed_lsb(img, rate, seed=1):
+    """Remplace le LSB d'une fraction rate des échantillons par un bit aléatoire."""
+    rng = np.random.default_rng(seed)
+    out = img.copy()
+    mask = rng.random(img.shape) < rate
+    out[mask] = (out[mask] & 0xFE) | rng.integers(0, 2, mask.sum(), dtype=np.uint8)
+    return out
+
+
+class TestLsbAttacks:
+    @pytest.mark.parametrize("rate", [0.0, 0.25, 0.5])
+    def test_rs_and_spa_estimate_rate(self, rate):
+        planes = steg_detect._structural_sample(embed_lsb(smooth_cover(512, 512), rate))
+        for estimate in (steg_detect.rs_rate(planes), steg_detect.spa_rate(planes)):
+            assert estimate.shape == (3,)
+            np.testing.assert_allclose(estimate, rate, atol=0.1)
+
+    def test_pov_probability(self):
+        equalized = np.full((1, 256), 400.0)
+        unequal = np.tile([600.0, 200.0], 128)[None]
+        assert steg_detect.pov_probability(equalized)[0] > 0.99
+        assert steg_detect.pov_probability(unequal)[0] < 0.01
+
+    def test_v3_features_and_heuristic(self, tmp_path):
+        import cv2
+        cover = smooth_cover(128, 128)
+        clean, stego = str(tmp_path / "clean.png"), str(tmp_path / "stego.png")
+        cv2.imwrite(clean, cover)
+        cv2.imwrite(stego, embed_lsb(cover, 1.0))
+        X = np.array([steg_detect.extract_features(clean), steg_detect.extract_features(stego)])
+        assert X.shape == (2, 18)
+        np.testing.assert_allclose(X[:, :9], [steg_detect.extract_features(p, version=2)
+                                              for p in (clean, stego)])
+        attacks = steg_detect.lsb_attacks(stego)
+        np.testing.assert_allclose(X[1, 9:].reshape(3, 3),
+                                   np.stack([attacks["pov"], attacks["rs"], attacks["spa"]], axis=1),
+                                   rtol=1e-5)
+        heur = steg_detect.heuristic_scores(X)
+        assert heur[1] > heur[0]
+        assert heur[1] == pytest.approx(steg_detect.heuristic_score(X[1]))
+
+
+class TestTiled:
+    @pytest.fixture
+    def half_stego(self, tmp_path):
+        import cv2
+        cover = smooth_cover(320, 384)
+        img = cover.copy()
+        img[:, :192] = embed_lsb(cover[:, :192], 1.0)
+        paths = {}
+        for ext in ("png", "bmp"):
+            paths[ext] = str(tmp_path / f"half.{ext}")
+            cv2.imwrite(paths[ext], img)
+        return paths
+
+    @pytest.mark.parametrize("ext", ["png", "bmp"])
+    def test_tiled_features_match_full_image(self, half_stego, ext):
+        path = half_stego[ext]
+        result = steg_detect.analyze_tiled(path, tile=96)
+        assert result["tiles"] == result["total_tiles"] == 4 * 4
+        assert not result["early_stop"]
+        np.testing.assert_allclose(result["features"], steg_detect.extract_features(path), rtol=1e-5, atol=1e-6)
+
+    def test_tiled_features_match_subsampled_full_image(self, tmp_path):
+        """Au-delà de STRUCTURAL_SAMPLE pixels, les deux modes sous-échantillonnent les mêmes lignes."""
+        import cv2
+        cover = smooth_cover(1100, 1000)
+        img = cover.copy()
+        img[:, :500] = embed_lsb(cover[:, :500], 1.0)
+        path = str(tmp_path / "large.png")
+        cv2.imwrite(path, img)
+        assert steg_detect._structural_step(1100, 1000) > 1
+        tiled = steg_detect.extract_features_tiled(path, tile=256)
+        np.testing.assert_allclose(tiled, steg_detect.extract_features(path), rtol=1e-5, atol=1e-6)
+
+    def test_bmp_is_memory_mapped(self, half_stego):
+        import cv2
+        img = steg_detect.open_image_array(half_stego["bmp"])
+        assert isinstance(img.base, np.memmap) or isinstance(img, np.memmap)
+        np.testing.assert_array_equal(img, cv2.imread(half_stego["png"]))
+
+    def test_heatmap_localizes_payload(self, half_stego, tmp_path):
+        heatmap = steg_detect.analyze_tiled(half_stego["png"], tile=64)["heatmap"]
+        assert heatmap.shape == (5, 6)
+        assert heatmap[:, :3].mean() > heatmap[:, 3:].mean() + 0.3
+        steg_detect.save_heatmap(heatmap, str(tmp_path / "map.npy"))
+        np.testing.assert_array_equal(np.load(tmp_path / "map.npy"), heatmap)
+
+    def test_early_stop(self, tmp_path):
+        import cv2
+        cover = smooth_cover(256, 256)
+        stego, clean = str(tmp_path / "full.png"), str(tmp_path / "clean.png")
+        cv2.imwrite(stego, embed_lsb(cover, 1.0))
+        cv2.imwrite(clean, cover)
+        result = steg_detect.analyze_tiled(stego, tile=32, early_stop=True)
+        assert result["early_stop"] and result["tiles"] < result["total_tiles"]
+        assert np.isnan(result["heatmap"]).sum() == result["total_tiles"] - result["tiles"]
+        assert steg_detect.analyze_tiled(clean, tile=32, early_stop=True)["tiles"] == 64
+
+    def test_requires_version_2(self, half_stego):
+        with pytest.raises(ValueError, match="version 2"):
+            steg_detect.analyze_tiled(half_stego["png"], version=1)
+
+    def test_scan_tiled(self, half_stego):
+        rows = list(steg_detect.scan_paths([half_stego["png"]], model=(None, None), workers=1, tile=64))
+        expected = list(steg_detect.scan_paths([half_stego["png"]], model=(None, None), workers=1))
+        assert rows == expected
+
+
+class TestCompactModel:
+    @pytest.fixture
+    def trained(self, corpus, monkeypatch):
+        monkeypatch.setattr(steg_detect, "MODEL_PATH", str(corpus / "model.pkl"))
+        monkeypatch.setattr(steg_detect, "SCALER_PATH", str(corpus / "scaler.pkl"))
+        steg_detect.train_model(str(corpus / "cover"), str(corpus / "stego"), workers=1, n_jobs=1)
+        return corpus
+
+    def test_npz_matches_sklearn(self, trained):
+        clf, scaler = steg_detect.load_model(str(trained / "model.pkl"), str(trained / "scaler.pkl"))
+        forest, compact_scaler = steg_detect.load_compact_model(str(trained / "model.npz"))
+        X = np.array([steg_detect.extract_features(p) for p in steg_detect.list_images(str(trained))])
+        X = np.vstack([X, X * np.random.default_rng(3).normal(1, 0.2, X.shape)])
+        np.testing.assert_array_equal(compact_scaler.transform(X), scaler.transform(X))
+        np.testing.assert_allclose(forest.predict_proba(compact_scaler.transform(X)),
+                                   clf.predict_proba(scaler.transform(X)), atol=1e-12)
+        assert forest.n_estimators == len(clf.estimators_)
+        assert forest.feature_version_ == steg_detect.FEATURE_VERSION
+
+    def test_load_model_prefers_npz(self, trained):
+        forest, _ = steg_detect.load_model()
+        assert isinstance(forest, steg_detect.CompactForest)
+        os.remove(trained / "model.npz")
+        clf, _ = steg_detect.load_model()
+        assert not isinstance(clf, steg_detect.CompactForest)
+
+    def test_unknown_format_rejected(self, trained, tmp_path):
+        data = dict(np.load(trained / "model.npz"))
+        data["format"] = np.array(99)
+        np.savez(tmp_path / "future.npz", **data)
+        with pytest.raises(ValueError, match="Format de modèle"):
+            steg_detect.load_compact_model(str(tmp_path / "future.npz"))
+
+    def test_import_is_light(self):
+        import subprocess
+        code = ("import sys, steg_detect; "
+                "print(sorted(m for m in ('cv2', 'scipy', 'sklearn') if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        assert out.stdout.strip() == "[]"
+
+    def test_numpy_statistics_match_scipy(self):
+        from scipy.special import chdtrc
+        from scipy.stats import chisquare
+        for df in (1, 5, 127):
+            for chi in (0.3, 20.0, 126.0, 400.0):
+                assert steg_detect._chi2_sf(chi, df) == pytest.approx(chdtrc(df, chi), abs=1e-12)
+        observed = np.random.default_rng(4).random(256)
+        assert steg_detect._chisquare_uniform(observed) == pytest.approx(chisquare(observed)[0], rel=1e-12)
+
+
+class TestScan:
+    @pytest.fixture
+    def model(self, corpus, monkeypatch):
+        monkeypatch.setattr(steg_detect, "MODEL_PATH", str(corpus / "model.pkl"))
+        monkeypatch.setattr(steg_detect, "SCALER_PATH", str(corpus / "scaler.pkl"))
+        steg_detect.train_model(str(corpus / "cover"), str(corpus / "stego"), workers=1, n_jobs=1)
+        return steg_detect.load_model()
+
+    def test_heuristic_scores_match_single(self, corpus):
+        paths = steg_detect.list_images(str(corpus))
+        X = np.array([steg_detect.extract_features(p) for p in paths])
+        expected = [steg_detect.heuristic_score(x) for x in X]
+        np.testing.assert_allclose(steg_detect.heuristic_scores(X), expected)
+
+    def test_scan_paths_batches(self, corpus, model):
+        paths = steg_detect.list_images(str(corpus)) + [str(corpus / "missing.png")]
+        rows = list(steg_detect.scan_paths(paths, model=model, workers=2, batch_size=3))
+        assert [r["path"] for r in rows] == paths
+        assert "error" in rows[-1]
+        clf, scaler = model
+        for row, path in zip(rows[:-1], paths):
+            feat = steg_detect.extract_features(path).reshape(1, -1)
+            expected = clf.predict_proba(scaler.transform(feat))[0][1]
+            assert row["ml_prob"] == pytest.approx(expected, abs=1e-4)
+            assert row["verdict"] in ("suspect", "clean")
+
+    def test_scan_batch_of_unreadable_files(self, corpus, model):
+        corrupt = corpus / "corrupt.png"
+        corrupt.write_bytes(b"pas une image")
+        paths = [str(corrupt)] + steg_detect.list_images(str(corpus / "cover"))
+        rows = list(steg_detect.scan_paths(paths, model=model, workers=1, batch_size=1))
+        assert [r["path"] for r in rows] == paths
+        assert "error" in rows[0]
+        assert all("verdict" in r for r in rows[1:])
+
+    def test_scan_directory_csv(self, corpus, model):
+        import csv
+        import io
+        out = io.StringIO()
+        count = steg_detect.scan_directory(str(corpus / "stego"), out, "csv", model=model, workers=1)
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        assert count == len(rows) == 4
+        assert set(rows[0]) >= {"path", "heuristic", "ml_prob", "score", "verdict"}
@@ -13,7 +13,11 @@ from utils import (
     bytes_to_bits, bits_to_bytes,
     prepare_payload_bytes, parse_header_from_bytes,
     verify_payload, encrypt_payload, decrypt_payload,
-    MAGIC, HEADER_SIZE, HEADER_FMT,
+    PayloadStream, encrypt_chunks, ShardStream, pack_shard, unpack_shard,
+    derive_key, clear_key_cache, pack_extensions, parse_extensions, unpack_kdf, pack_kdf,
+    choose_compression, compress_chunks, decompress_chunks,
+    COMP_NONE, COMP_ZLIB, COMP_LZMA, COMP_BZ2, COMP_GZIP, CHUNK_SIZE,
+    MAGIC, HEADER_SIZE, HEADER_FMT, FLAG_EXTENDED, EXT_KDF, EXT_SHARD, DEFAULT_KDF, SCRYPT_KDF, KDF_SCRYPT,
 )
 
 
@@ -42,6 +46,10 @@ class TestFlags:
         assert adaptive is False
         assert encrypted is True
 
+    @pytest.mark.parametrize("bpc", [1, 2, 3, 4])
+    def test_encode_decode_bits_per_channel(self, bpc):
+        assert decode_flags(encode_flags(bpc, True, True))[0] == bpc
+
     def test_encode_decode_all_flags(self):
         flags = encode_flags(2, True, True)
         bpc, adaptive, encrypted = decode_flags(flags)
@@ -117,6 +125,25 @@ class TestHeaderPayload:
         finally:
             os.unlink(path)
 
+    def test_encrypted_payload_records_kdf(self):
+        path = self._make_temp_file()
+        try:
+            payload = prepare_payload_bytes(path, password="secret")
+            magic, size, checksum, flags = parse_header_from_bytes(payload[:HEADER_SIZE])
+            assert flags & FLAG_EXTENDED
+            fields = parse_extensions(payload[HEADER_SIZE:])
+            assert unpack_kdf(fields[EXT_KDF]) == DEFAULT_KDF
+        finally:
+            os.unlink(path)
+
+    def test_extensions_roundtrip(self):
+        block = pack_extensions({1: b'abc', 7: b''})
+        assert parse_extensions(block + b'payload') == {1: b'abc', 7: b''}
+
+    def test_extensions_truncated(self):
+        with pytest.raises(ValueError, match="tronqué"):
+            parse_extensions(pack_extensions({1: b'abcdef'})[:5])
+
     def test_verify_payload_valid(self):
         import hashlib
         data = b"some payload data"
@@ -137,6 +164,109 @@ class TestHeaderPayload:
             prepare_payload_bytes("/nonexistent/file.txt")
 
 
+    def test_payload_stream_small_chunks(self):
+        """Le flux par petits blocs produit un payload gzip valide et un entête cohérent."""
+        import gzip
+        import hashlib
+        content = os.urandom(3000) + b"a" * 5000
+        path = self._make_temp_file(content)
+        try:
+            stream = PayloadStream(path, chunk_size=7, compression=(COMP_GZIP, 9))
+            payload = b''.join(stream)
+            magic, size, checksum, flags = parse_header_from_bytes(stream.header(0))
+            assert size == len(payload)
+            assert checksum == hashlib.sha256(payload).digest()
+            assert gzip.decompress(payload) == content
+        finally:
+            os.unlink(path)
+
+    def test_payload_stream_single_use(self):
+        path = self._make_temp_file()
+        try:
+            stream = PayloadStream(path)
+            b''.join(stream)
+            with pytest.raises(ValueError):
+                b''.join(stream)
+        finally:
+            os.unlink(path)
+
+    def test_shard_stream_slice(self):
+        """Un fragment = bloc d'extensions EXT_SHARD puis la tranche demandée du payload."""
+        import hashlib
+        content = os.urandom(5000)
+        path = self._make_temp_file(content)
+        try:
+            field = pack_shard(b"s" * 16, 1, 3, struct.pack(HEADER_FMT, MAGIC, 5000, b"\0" * 32, 0))
+            stream = ShardStream(path, 1000, 2500, field, encrypted=False, chunk_size=700)
+            data = b''.join(stream)
+            (length,) = struct.unpack('>H', data[:2])
+            assert parse_extensions(data[:2 + length]) == {EXT_SHARD: field}
+            assert data[2 + length:] == content[1000:3500]
+            magic, size, checksum, flags = parse_header_from_bytes(stream.header(0))
+            assert size == len(data) and checksum == hashlib.sha256(data).digest()
+            assert flags & FLAG_EXTENDED
+            assert unpack_shard(field)[:3] == (b"s" * 16, 1, 3)
+            with pytest.raises(ValueError):
+                unpack_shard(pack_shard(b"s" * 16, 3, 3, field[20:]))
+        finally:
+            os.unlink(path)
+
+# ==================== Compression ====================
+
+class TestCompression:
+    def _make_temp_file(self, content):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        return path
+
+    @pytest.mark.parametrize("method", [COMP_NONE, COMP_GZIP, COMP_ZLIB, COMP_LZMA, COMP_BZ2])
+    def test_chunks_roundtrip(self, method):
+        data = b"abc" * 5000 + os.urandom(500)
+        pieces = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+        packed = list(compress_chunks(pieces, 6, method))
+        assert b''.join(decompress_chunks(packed, method)) == data
+
+    @pytest.mark.parametrize("method", [COMP_GZIP, COMP_ZLIB, COMP_LZMA, COMP_BZ2])
+    def test_decompressed_pieces_are_bounded(self, method):
+        """Un petit bloc très compressé est rendu par morceaux d'au plus CHUNK_SIZE octets."""
+        data = bytes(8 * CHUNK_SIZE + 123)
+        packed = b''.join(compress_chunks([data], 6, method))
+        assert len(packed) < CHUNK_SIZE
+        pieces = list(decompress_chunks([packed[:len(packed) // 2], packed[len(packed) // 2:]], method))
+        assert max(len(p) for p in pieces) <= CHUNK_SIZE
+        assert b''.join(pieces) == data
+
+    def test_truncated_stream_fails(self):
+        packed = b''.join(compress_chunks([b"abc" * 5000], 6, COMP_ZLIB))
+        with pytest.raises(ValueError, match="décompression"):
+            b''.join(decompress_chunks([packed[:-5]], COMP_ZLIB))
+
+    def test_auto_keeps_incompressible_raw(self):
+        path = self._make_temp_file(os.urandom(100_000))
+        try:
+            assert choose_compression(path) == (COMP_NONE, 0)
+        finally:
+            os.unlink(path)
+
+    def test_auto_compresses_text(self):
+        path = self._make_temp_file(b"hello world " * 10_000)
+        try:
+            assert choose_compression(path)[0] == COMP_ZLIB
+        finally:
+            os.unlink(path)
+
+    def test_auto_payload_does_not_grow(self):
+        """Un fichier incompressible n'est pas agrandi par la compression."""
+        content = os.urandom(20_000)
+        path = self._make_temp_file(content)
+        try:
+            payload = prepare_payload_bytes(path)
+            assert len(payload) < HEADER_SIZE + len(content) + 16
+        finally:
+            os.unlink(path)
+
+
 # ==================== Chiffrement AES ====================
 
 class TestEncryption:
@@ -177,3 +307,49 @@ class TestEncryption:
         encrypted = encrypt_payload(data, password)
         decrypted = decrypt_payload(encrypted, password)
         assert decrypted == data
+
+    def test_encrypt_chunks_matches_decrypt(self):
+        """Le chiffrement incrémental produit le format de encrypt_payload."""
+        data = os.urandom(1000)
+        pieces = [data[i:i + 33] for i in range(0, len(data), 33)]
+        encrypted = b''.join(encrypt_chunks(pieces, "pw"))
+        assert decrypt_payload(encrypted, "pw") == data
+
+
+# ==================== Dérivation de clé ====================
+
+class TestKeyDerivation:
+    def test_cache_returns_same_key(self):
+        clear_key_cache()
+        salt = os.urandom(16)
+        assert derive_key("pw", salt) is derive_key("pw", salt)
+
+    def test_cache_distinguishes_parameters(self):
+        salt = os.urandom(16)
+        assert derive_key("pw", salt) != derive_key("pw2", salt)
+        assert derive_key("pw", salt) != derive_key("pw", salt, (0, 1000, 0, 0))
+
+    def test_clear_key_cache(self):
+        salt = os.urandom(16)
+        key = derive_key("pw", salt)
+        clear_key_cache()
+        again = derive_key("pw", salt)
+        assert again == key and again is not key
+
+    @pytest.mark.parametrize("kdf", [(0, 0, 0, 0), (0, 10_000_001, 0, 0), (KDF_SCRYPT, 1 << 21, 8, 1),
+                                     (KDF_SCRYPT, 3 << 10, 8, 1), (KDF_SCRYPT, 1 << 10, 0, 1),
+                                     (KDF_SCRYPT, 1 << 10, 8, 255), (KDF_SCRYPT, 1 << 20, 16, 1), (7, 1, 0, 0)])
+    def test_unpack_kdf_rejects_untrusted_parameters(self, kdf):
+        with pytest.raises(ValueError, match="KDF"):
+            unpack_kdf(pack_kdf(kdf))
+
+    def test_unpack_kdf_accepts_defaults(self):
+        for kdf in (DEFAULT_KDF, SCRYPT_KDF, (KDF_SCRYPT, 1 << 20, 8, 1)):
+            assert unpack_kdf(pack_kdf(kdf)) == kdf
+
+    def test_scrypt_roundtrip(self):
+        kdf = (KDF_SCRYPT, 1 << 10, 8, 1)
+        encrypted = encrypt_payload(b"data", "pw", kdf)
+        assert decrypt_payload(encrypted, "pw", kdf) == b"data"
+        with pytest.raises(ValueError):
+            decrypt_payload(encrypted, "pw")
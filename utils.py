@@ -1,84 +1,482 @@
 # utils.py
-import gzip
 import hashlib
 import struct
 import os
+import zlib
+from collections import OrderedDict
 
 MAGIC = b'STEG'   # 4 bytes
 HEADER_FMT = '>4sI32sB'  # magic(4), size(4 unsigned), sha256(32), flags(1)
 HEADER_SIZE = struct.calcsize(HEADER_FMT)  # 41 bytes
+CHUNK_SIZE = 1 << 20  # taille des blocs lus dans le fichier secret
 
-# --------- Encryption (AES-256-CBC) ----------
+# --------- Key derivation ----------
+
+KDF_PBKDF2 = 0   # PBKDF2 (HMAC-SHA1, défaut de pycryptodome), cost = itérations
+KDF_SCRYPT = 1   # scrypt, cost = N, avec r et p
+KDF_FMT = '>BIBB'  # algo(1), cost(4), r(1), p(1)
+
+# Paramètres KDF : (algo, cost, r, p)
+DEFAULT_KDF = (KDF_PBKDF2, 100_000, 0, 0)   # anciennes images (pas de champ KDF)
+SCRYPT_KDF = (KDF_SCRYPT, 1 << 15, 8, 1)
+
+# Bornes des paramètres lus dans une image (non fiables) : temps et mémoire de dérivation
+MAX_PBKDF2_COUNT = 10_000_000
+MAX_SCRYPT_N = 1 << 20
+MAX_SCRYPT_RP = 16              # r * p
+MAX_SCRYPT_MEMORY = 1 << 30     # 128 * N * r octets
+
+KEY_CACHE_SIZE = 64
+_key_cache = OrderedDict()
+
+def derive_key(password, salt, kdf=DEFAULT_KDF):
+    """Dérive une clé AES-256 depuis un mot de passe (PBKDF2 ou scrypt).
+
+    Les clés sont gardées dans un cache LRU borné indexé par
+    (sha256 du mot de passe, salt, paramètres KDF) : décoder plusieurs fois
+    la même image ne refait pas le calcul. clear_key_cache() le vide.
+    """
+    cache_key = (hashlib.sha256(password.encode('utf-8')).digest(), bytes(salt), tuple(kdf))
+    key = _key_cache.get(cache_key)
+    if key is not None:
+        _key_cache.move_to_end(cache_key)
+        return key
 
-def derive_key(password, salt):
-    """Dérive une clé AES-256 depuis un mot de passe via PBKDF2-SHA256."""
-    from Crypto.Protocol.KDF import PBKDF2
-    return PBKDF2(password.encode('utf-8'), salt, dkLen=32, count=100_000)
+    algo, cost, r, p = kdf
+    if algo == KDF_PBKDF2:
+        from Crypto.Protocol.KDF import PBKDF2
+        key = PBKDF2(password.encode('utf-8'), salt, dkLen=32, count=cost)
+    elif algo == KDF_SCRYPT:
+        from Crypto.Protocol.KDF import scrypt
+        key = scrypt(password.encode('utf-8'), salt, key_len=32, N=cost, r=r, p=p)
+    else:
+        raise ValueError(f"KDF inconnu: {algo}")
 
-def encrypt_payload(data, password):
+    _key_cache[cache_key] = key
+    if len(_key_cache) > KEY_CACHE_SIZE:
+        _key_cache.popitem(last=False)
+    return key
+
+def clear_key_cache():
+    """Vide le cache des clés dérivées."""
+    _key_cache.clear()
+
+def pack_kdf(kdf):
+    return struct.pack(KDF_FMT, *kdf)
+
+def unpack_kdf(data):
+    """Paramètres KDF d'une image ; refusés s'ils imposeraient une dérivation démesurée."""
+    if len(data) != struct.calcsize(KDF_FMT):
+        raise ValueError("Champ KDF invalide")
+    algo, cost, r, p = kdf = struct.unpack(KDF_FMT, data)
+    if algo == KDF_PBKDF2:
+        if not 1 <= cost <= MAX_PBKDF2_COUNT:
+            raise ValueError(f"Paramètres KDF hors limites: {cost} itérations PBKDF2")
+    elif algo == KDF_SCRYPT:
+        if cost < 2 or cost > MAX_SCRYPT_N or cost & (cost - 1):
+            raise ValueError(f"Paramètres KDF hors limites: N={cost} (puissance de 2 <= {MAX_SCRYPT_N})")
+        if r < 1 or p < 1 or r * p > MAX_SCRYPT_RP or 128 * cost * r > MAX_SCRYPT_MEMORY:
+            raise ValueError(f"Paramètres KDF hors limites: scrypt N={cost}, r={r}, p={p}")
+    else:
+        raise ValueError(f"KDF inconnu: {algo}")
+    return kdf
+
+# --------- Encryption (AES-256-CBC) ----------
+
+def encrypt_payload(data, password, kdf=DEFAULT_KDF):
     """Chiffre les données avec AES-256-CBC. Retourne salt(16) + iv(16) + ciphertext."""
+    return b''.join(encrypt_chunks([data], password, kdf))
+
+def encrypt_chunks(chunks, password, kdf=DEFAULT_KDF, salt=None):
+    """Version incrémentale de encrypt_payload : produit salt + iv, puis le
+    ciphertext au fil des blocs reçus (même format que encrypt_payload).
+
+    salt peut être fixé pour réutiliser une clé déjà dérivée sur un lot
+    d'images (l'IV reste aléatoire pour chaque message).
+    """
     from Crypto.Cipher import AES
     from Crypto.Util.Padding import pad
 
-    salt = os.urandom(16)
-    key = derive_key(password, salt)
+    salt = os.urandom(16) if salt is None else salt
+    key = derive_key(password, salt, kdf)
     cipher = AES.new(key, AES.MODE_CBC)
-    ciphertext = cipher.encrypt(pad(data, AES.block_size))
-    return salt + cipher.iv + ciphertext
+    yield salt + cipher.iv
+    rest = b''
+    for chunk in chunks:
+        rest += chunk
+        n = len(rest) - len(rest) % AES.block_size
+        if n:
+            yield cipher.encrypt(rest[:n])
+            rest = rest[n:]
+    yield cipher.encrypt(pad(rest, AES.block_size))
 
-def decrypt_payload(data, password):
+def decrypt_payload(data, password, kdf=DEFAULT_KDF):
     """Déchiffre les données AES-256-CBC. Attend salt(16) + iv(16) + ciphertext."""
+    if len(data) < 48:
+        raise ValueError("Données chiffrées trop courtes")
+    return b''.join(decrypt_chunks([data], password, kdf))
+
+def decrypt_chunks(chunks, password, kdf=DEFAULT_KDF):
+    """Version incrémentale de decrypt_payload : le dernier bloc est gardé
+    jusqu'à la fin du flux pour retirer le padding."""
     from Crypto.Cipher import AES
     from Crypto.Util.Padding import unpad
 
-    if len(data) < 48:
+    buf = b''
+    cipher = None
+    for chunk in chunks:
+        buf += chunk
+        if cipher is None:
+            if len(buf) < 32:
+                continue
+            salt, iv, buf = buf[:16], buf[16:32], buf[32:]
+            cipher = AES.new(derive_key(password, salt, kdf), AES.MODE_CBC, iv=iv)
+        n = len(buf) - len(buf) % AES.block_size
+        if n == len(buf):
+            n -= AES.block_size
+        if n > 0:
+            yield cipher.decrypt(buf[:n])
+            buf = buf[n:]
+    if cipher is None or not buf:
         raise ValueError("Données chiffrées trop courtes")
-    salt = data[:16]
-    iv = data[16:32]
-    ciphertext = data[32:]
-    key = derive_key(password, salt)
-    cipher = AES.new(key, AES.MODE_CBC, iv=iv)
     try:
-        return unpad(cipher.decrypt(ciphertext), AES.block_size)
+        yield unpad(cipher.decrypt(buf), AES.block_size)
     except (ValueError, KeyError):
         raise ValueError("Déchiffrement échoué — mot de passe incorrect ou données corrompues")
 
 # --------- Flags ----------
 
-def encode_flags(bits_per_channel, adaptive, encrypted=False):
+FLAG_KEYED_ORDER = 1 << 4   # ordre des pixels par permutation de Feistel à clé
+FLAG_STABLE_MAP = 1 << 5    # carte adaptative calculée sans les bits modifiés
+FLAG_EXTENDED = 1 << 6      # le payload commence par un bloc d'extensions
+FLAG_PREAMBLE = 1 << 7      # paramètres répétés dans un préambule à emplacement fixe
+
+def encode_flags(bits_per_channel, adaptive, encrypted=False, keyed_order=False, stable_map=False):
     flags = 0
-    flags |= (bits_per_channel & 0b11)        # bits 0-1
+    flags |= (bits_per_channel & 0b11)        # bits 0-1 (4 bits par canal codé 0)
     flags |= (1 << 2) if adaptive else 0      # bit 2
     flags |= (1 << 3) if encrypted else 0     # bit 3
+    flags |= FLAG_KEYED_ORDER if keyed_order else 0  # bit 4
+    flags |= FLAG_STABLE_MAP if stable_map else 0    # bit 5
     return flags
 
 def decode_flags(flags_byte):
-    bits_per_channel = flags_byte & 0b11
+    bits_per_channel = (flags_byte & 0b11) or 4
     adaptive = bool((flags_byte >> 2) & 1)
     encrypted = bool((flags_byte >> 3) & 1)
     return bits_per_channel, adaptive, encrypted
 
+# --------- Préambule ----------
+# Écrit à 1 bit par canal dans les premiers pixels de la permutation à clé,
+# indépendamment des paramètres de l'image : il suffit de le lire pour
+# connaître bits_per_channel et adaptive avant de chercher l'entête.
+
+PREAMBLE_MAGIC = b'STGP'
+PREAMBLE_FMT = '>4sBB'  # magic(4), version(1), flags(1) (bits 0-2 de encode_flags)
+PREAMBLE_SIZE = struct.calcsize(PREAMBLE_FMT)  # 6 bytes
+PREAMBLE_VERSION = 1
+
+def pack_preamble(bits_per_channel, adaptive):
+    return struct.pack(PREAMBLE_FMT, PREAMBLE_MAGIC, PREAMBLE_VERSION, encode_flags(bits_per_channel, adaptive))
+
+def parse_preamble(data):
+    """Retourne (bits_per_channel, adaptive), ou None si data n'est pas un préambule."""
+    if len(data) < PREAMBLE_SIZE:
+        return None
+    magic, version, flags = struct.unpack(PREAMBLE_FMT, data[:PREAMBLE_SIZE])
+    if magic != PREAMBLE_MAGIC:
+        return None
+    if version != PREAMBLE_VERSION:
+        raise ValueError(f"Version de format non supportée: {version}")
+    bits_per_channel, adaptive, _ = decode_flags(flags)
+    return bits_per_channel, adaptive
+
+# --------- Extensions ----------
+# Bloc placé au début du payload quand FLAG_EXTENDED est mis (donc couvert
+# par la taille et le sha256 de l'entête) : longueur(2) puis des champs
+# type(1) + longueur(1) + valeur. Les types inconnus sont ignorés.
+
+EXT_KDF = 1          # paramètres KDF (KDF_FMT)
+EXT_COMPRESSION = 2  # méthode et niveau de compression (COMP_FMT)
+EXT_SHARD = 3        # fragment d'un payload réparti sur plusieurs images (SHARD_FMT)
+
+# set_id(16), index(2), nombre de fragments(2), puis l'entête (HEADER_FMT) du
+# payload complet : sa taille, son sha256 et ses flags
+SHARD_FMT = '>16sHH' + HEADER_FMT[1:]
+SHARD_SIZE = struct.calcsize(SHARD_FMT)
+
+def pack_shard(set_id, index, count, set_header):
+    return struct.pack('>16sHH', set_id, index, count) + set_header
+
+def unpack_shard(data):
+    """Retourne (set_id, index, count, entête du payload complet)."""
+    if len(data) != SHARD_SIZE:
+        raise ValueError("Champ fragment invalide")
+    set_id, index, count = struct.unpack('>16sHH', data[:20])
+    if not index < count:
+        raise ValueError("Champ fragment invalide")
+    return set_id, index, count, data[20:]
+
+def pack_extensions(fields):
+    """Sérialise un dict {type: bytes} en bloc d'extensions."""
+    body = b''.join(struct.pack('>BB', t, len(v)) + v for t, v in sorted(fields.items()))
+    return struct.pack('>H', len(body)) + body
+
+def parse_extensions(data):
+    """Retourne le dict {type: bytes} d'un bloc d'extensions complet."""
+    if len(data) < 2:
+        raise ValueError("Bloc d'extensions tronqué")
+    (length,) = struct.unpack('>H', data[:2])
+    body = data[2:2 + length]
+    if len(body) < length:
+        raise ValueError("Bloc d'extensions tronqué")
+    fields, pos = {}, 0
+    while pos < length:
+        if pos + 2 > length:
+            raise ValueError("Bloc d'extensions invalide")
+        t, n = struct.unpack('>BB', body[pos:pos + 2])
+        if pos + 2 + n > length:
+            raise ValueError("Bloc d'extensions invalide")
+        fields[t] = body[pos + 2:pos + 2 + n]
+        pos += 2 + n
+    return fields
+
 # --------- Payload ----------
 
-def prepare_payload_bytes(file_path, bits_per_channel=1, adaptive=False, password=None):
-    """Lit un fichier, le compresse, le chiffre si password, et retourne header+payload."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Le fichier '{file_path}' n'existe pas.")
+def read_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """Lit un fichier par blocs de chunk_size octets."""
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+# --------- Compression ----------
+
+COMP_GZIP = 0   # anciennes images (pas de champ compression)
+COMP_NONE = 1
+COMP_ZLIB = 2
+COMP_LZMA = 3
+COMP_BZ2 = 4
+COMP_FMT = '>BB'  # méthode(1), niveau(1)
 
+COMPRESSION_NAMES = {'gzip': COMP_GZIP, 'none': COMP_NONE, 'zlib': COMP_ZLIB,
+                     'lzma': COMP_LZMA, 'bz2': COMP_BZ2}
+AUTO_LEVEL = 6
+SAMPLE_SIZE = 16 * 1024  # octets lus au début, au milieu et à la fin du fichier
+SAMPLE_RATIO = 0.97      # en dessous de ce gain, le fichier est stocké tel quel
+
+def choose_compression(file_path, level=AUTO_LEVEL):
+    """Mode automatique : (COMP_ZLIB, level) si un échantillon du fichier se
+    compresse, (COMP_NONE, 0) sinon (JPEG, ZIP, MP4, données chiffrées...)."""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return (COMP_NONE, 0)
     with open(file_path, 'rb') as f:
-        data = f.read()
+        if size <= 3 * SAMPLE_SIZE:
+            sample = f.read()
+        else:
+            sample = b''
+            for offset in (0, size // 2 - SAMPLE_SIZE // 2, size - SAMPLE_SIZE):
+                f.seek(offset)
+                sample += f.read(SAMPLE_SIZE)
+    if len(zlib.compress(sample, 1)) < len(sample) * SAMPLE_RATIO:
+        return (COMP_ZLIB, level)
+    return (COMP_NONE, 0)
+
+def _compressor(method, level):
+    if method == COMP_GZIP:
+        return zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 : conteneur gzip
+    if method == COMP_ZLIB:
+        return zlib.compressobj(level)
+    if method == COMP_LZMA:
+        import lzma
+        return lzma.LZMACompressor(preset=level)
+    if method == COMP_BZ2:
+        import bz2
+        return bz2.BZ2Compressor(max(1, level))
+    raise ValueError(f"Compression inconnue: {method}")
+
+def _decompressor(method):
+    if method == COMP_GZIP:
+        return zlib.decompressobj(31)
+    if method == COMP_ZLIB:
+        return zlib.decompressobj()
+    if method == COMP_LZMA:
+        import lzma
+        return lzma.LZMADecompressor()
+    if method == COMP_BZ2:
+        import bz2
+        return bz2.BZ2Decompressor()
+    raise ValueError(f"Compression inconnue: {method}")
+
+def compress_chunks(chunks, level=9, method=COMP_GZIP):
+    """Compression incrémentale (gzip par défaut : flux lisible par gzip.decompress)."""
+    if method == COMP_NONE:
+        yield from chunks
+        return
+    comp = _compressor(method, level)
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
 
-    payload = gzip.compress(data)
+def _bounded_decompress(d, data, limit=CHUNK_SIZE):
+    """d.decompress(data) par morceaux d'au plus limit octets : un petit bloc
+    très compressé ne se décompresse pas d'un coup en mémoire."""
+    if hasattr(d, 'unconsumed_tail'):  # zlib : le reste de l'entrée est rendu
+        while True:
+            out = d.decompress(data, limit)
+            if out:
+                yield out
+            data = d.unconsumed_tail
+            if not data and len(out) < limit:
+                return
+    # lzma, bz2 : le reste de l'entrée est gardé par le décompresseur
+    out = d.decompress(data, limit)
+    while True:
+        if out:
+            yield out
+        if d.eof or d.needs_input:
+            return
+        out = d.decompress(b'', limit)
+
+def decompress_chunks(chunks, method=COMP_GZIP):
+    """Décompression incrémentale (inverse de compress_chunks ; gzip accepte aussi gzip.compress).
+
+    Les blocs produits font au plus CHUNK_SIZE octets, quel que soit le taux de compression.
+    """
+    if method == COMP_NONE:
+        yield from chunks
+        return
+    d = _decompressor(method)
+    errors = (zlib.error, OSError, EOFError)
+    if method == COMP_LZMA:
+        import lzma
+        errors += (lzma.LZMAError,)
+    try:
+        for chunk in chunks:
+            yield from _bounded_decompress(d, chunk)
+        out = d.flush() if hasattr(d, 'flush') else b''
+    except errors as e:
+        raise ValueError(f"Erreur décompression: {e}")
+    if out:
+        yield out
+    if not d.eof:
+        raise ValueError("Erreur décompression: flux compressé tronqué")
 
-    encrypted = bool(password)
-    if encrypted:
-        payload = encrypt_payload(payload, password)
+class PayloadStream:
+    """Payload (compressé puis AES si password) produit bloc par bloc.
 
-    size = len(payload)
-    checksum = hashlib.sha256(payload).digest()
-    flags = encode_flags(bits_per_channel, adaptive, encrypted)
-    header = struct.pack(HEADER_FMT, MAGIC, size, checksum, flags)
-    return header + payload
+    compression vaut 'auto' (voir choose_compression) ou (méthode, niveau).
+
+    La taille et le sha256 sont cumulés au passage : une fois le flux
+    consommé, header() retourne l'entête correspondant. La mémoire utilisée
+    est bornée par chunk_size, pas par la taille du fichier secret.
+    """
+
+    def __init__(self, file_path, password=None, chunk_size=CHUNK_SIZE, kdf=DEFAULT_KDF, salt=None,
+                 compression='auto'):
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Le fichier '{file_path}' n'existe pas.")
+        self.file_path = file_path
+        self.password = password
+        self.chunk_size = chunk_size
+        self.encrypted = bool(password)
+        self.kdf = tuple(kdf)
+        self.salt = salt
+        if compression == 'auto':
+            compression = choose_compression(file_path)
+        self.compression = tuple(compression)
+        self.extensions = {}
+        if self.encrypted:
+            self.extensions[EXT_KDF] = pack_kdf(self.kdf)
+        if self.compression[0] != COMP_GZIP:
+            self.extensions[EXT_COMPRESSION] = struct.pack(COMP_FMT, *self.compression)
+        self.size = 0
+        self.bytes_read = 0  # octets du fichier secret déjà lus (progression)
+        self._hash = hashlib.sha256()
+        self._started = False
+
+    def __iter__(self):
+        if self._started:
+            raise ValueError("Le flux de payload ne peut être lu qu'une fois")
+        self._started = True
+        method, level = self.compression
+        chunks = compress_chunks(self._count(read_chunks(self.file_path, self.chunk_size)), level, method)
+        if self.encrypted:
+            chunks = encrypt_chunks(chunks, self.password, self.kdf, self.salt)
+        if self.extensions:
+            chunks = _prepend(pack_extensions(self.extensions), chunks)
+        for chunk in chunks:
+            self.size += len(chunk)
+            self._hash.update(chunk)
+            yield chunk
+
+    def _count(self, chunks):
+        for chunk in chunks:
+            self.bytes_read += len(chunk)
+            yield chunk
+
+    def header(self, flags):
+        """Entête (magic, taille, sha256, flags) du payload déjà produit.
+        FLAG_EXTENDED est ajouté si le payload commence par des extensions."""
+        if self.extensions:
+            flags |= FLAG_EXTENDED
+        return struct.pack(HEADER_FMT, MAGIC, self.size, self._hash.digest(), flags)
+
+class ShardStream:
+    """Payload d'un fragment : bloc d'extensions (EXT_SHARD) puis les octets
+    offset..offset+length d'un payload complet déjà préparé (fichier).
+
+    Même interface que PayloadStream pour le moteur d'insertion.
+    """
+
+    def __init__(self, payload_path, offset, length, shard_field, encrypted, chunk_size=CHUNK_SIZE):
+        self.payload_path = payload_path
+        self.offset = offset
+        self.length = length
+        self.chunk_size = chunk_size
+        self.encrypted = encrypted
+        self.extensions = {EXT_SHARD: shard_field}
+        self.size = 0
+        self.bytes_read = 0
+        self._hash = hashlib.sha256()
+
+    def __iter__(self):
+        block = pack_extensions(self.extensions)
+        self.size += len(block)
+        self._hash.update(block)
+        yield block
+        with open(self.payload_path, 'rb') as f:
+            f.seek(self.offset)
+            remaining = self.length
+            while remaining:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise ValueError("Payload préparé tronqué")
+                remaining -= len(chunk)
+                self.bytes_read += len(chunk)
+                self.size += len(chunk)
+                self._hash.update(chunk)
+                yield chunk
+
+    def header(self, flags):
+        return struct.pack(HEADER_FMT, MAGIC, self.size, self._hash.digest(), flags | FLAG_EXTENDED)
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
+
+def prepare_payload_bytes(file_path, bits_per_channel=1, adaptive=False, password=None, keyed_order=False,
+                          stable_map=False, kdf=DEFAULT_KDF, compression='auto'):
+    """Lit un fichier, le compresse, le chiffre si password, et retourne header+payload."""
+    stream = PayloadStream(file_path, password, kdf=kdf, compression=compression)
+    payload = b''.join(stream)
+    flags = encode_flags(bits_per_channel, adaptive, stream.encrypted, keyed_order, stable_map)
+    return stream.header(flags) + payload
 
 def parse_header_from_bytes(bts):
     """Retourne (magic, size, checksum, flags)."""